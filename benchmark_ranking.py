@@ -0,0 +1,169 @@
+"""
+Benchmark: scoring functions and ranking stages on synthetic sectors
+
+This Script:
+    1. Generates synthetic insurance and securities sectors (src/synthetic_panel.py) with the columns
+       of the cache tables, at several times the number of symbols of today
+    2. Times every scoring function of functions_insurance / functions_securities,
+       the profit and health stages and the whole rank() of both sectors
+    3. Saves the results to a JSON file, and compares them with the previous results
+
+Run with --quick to benchmark 1x and 10x only.
+"""
+
+import os
+import sys
+import json
+import glob
+import time
+import platform
+import datetime as dt
+
+import numpy as np
+import pandas as pd
+
+from src import functions_insurance as fi
+from src import functions_securities as fs
+from src import ranking_insurance
+from src import ranking_securities
+from src import synthetic_panel
+
+# ignore warnings
+import warnings
+warnings.filterwarnings('ignore')
+
+# Customize the display of the table
+pd.set_option('chained_assignment', None)
+
+# Number of symbols, as a multiple of the size of the sectors today
+scales = [1, 10] if '--quick' in sys.argv else [1, 10, 100, 1000]
+
+# Longest history of a symbol (quarters) and share of missing values in the statements
+n_quarters = 64
+missing_rate = 0.02
+
+# Best of `repeats` runs; one run above `max_rows_repeated` rows
+repeats = 3
+max_rows_repeated = 200000
+
+# Results: one JSON file per run
+result_dir = r"F:\Tùng\Tung\Python\BSC_DataRankingStocks\cache\benchmark"
+
+
+def timed(func, n_rows: int, **kwargs) -> float:
+    """ Best time of func(**kwargs); the data frames are copied before every run, as the functions add columns to them """
+    best = np.inf
+    for _ in range(repeats if n_rows <= max_rows_repeated else 1):
+        inputs = {k: v.copy() if isinstance(v, pd.DataFrame) else v for k, v in kwargs.items()}
+        start = time.perf_counter()
+        func(**inputs)
+        best = min(best, time.perf_counter() - start)
+
+    return best
+
+
+def benchmark_insurance(n_symbols: int) -> list:
+    inputs = synthetic_panel.insurance_inputs(n_symbols, n_quarters, missing_rate)
+    n_rows = len(inputs['df_is'])
+
+    df_bs = inputs['df_bs'].merge(inputs['ceded_reserves'], how="inner", on=['Symbol', 'Year', 'Quarter'])
+    df_is = inputs['df_is'].merge(inputs['net_revenue'], how="inner", on=['Symbol', 'Year', 'Quarter'])
+    df_is_ratios = ranking_insurance.income_ratios(df_is=inputs['df_is'], net_revenue=inputs['net_revenue'])
+    df_health = ranking_insurance.health(df_bs=df_bs, df_is=df_is_ratios)
+
+    cases = {
+        'functions_insurance.combined_ratio_ttm': (fi.combined_ratio_ttm, {'panel_data': df_is}),
+        'functions_insurance.npw_to_equity_score': (fi.npw_to_equity_score, {'panel_data': df_health}),
+        'functions_insurance.net_leverage_score': (fi.net_leverage_score, {'panel_data': df_health}),
+        'functions_insurance.gross_reserves_to_equity_score': (fi.gross_reserves_to_equity_score, {'panel_data': df_health}),
+        'functions_insurance.npw_gpw_score': (fi.npw_gpw_score, {'panel_data': df_health}),
+        'ranking_insurance.profit': (ranking_insurance.profit, {'df_bs': df_bs, 'df_is': df_is_ratios}),
+        'ranking_insurance.health': (ranking_insurance.health, {'df_bs': df_bs, 'df_is': df_is_ratios}),
+        'ranking_insurance.rank': (ranking_insurance.rank, inputs),
+    }
+
+    return [
+        {'sector': 'insurance', 'name': name, 'symbols': n_symbols, 'rows': n_rows, 'seconds': timed(func, n_rows, **kwargs)}
+        for name, (func, kwargs) in cases.items()
+    ]
+
+
+def benchmark_securities(n_symbols: int) -> list:
+    inputs = synthetic_panel.securities_inputs(n_symbols, n_quarters, missing_rate)
+    n_rows = len(inputs['df_is'])
+
+    df_is = inputs['df_is'].merge(inputs['provision_for_losses'], how="inner", on=['Symbol', 'Year', 'Quarter'])
+    df_is = df_is.sort_values(by=['Symbol', 'Year', 'Quarter'])
+    df_bs = inputs['df_bs'].sort_values(by=['Symbol', 'Year', 'Quarter'])
+    # Every input column of the scoring functions (lte, debt_to_equity, shares of sales, FVTPL, ...)
+    df_health = ranking_securities.health(df_bs=df_bs, df_is=df_is)
+
+    cases = {
+        'functions_securities.score_lte': (fs.score_lte, {'panel_data': df_health}),
+        'functions_securities.score_dte': (fs.score_dte, {'panel_data': df_health}),
+        'functions_securities.diversified_sales_score': (fs.diversified_sales_score, {
+            'panel_data': df_health, 'share_columns': ranking_securities.SHARE_COLUMNS, 'percent_sales': 0.8
+        }),
+        'functions_securities.coef_variation_fvtpl': (fs.coef_variation_fvtpl, {'panel_data': df_health, 'window': 12}),
+        'functions_securities.score_coef': (fs.score_coef, {'panel_data': df_health}),
+        'ranking_securities.profit': (ranking_securities.profit, {'df_bs': df_bs, 'df_is': df_is}),
+        'ranking_securities.health': (ranking_securities.health, {'df_bs': df_bs, 'df_is': df_is}),
+        'ranking_securities.rank': (ranking_securities.rank, inputs),
+    }
+
+    return [
+        {'sector': 'securities', 'name': name, 'symbols': n_symbols, 'rows': n_rows, 'seconds': timed(func, n_rows, **kwargs)}
+        for name, (func, kwargs) in cases.items()
+    ]
+
+
+def previous_results(result_dir: str) -> pd.DataFrame:
+    """ Results of the last benchmark saved in result_dir, empty if there is none """
+    files = sorted(glob.glob(os.path.join(result_dir, "benchmark_*.json")))
+    if not files:
+        return pd.DataFrame()
+
+    with open(files[-1], mode="r", encoding="utf-8") as fp:
+        return pd.DataFrame(json.load(fp)['results'])
+
+
+if __name__ == '__main__':
+    previous = previous_results(result_dir)
+
+    results = []
+    for scale in scales:
+        for sector, benchmark in [('insurance', benchmark_insurance), ('securities', benchmark_securities)]:
+            n_symbols = synthetic_panel.BASE_SYMBOLS[sector]*scale
+            print(f"Benchmark: {sector} x{scale} ({n_symbols} symbols)")
+            for result in benchmark(n_symbols):
+                result['scale'] = scale
+                results.append(result)
+
+    ## Save the results
+    now = dt.datetime.now()
+    os.makedirs(result_dir, exist_ok=True)
+    path = os.path.join(result_dir, f"benchmark_{now:%Y%m%d_%H%M%S}.json")
+    with open(path, mode="w", encoding="utf-8") as fp:
+        json.dump({
+            'created': now.isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'machine': platform.platform(),
+            'n_quarters': n_quarters,
+            'missing_rate': missing_rate,
+            'results': results,
+        }, fp, indent=4)
+    print(f"Saved: {path}")
+
+    ## Seconds per function and scale
+    report = pd.DataFrame(results)
+    table = report.pivot_table(index=['sector', 'name'], columns='scale', values='seconds', sort=False)
+    print(table.round(4).to_string())
+
+    # Time of this run / time of the previous one, above 1 is slower
+    if not previous.empty:
+        merged = report.merge(previous, how='inner', on=['sector', 'name', 'scale'], suffixes=('', '_previous'))
+        merged['ratio'] = merged['seconds']/merged['seconds_previous']
+        print("Compared with the previous run:")
+        print(merged.pivot_table(index=['sector', 'name'], columns='scale', values='ratio', sort=False).round(2).to_string())
@@ -1,10 +1,11 @@
 import pandas as pd
-import numpy as np
-import datetime as dt
-import pymssql
-import pyodbc
+import os
 import tomli
-from pprint import pprint as pp
+import sys
+from src import cache_io
+from src import instrument
+from src import profiling
+from src import sql_download
 
 # Customize the display of the table
 pd.set_option('chained_assignment',None)
@@ -40,40 +41,142 @@ list_banks = query_sql["list_banks"]["list_banks"]
 
 query = [is_insurance, bs_insurance, is_securities, bs_securities]
 
-save_csv = [
-    r"F:\Tùng\Tung\Python\BSC_DataRankingStocks\cache\is_insurance.csv",
-    r"F:\Tùng\Tung\Python\BSC_DataRankingStocks\cache\bs_insurance.csv",
-    r"F:\Tùng\Tung\Python\BSC_DataRankingStocks\cache\is_securities.csv",
-    r"F:\Tùng\Tung\Python\BSC_DataRankingStocks\cache\bs_securities.csv",
+# Cache folder and the name of each table in the cache
+cache_dir = r"F:\Tùng\Tung\Python\BSC_DataRankingStocks\cache"
+save_name = [
+    "is_insurance",
+    "bs_insurance",
+    "is_securities",
+    "bs_securities",
 ]
 
-# Connect to SQL Server
-conn = pymssql.connect(
-    server=sv, 
-    user=user, 
-    password=pwd, 
-    database=db
-)
+# Format of the cache: feather (default) or parquet. Run with --csv to also export CSV files
+cache_format = "feather"
+export_csv = '--csv' in sys.argv
 
-# Download data from financial statement: Insurance & Securities
-print("Start to download data from financial statement: Insurance & Securities")
-for i in range(0,4):
-    data = pd.read_sql(
-        sql=query[i], 
-        con=conn
+# Incremental mode (default): only download quarters from the high-water mark of each table on
+# and merge them into the cache. Run with --full to download every table again
+incremental = '--full' not in sys.argv
+path_watermarks = os.path.join(cache_dir, "watermarks.json")
+# The statement queries have no last-modified column, so a quarter is only downloaded again while it is
+# within lookback_quarters of the mark: a restatement of an older quarter is missed until the next --full run.
+# Set update_column to the last-modified column if the queries return one, to also download every modified row
+lookback_quarters = 4
+update_column = None
+watermarks = sql_download.load_watermarks(path_watermarks)
+
+# Number of queries running at the same time, each on its own connection
+pool_size = 5
+
+# Full downloads are read in chunks of this many rows and written straight to the cache,
+# so peak memory does not grow with the size of the tables. Set to None to read tables at once
+chunksize = 100000
+
+# Run report: time, CPU time, rows and peak memory (tracemalloc) of every stage, saved as JSON.
+# Run with --summary to print it as a table as well
+run_report_dir = os.path.join(cache_dir, "reports")
+print_summary = '--summary' in sys.argv
+
+# Profiling: run with --profile to save a profile of the run to profile_dir, as pstats (pstats.Stats, snakeviz)
+# and as collapsed stacks (flamegraph.pl, speedscope). Set profile_stages to profile some stages only,
+# e.g. ['download']. tracemalloc is off while profiling, as it slows every allocation down
+profile_dir = os.path.join(cache_dir, "profiles")
+profile_engine = "cprofile"  # or "pyinstrument", if it is installed
+profile_stages = None
+profiler = profiling.Profiler("s1_download_data", engine=profile_engine, stages=profile_stages) if '--profile' in sys.argv else None
+trace_memory = profiler is None
+run_report = instrument.RunReport("s1_download_data", trace_memory=trace_memory, profiler=profiler).start()
+
+# Connect to SQL Server; the driver is only imported by the download
+def connect():
+    import pymssql
+    return pymssql.connect(
+        server=sv, 
+        user=user, 
+        password=pwd, 
+        database=db
     )
-    data.to_csv(save_csv[i])
-    print(f"{i+1}: Downloaded file to {save_csv[i]}")
-    
 
-# Download a list of banks
-print("Start to download a list of banks")
-data = pd.read_sql(list_banks, con=conn)
-data[['Symbol', 'CompanyType', 'ICBIndustry']].to_csv(r"F:\Tùng\Tung\Python\BSC_DataRankingStocks\cache\list_banks.csv")
+# Build the queries: full download or only the new quarters of the cached tables
+print("Start to download data from financial statement: Insurance & Securities, and a list of banks")
+jobs = []
+cached = {}
+for i in range(0,4):
+    with run_report.stage(f"read cache {save_name[i]}") as record:
+        try:
+            cached[save_name[i]] = cache_io.read_table(save_name[i], cache_dir, fmt=cache_format) if incremental else None
+        except FileNotFoundError:
+            cached[save_name[i]] = None
+        record['rows_out'] = instrument.count_rows(cached[save_name[i]])
+
+    if cached[save_name[i]] is not None and save_name[i] in watermarks:
+        sql, params = sql_download.incremental_query(
+            query=query[i],
+            mark=watermarks[save_name[i]],
+            lookback=lookback_quarters,
+            update_column=update_column
+        )
+    else:
+        cached[save_name[i]] = None
+        sql, params = query[i], None
+    jobs.append({
+        "name": save_name[i], 
+        "sql": sql, 
+        "params": params, 
+        "chunksize": chunksize if cached[save_name[i]] is None else None
+    })
+
+jobs.append({"name": "list_banks", "sql": list_banks, "params": None})
+
+
+# Save every table to the cache as soon as its query has finished (in the threads of run_queries)
+def save_result(name, data):
+    with run_report.stage(f"save {name}", rows_in=instrument.count_rows(data)) as record:
+        if not isinstance(data, pd.DataFrame):
+            # Streamed download: write chunk by chunk, then read back only the columns of the high-water mark
+            path, _ = cache_io.write_table_chunks(data, name, cache_dir, fmt=cache_format)
+            mark_columns = ['Year', 'Quarter'] + ([update_column] if update_column is not None else [])
+            data = cache_io.read_table(name, cache_dir, fmt=cache_format, columns=mark_columns)
+            watermarks[name] = sql_download.high_water_mark(data, update_column=update_column)
+            if export_csv:
+                cache_io.write_table(cache_io.read_table(name, cache_dir, fmt=cache_format), name, cache_dir, fmt='csv')
+            print(f"Downloaded file to {path}")
+            record['rows_out'] = len(data)
+            return
+
+        if name == "list_banks":
+            data = data[['Symbol', 'CompanyType', 'ICBIndustry']]
+        else:
+            if cached[name] is not None:
+                data = sql_download.merge_delta(cached[name], data)
+            watermarks[name] = sql_download.high_water_mark(data, update_column=update_column)
+
+        path = cache_io.write_table(data, name, cache_dir, fmt=cache_format)
+        if export_csv:
+            cache_io.write_table(data, name, cache_dir, fmt='csv')
+        print(f"Downloaded file to {path}")
+        record['rows_out'] = len(data)
+
+
+# Download all tables concurrently
+with run_report.stage("download", rows_in=len(jobs)):
+    report = sql_download.run_queries(
+        jobs=jobs,
+        connect=connect,
+        pool_size=pool_size,
+        on_result=save_result
+    )
+print(report.to_string(index=False))
+print(f"Peak memory (RSS): {sql_download.peak_rss_mb()} MB")
 
-print("Downloaded a list of banks")
+# Record the high-water marks once every table is in the cache
+sql_download.save_watermarks(watermarks, path_watermarks)
+print("Finished.")
 
-# Commit and close connection to SQL database
-conn.commit()
-conn.close()
-print("Finished.")
\ No newline at end of file
+# Time, CPU time, rows and peak memory per stage
+run_report.stop()
+print(f"Run report: {run_report.save(run_report_dir)}")
+if print_summary:
+    print(run_report.summary().to_string())
+if profiler is not None:
+    print(f"Profile: {profiler.save(profile_dir)}")
@@ -13,11 +13,16 @@
 ## 1. Import 
 ### 1.1 Library
 import pandas as pd
-import numpy as np
 import datetime as dt
-import pyodbc
-import pymssql
 import sys
+from src import cache_io
+from src import db_connection
+from src import dirty_periods
+from src import instrument
+from src import profiling
+from src import db_reader
+from src import pipeline
+from src import ranking_bank
 
 # ignore warnings
 import warnings
@@ -29,127 +34,96 @@ pd.set_option('chained_assignment', None)
 # Get today
 now = dt.datetime.today().strftime("%Y%m%d")
 
-### 1.2 Get the result from `ptsp_stock_fundamental_score`
-# Get raw final result
-conn = pyodbc.connect(
-    r'Driver={Microsoft Access Driver (*.mdb, *.accdb)};DBQ=V:\iBroker\stock_database.accdb;'
-)
-df_raw = pd.read_sql('select * from ptsp_stock_fundamental_score', conn)
+# Number of rows per insert batch (one commit per batch)
+batch_size = 1000
+
+# Only the periods whose inputs changed since the last run are scored again, see src/dirty_periods.py.
+# Run with --full to score every period
+incremental_scoring = '--full' not in sys.argv
+period_hash_path = r"F:\Tùng\Tung\Python\BSC_DataRankingStocks\cache\periods_bank.json"
+
+# Access database: one connection for the whole run.
+# Set STOCK_DATABASE_PATH (or STOCK_DATABASE_DSN) to use another database
+db = db_connection.Database()
+
+# Run report: time, CPU time, rows and peak memory (tracemalloc) of every stage, saved as JSON.
+# Run with --summary to print it as a table as well
+run_report_dir = r"F:\Tùng\Tung\Python\BSC_DataRankingStocks\cache\reports"
+print_summary = '--summary' in sys.argv
+
+# Profiling: run with --profile to save a profile of the run to profile_dir, as pstats (pstats.Stats, snakeviz)
+# and as collapsed stacks (flamegraph.pl, speedscope). Set profile_stages to profile some stages only,
+# e.g. ['rank']. tracemalloc is off while profiling, as it slows every allocation down
+profile_dir = r"F:\Tùng\Tung\Python\BSC_DataRankingStocks\cache\profiles"
+profile_engine = "cprofile"  # or "pyinstrument", if it is installed
+profile_stages = None
+profiler = profiling.Profiler("s2_ranking_bank", engine=profile_engine, stages=profile_stages) if '--profile' in sys.argv else None
+trace_memory = profiler is None
+run_report = instrument.RunReport("s2_ranking_bank", trace_memory=trace_memory, profiler=profiler).start()
 
-conn.close()
+### 1.2 Get the result from `ptsp_stock_fundamental_score`
+# Get the list of banks
+with run_report.stage("read list_banks") as record:
+    df = cache_io.read_table("list_banks", r"F:\Tùng\Tung\Python\BSC_DataRankingStocks\cache")
+    list_banks = df['Symbol']
+    record['rows_out'] = len(df)
+
+# Get raw final result: only the banks and the selected columns are read from the database
+with run_report.stage("read ptsp_stock_fundamental_score") as record, db.timed("ptsp_stock_fundamental_score", "read"):
+    df_raw = db_reader.read_table(
+        conn=db.conn,
+        table="ptsp_stock_fundamental_score",
+        columns=ranking_bank.RAW_COLUMNS,
+        symbols=list_banks
+    )
+    record['rows_out'] = len(df_raw)
+
+
+# Periods with new or changed scores since the last run
+with run_report.stage("dirty periods", rows_in=len(df_raw)):
+    hashes = dirty_periods.period_hashes([df_raw.drop(columns='Update')])
+    periods = None
+    if incremental_scoring:
+        periods = dirty_periods.dirty_periods(
+            hashes, dirty_periods.load_hashes(period_hash_path), lookback=ranking_bank.LOOKBACK
+        )
+        print(f"Periods to score: {len(periods)}")
 
 
 ### 1.3 Process data following new model
-df = pd.read_csv(r"F:\Tùng\Tung\Python\BSC_DataRankingStocks\cache\list_banks.csv")
-list_banks = df['Symbol']
-df_bank = df_raw.loc[df_raw['Symbol'].isin(list_banks)]
-
-# Get data based on selected columns
-df_bank = df_bank[['Symbol', 'Year', 'Quarter', 'score_ROE_sector',
-       'score_ROA_sector', 'score_NIM_sector', 'score_profit', 'rank_profit', 
-       'z_LoanProvisionRatio', 'z_Deposit2Loan', 'z_NPL_ratio_inv',
-       'z_NPL_coverage', 'score_health', 'rank_health',
-       'score_EPS_above_average', 'score_EPS_growth', 'score_EPS_above_sector',
-       'score_EPS_above_group', 'score_growth', 'rank_growth', 'score_PE_5Y',
-       'score_PB_5Y', 'score_PE_sector', 'score_PB_sector', 'score_valuation',
-       'rank_valuation', 'score_final', 'rank_final', 'Update']]
-
-# Change type of data
-df_bank[[
-    'score_ROE_sector', 'score_ROA_sector', 'score_NIM_sector', 'score_profit',
-    'z_LoanProvisionRatio', 'z_Deposit2Loan', 'z_NPL_ratio_inv',
-    'z_NPL_coverage', 'score_health', 'score_EPS_above_average',
-    'score_EPS_growth', 'score_EPS_above_sector', 'score_EPS_above_group',
-    'score_growth', 'score_PE_5Y', 'score_PB_5Y', 'score_PE_sector',
-    'score_PB_sector', 'score_valuation', 'score_final'
-]] = df_bank[[
-    'score_ROE_sector', 'score_ROA_sector', 'score_NIM_sector', 'score_profit',
-    'z_LoanProvisionRatio', 'z_Deposit2Loan', 'z_NPL_ratio_inv',
-    'z_NPL_coverage', 'score_health', 'score_EPS_above_average',
-    'score_EPS_growth', 'score_EPS_above_sector', 'score_EPS_above_group',
-    'score_growth', 'score_PE_5Y', 'score_PB_5Y', 'score_PE_sector',
-    'score_PB_sector', 'score_valuation', 'score_final'
-]].astype(float)
-
-# Calculate score_profit
-df_bank['score_profit'] = round((df_bank['score_ROE_sector'] + df_bank['score_ROA_sector'] + df_bank['score_NIM_sector'])*4/3,2)
-
-# Ranking based on score_profit
-for _, items in df_bank.iterrows():
-    if items['score_profit'] < 1:
-        items['rank_profit'] = 'D'
-    elif items['score_profit'] < 2:
-        items['rank_profit'] = 'C'
-    elif items['score_profit'] < 3:
-        items['rank_profit'] = 'B'
-    else:
-        items['rank_profit'] = 'A'
-        
-# Calculate score_final
-df_bank['score_final'] = round(np.mean(df_bank[['score_profit', 'score_health', 'score_growth', 'score_valuation']], axis=1),2)
-
-# Ranking based on score_final
-for _, items in df_bank.iterrows():
-    if items['score_final'] < 1:
-        items['rank_final'] = 'D'
-    elif items['score_final'] < 2:
-        items['rank_final'] = 'C'
-    elif items['score_final'] < 3:
-        items['rank_final'] = 'B'
-    else:
-        items['rank_final'] = 'A'
-        
-# Change type of data before save to database
-df_bank = df_bank.astype(str)
-
-# Assign variable for selected columns
-select_column = df_bank.columns[:-1].to_list()
+results = []
+if periods != []:
+    with run_report.stage("rank", rows_in=len(df_raw)) as record:
+        results = ranking_bank.rank(df_raw=df_raw, periods=periods)
+        record['rows_out'] = instrument.count_rows(results)
 
 
 ## 2. Save data to DB Access
-### 2.1 Get data fields in new table
-""" - `ptsp_stock_fundamental_score_financial` """
-conn = pyodbc.connect(
-    r'Driver={Microsoft Access Driver (*.mdb, *.accdb)};DBQ=V:\iBroker\stock_database.accdb;'
-)
-df_db = pd.read_sql(
-    sql="SELECT * FROM ptsp_stock_fundamental_score_financial", 
-    con=conn
-)
-conn.commit()
-
-# Rename columns to match with format in database
-df_db.rename(
-    columns={
-        "score_roe_sector": "score_ROE_sector",
-        "score_roa_sector": "score_ROA_sector",
-        "score_nim_sector": "score_NIM_sector"
-    },
-    inplace=True
-)
-
-# To insert new values by dropping duplicate values
-df_saving = pd.concat(
-    [
-        df_db[select_column],
-        df_bank[select_column].astype(str)
-    ]
-).drop_duplicates(keep=False)
-
-# Implement update day
-df_saving['Update'] = now
-
-col_df_db = '[Symbol],[Year],[Quarter],[score_roe_sector],[score_roa_sector],[score_nim_sector],[score_profit],[rank_profit],[z_LoanProvisionRatio],[z_Deposit2Loan],[z_NPL_ratio_inv],[z_NPL_coverage],[score_health],[rank_health],[score_EPS_above_average],[score_EPS_growth],[score_EPS_above_sector],[score_EPS_above_group],[score_growth],[rank_growth],[score_PE_5Y],[score_PB_5Y],[score_PE_sector],[score_PB_sector],[score_valuation],[rank_valuation],[score_final],[rank_final],[update]'
-
-
-### 2.2 Save data to new table
-conn = pyodbc.connect(
-    r'Driver={Microsoft Access Driver (*.mdb, *.accdb)};DBQ=V:\iBroker\stock_database.accdb;'
-)
-cursor = conn.cursor()
-for _, row in df_bank.iterrows():
-    sql = "INSERT INTO ptsp_stock_fundamental_score_financial ("+col_df_db+") VALUES "+ str(tuple(row))
-    cursor.execute(sql)
-    conn.commit()
+# Only the new and changed rows of `ptsp_stock_fundamental_score_financial` are written
+with db:
+    for result in results:
+        with run_report.stage(f"save {result['table']}", rows_in=len(result['data'])) as record:
+            counts = pipeline.save_result(
+                conn=db.conn, 
+                now=now, 
+                batch_size=batch_size, 
+                timer=db.timer(result['table']), 
+                **result
+            )
+            record['rows_out'] = counts['inserted'] + counts['updated']
+        print(f"{result['table']}: {counts}")
     
-print("Successfully saved data")
\ No newline at end of file
+dirty_periods.save_hashes(hashes, period_hash_path)
+print("Successfully saved data")
+
+# Seconds spent connecting, reading and writing per table
+print(db.report())
+
+# Time, CPU time, rows and peak memory per stage
+run_report.meta['database'] = db.timings
+run_report.stop()
+print(f"Run report: {run_report.save(run_report_dir)}")
+if print_summary:
+    print(run_report.summary().to_string())
+if profiler is not None:
+    print(f"Profile: {profiler.save(profile_dir)}")
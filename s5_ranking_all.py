@@ -0,0 +1,262 @@
+"""
+Ranking: Bank, Insurance and Securities sectors in one run
+
+This Script:
+    1. Loads the shared inputs once:
+        - The statements from the cache (s1_download_data.py)
+        - The external data from VND (one sector after another, as both use the same local cache)
+        - `ptsp_stock_fundamental_score` of the three sectors, in one query
+    2. Ranks the three sectors at the same time, one process each
+        (same calculation as s2_ranking_bank.py, s3_ranking_insurance.py, s4_ranking_securities.py)
+    3. Writes the results through one connection, as soon as each sector has finished
+"""
+
+import pandas as pd
+import datetime as dt
+import sys
+from src import vnd_cache
+from src import vnd_fetch
+from src import cache_io
+from src import db_connection
+from src import dirty_periods
+from src import instrument
+from src import panel
+from src import profiling
+from src import db_reader
+from src import pipeline
+from src import stage_cache
+from src import ranking_bank
+from src import ranking_insurance
+from src import ranking_securities
+
+# get_vnd_data is imported only if a statement is not in the VND cache (see vnd_fetch.vnd_function)
+
+# ignore warnings
+import warnings
+warnings.filterwarnings('ignore')
+
+# Customize the display of the table
+pd.set_option('chained_assignment', None)
+
+# Get today
+now = dt.datetime.today().strftime("%Y%m%d")
+
+# Number of rows per insert batch (one commit per batch)
+batch_size = 1000
+
+# Maximum number of concurrent requests to VND
+max_workers = 8
+
+# Local cache of VND statements: re-used for vnd_ttl_hours, run with --refresh to re-download everything
+vnd_cache_dir = r"F:\Tùng\Tung\Python\BSC_DataRankingStocks\cache\vnd"
+vnd_ttl_hours = 24
+refresh_vnd_cache = '--refresh' in sys.argv
+
+# Rolling windows (TTM, 8Q, 12Q) kept between runs, so only new quarters are appended; a symbol whose
+# past quarters were restated is appended again. Run with --full to rebuild them from the whole history
+rolling_state_dir = r"F:\Tùng\Tung\Python\BSC_DataRankingStocks\cache\rolling"
+rebuild_rolling_state = '--full' in sys.argv
+
+# Only the periods whose inputs changed since the last run are scored again, see src/dirty_periods.py.
+# Run with --full to score every period
+incremental_scoring = '--full' not in sys.argv
+period_hash_path = r"F:\Tùng\Tung\Python\BSC_DataRankingStocks\cache\periods_{}.json"
+
+# Outputs of the ranking stages, re-used while their inputs are unchanged (e.g. when a run is repeated
+# after its write step failed). The least recently used files are deleted above stage_cache_max_mb
+stage_cache_dir = r"F:\Tùng\Tung\Python\BSC_DataRankingStocks\cache\stages"
+stage_cache_max_mb = 512
+
+# Cache of the statements
+cache_dir = r"F:\Tùng\Tung\Python\BSC_DataRankingStocks\cache"
+
+# Statements are kept as compact panels (src/panel.py): Symbol as a category, small-int Year and Quarter,
+# values as value_dtype. "float32" halves the memory of the values, the scores may then differ in the last digits
+value_dtype = "float64"
+
+# Access database. Set STOCK_DATABASE_PATH (or STOCK_DATABASE_DSN) to use another database
+dsn = db_connection.resolve_dsn()
+
+# Run report: time, CPU time, rows and peak memory (tracemalloc) of every stage, saved as JSON.
+# Run with --summary to print it as a table as well. The sectors run in other processes: their stage is
+# the time until the last one has finished, with the saves of the finished sectors inside it
+run_report_dir = r"F:\Tùng\Tung\Python\BSC_DataRankingStocks\cache\reports"
+print_summary = '--summary' in sys.argv
+
+# Profiling: run with --profile to save a profile of the run to profile_dir, as pstats (pstats.Stats, snakeviz)
+# and as collapsed stacks (flamegraph.pl, speedscope). Set profile_stages to profile some stages only,
+# e.g. ['read cache']. Only this process is profiled, not the processes ranking the sectors.
+# tracemalloc is off while profiling, as it slows every allocation down
+profile_dir = r"F:\Tùng\Tung\Python\BSC_DataRankingStocks\cache\profiles"
+profile_engine = "cprofile"  # or "pyinstrument", if it is installed
+profile_stages = None
+
+
+# The sectors run in child processes, which import this file again on Windows
+if __name__ == '__main__':
+    profiler = profiling.Profiler("s5_ranking_all", engine=profile_engine, stages=profile_stages) if '--profile' in sys.argv else None
+    trace_memory = profiler is None
+    run_report = instrument.RunReport("s5_ranking_all", trace_memory=trace_memory, profiler=profiler).start()
+
+    ## 1. Shared inputs
+    ### 1.1 Statements from the cache
+    with run_report.stage("read cache") as record:
+        list_banks = cache_io.read_table("list_banks", cache_dir)['Symbol'].unique()
+        df_bs_insurance = panel.compact(cache_io.read_table("bs_insurance", cache_dir), value_dtype)
+        df_is_insurance = panel.compact(cache_io.read_table("is_insurance", cache_dir), value_dtype)
+        df_is_securities = panel.compact(cache_io.read_table("is_securities", cache_dir), value_dtype)
+        df_bs_securities = panel.compact(cache_io.read_table("bs_securities", cache_dir), value_dtype)
+        record['rows_out'] = len(df_bs_insurance) + len(df_is_insurance) + len(df_is_securities) + len(df_bs_securities)
+
+    with run_report.stage("preprocess", rows_in=record['rows_out']) as record:
+        df_bs_insurance, df_is_insurance = ranking_insurance.preprocess(df_bs=df_bs_insurance, df_is=df_is_insurance)
+        df_is_securities, df_bs_securities = ranking_securities.preprocess(df_is=df_is_securities, df_bs=df_bs_securities)
+        record['rows_out'] = len(df_bs_insurance) + len(df_is_insurance) + len(df_is_securities) + len(df_bs_securities)
+    list_insurance = df_bs_insurance['Symbol'].unique()
+    list_securities = df_is_securities['Symbol'].unique()
+
+    ### 1.2 External data from VND
+    with run_report.stage("vnd fetch", rows_in=len(list_insurance) + len(list_securities)) as record:
+        external_insurance = vnd_cache.cached_fetch_items(
+            symbols=list_insurance,
+            items=[
+                (vnd_fetch.vnd_function('get_balance_sheet'), 411920, 'CededReserves'),
+                (vnd_fetch.vnd_function('get_income_statement'), 21001, 'Revenues')
+            ],
+            cache_dir=vnd_cache_dir,
+            ttl_hours=vnd_ttl_hours,
+            refresh=refresh_vnd_cache,
+            max_workers=max_workers
+        )
+        external_securities = vnd_cache.cached_fetch_items(
+            symbols=list_securities,
+            items=[(vnd_fetch.vnd_function('get_income_statement'), 700053, 'ProvisionForLosses')],
+            cache_dir=vnd_cache_dir,
+            ttl_hours=vnd_ttl_hours,
+            refresh=refresh_vnd_cache,
+            max_workers=max_workers
+        )
+        external_insurance = {k: panel.compact(v, value_dtype) for k, v in external_insurance.items()}
+        external_securities = {k: panel.compact(v, value_dtype) for k, v in external_securities.items()}
+        record['rows_out'] = instrument.count_rows(external_insurance) + instrument.count_rows(external_securities)
+    print("Finish: Successfully get the data")
+
+    ### 1.3 `ptsp_stock_fundamental_score` of the three sectors
+    raw_column = list(dict.fromkeys(
+        ranking_bank.RAW_COLUMNS + ranking_insurance.RAW_COLUMNS + ranking_securities.RAW_COLUMNS
+    ))
+    # One connection for every read and write of the run
+    db = db_connection.Database(dsn)
+    with run_report.stage("read ptsp_stock_fundamental_score") as record, db.timed("ptsp_stock_fundamental_score", "read"):
+        df_raw = db_reader.read_table(
+            conn=db.conn,
+            table="ptsp_stock_fundamental_score",
+            columns=raw_column,
+            symbols=list(list_banks) + list(list_insurance) + list(list_securities)
+        )
+        record['rows_out'] = len(df_raw)
+
+
+    ## 2. Ranking, one process per sector
+    tasks = {
+        "bank": (ranking_bank.rank, {
+            "df_raw": df_raw.loc[df_raw['Symbol'].isin(list_banks), ranking_bank.RAW_COLUMNS],
+        }),
+        "insurance": (ranking_insurance.rank, {
+            "df_bs": df_bs_insurance,
+            "df_is": df_is_insurance,
+            "ceded_reserves": external_insurance['CededReserves'],
+            "net_revenue": external_insurance['Revenues'],
+            "df_raw": df_raw.loc[df_raw['Symbol'].isin(list_insurance), ranking_insurance.RAW_COLUMNS],
+            "state_dir": rolling_state_dir,
+            "rebuild_state": rebuild_rolling_state,
+            "cache": stage_cache.StageCache(stage_cache_dir, max_mb=stage_cache_max_mb),
+        }),
+        "securities": (ranking_securities.rank, {
+            "df_is": df_is_securities,
+            "df_bs": df_bs_securities,
+            "provision_for_losses": external_securities['ProvisionForLosses'],
+            "df_raw": df_raw.loc[df_raw['Symbol'].isin(list_securities), ranking_securities.RAW_COLUMNS],
+            "state_dir": rolling_state_dir,
+            "rebuild_state": rebuild_rolling_state,
+            "cache": stage_cache.StageCache(stage_cache_dir, max_mb=stage_cache_max_mb),
+        }),
+    }
+    lookback = {
+        "bank": ranking_bank.LOOKBACK,
+        "insurance": ranking_insurance.LOOKBACK,
+        "securities": ranking_securities.LOOKBACK,
+    }
+
+    # Periods with new or changed inputs since the last run, the sectors without any are not run
+    with run_report.stage("dirty periods"):
+        hashes = {}
+        for name, (func, kwargs) in list(tasks.items()):
+            hashes[name] = dirty_periods.period_hashes([
+                data.drop(columns='Update') if 'Update' in data.columns else data
+                for data in kwargs.values() if isinstance(data, pd.DataFrame)
+            ])
+            if not incremental_scoring:
+                continue
+
+            periods = dirty_periods.dirty_periods(
+                hashes[name],
+                dirty_periods.load_hashes(period_hash_path.format(name)),
+                lookback=lookback[name]
+            )
+            print(f"Periods to score, {name}: {len(periods)}")
+            if periods:
+                kwargs['periods'] = periods
+            else:
+                del tasks[name]
+
+
+    ## 3. Save to DB Access: one writer for every sector
+    # The hashes of a sector are saved only once all its tables are written: a sector whose write
+    # failed stays dirty, so its periods are scored and written again by the next run
+    failed = {}
+
+    def save_results(name, results):
+        print(f"Saving: {name}")
+        try:
+            for result in results:
+                with run_report.stage(f"save {result['table']}", rows_in=len(result['data'])) as record:
+                    counts = pipeline.save_result(
+                        conn=db.conn,
+                        now=now,
+                        batch_size=batch_size,
+                        timer=db.timer(result['table']),
+                        **result
+                    )
+                    record['rows_out'] = counts['inserted'] + counts['updated']
+                print(f"{result['table']}: {counts}")
+        except Exception as error:
+            # The other sectors are still written
+            failed[name] = error
+            print(f"Failed to save {name}: {error!r}")
+            return
+        dirty_periods.save_hashes(hashes[name], period_hash_path.format(name))
+
+    if tasks:
+        with db, run_report.stage("rank", rows_in=len(tasks)):
+            report = pipeline.run_sectors(tasks, on_result=save_results)
+        print(report.to_string(index=False))
+    else:
+        db.close()
+        print("No new data since the last run")
+
+    # Seconds spent connecting, reading and writing per table
+    print(db.report())
+    print("Finish!")
+
+    # Time, CPU time, rows and peak memory per stage
+    run_report.meta['database'] = db.timings
+    run_report.stop()
+    print(f"Run report: {run_report.save(run_report_dir)}")
+    if print_summary:
+        print(run_report.summary().to_string())
+    if profiler is not None:
+        print(f"Profile: {profiler.save(profile_dir)}")
+
+    if failed:
+        raise RuntimeError(f"Could not save {', '.join(failed)}, their periods are scored again by the next run") from next(iter(failed.values()))
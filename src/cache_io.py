@@ -0,0 +1,206 @@
+import os
+
+import pandas as pd
+
+
+# File extension of every supported cache format, in the order they are looked up
+FORMATS = {
+    'feather': '.feather',
+    'parquet': '.parquet',
+    'csv': '.csv',
+}
+
+
+def to_compact_dtypes(data: pd.DataFrame, value_dtype='float64') -> pd.DataFrame:
+    """ Give a statement table explicit, compact dtypes
+    ================================================================
+    - Symbol: category
+    - Year: int16, Quarter: int8
+    - Values (floats, integers and Decimal objects from SQL Server): value_dtype
+    - Other text columns (e.g. CompanyType): category
+
+    Rows without a Symbol, Year or Quarter cannot be keyed: they are dropped, and their number printed.
+
+    Parameters:
+        data: pd.DataFrame
+        value_dtype: str
+            Defaults to 'float64'
+    """
+    keys = [i for i in ('Symbol', 'Year', 'Quarter') if i in data.columns]
+    no_key = data[keys].isna().any(axis=1)
+    if no_key.any():
+        print(f"Dropped {no_key.sum()} rows without {', '.join(keys)}")
+        data = data.loc[~no_key]
+
+    data = data.copy()
+    for col in data.columns:
+        if col == 'Symbol':
+            data[col] = data[col].astype('category')
+        elif col == 'Year':
+            data[col] = data[col].astype('int16')
+        elif col == 'Quarter':
+            data[col] = data[col].astype('int8')
+        elif pd.api.types.is_numeric_dtype(data[col]) and not pd.api.types.is_bool_dtype(data[col]):
+            data[col] = data[col].astype(value_dtype)
+        elif pd.api.types.is_object_dtype(data[col]) or pd.api.types.is_string_dtype(data[col]):
+            try:
+                data[col] = pd.to_numeric(data[col]).astype(value_dtype)
+            except (ValueError, TypeError):
+                data[col] = data[col].astype('category')
+
+
+    return data
+
+
+def cache_file(name: str, cache_dir: str, fmt: str) -> str:
+    """ Path of a cached table, e.g. cache_file('is_insurance', cache_dir, 'feather')
+    ================================================================
+    Parameters:
+        name: str
+        cache_dir: str
+        fmt: str
+            'feather', 'parquet' or 'csv'
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown cache format: {fmt}. Use one of {list(FORMATS)}")
+
+    return os.path.join(cache_dir, name + FORMATS[fmt])
+
+
+def write_table(data: pd.DataFrame, name: str, cache_dir: str, fmt='feather') -> str:
+    """ Save a table to the cache without the index column
+    ================================================================
+    Parameters:
+        data: pd.DataFrame
+        name: str
+            e.g. 'is_insurance', 'bs_securities', 'list_banks'
+        cache_dir: str
+        fmt: str
+            'feather' (default), 'parquet' or 'csv' (for export)
+    Returns:
+        The path of the written file
+    """
+    path = cache_file(name, cache_dir, fmt)
+    os.makedirs(cache_dir, exist_ok=True)
+
+    if fmt == 'csv':
+        data.to_csv(path, index=False)
+    else:
+        data = to_compact_dtypes(data).reset_index(drop=True)
+        if fmt == 'feather':
+            data.to_feather(path)
+        else:
+            data.to_parquet(path, index=False)
+
+
+    return path
+
+
+def write_table_chunks(chunks, name: str, cache_dir: str, fmt='feather') -> tuple:
+    """ Save a table which arrives in chunks, writing every chunk straight to the file
+    ================================================================
+    Only one chunk is held in memory at a time. Text columns (Symbol, CompanyType, ...) are stored
+    as plain text, as their categories differ between chunks and a Feather file holds a single
+    dictionary per column; they become categorical again in read_table.
+
+    Parameters:
+        chunks: iterable of pd.DataFrame
+            e.g. pd.read_sql(..., chunksize=100000)
+        name: str
+        cache_dir: str
+        fmt: str
+            'feather' (default), 'parquet' or 'csv'
+    Returns:
+        (path, number of rows)
+    """
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet
+
+    path = cache_file(name, cache_dir, fmt)
+    tmp_path = path + '.tmp'
+    os.makedirs(cache_dir, exist_ok=True)
+
+    rows = 0
+    schema = None
+    writer = None
+    try:
+        for chunk in chunks:
+            if fmt == 'csv':
+                chunk.to_csv(tmp_path, index=False, mode='a' if rows else 'w', header=not rows)
+                rows += len(chunk)
+                continue
+
+            chunk = to_compact_dtypes(chunk).reset_index(drop=True)
+            rows += len(chunk)
+            for col in chunk.columns:
+                if isinstance(chunk[col].dtype, pd.CategoricalDtype):
+                    chunk[col] = chunk[col].astype(str)
+
+            # The first chunk decides the schema, the next chunks are cast to it
+            table = pa.Table.from_pandas(chunk, schema=schema, preserve_index=False)
+            if writer is None:
+                schema = table.schema
+                if fmt == 'feather':
+                    writer = pa.ipc.new_file(tmp_path, schema)
+                else:
+                    writer = pa.parquet.ParquetWriter(tmp_path, schema)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    if not os.path.exists(tmp_path):
+        raise ValueError(f"No data to save for {name}")
+    os.replace(tmp_path, path)
+
+
+    return path, rows
+
+
+def read_table(name: str, cache_dir: str, fmt=None, columns=None) -> pd.DataFrame:
+    """ Load a cached table with compact dtypes
+    ================================================================
+    Feather files are memory-mapped, so there is nearly nothing to parse.
+    Text columns are returned as categories, including the ones written as plain text by write_table_chunks.
+
+    Parameters:
+        name: str
+        cache_dir: str
+        fmt: str
+            Defaults to None, which takes the first existing file in the order feather, parquet, csv
+        columns: list
+            Read only these columns. Defaults to all columns
+    """
+    if fmt is None:
+        for i in FORMATS:
+            if os.path.exists(cache_file(name, cache_dir, i)):
+                fmt = i
+                break
+        else:
+            raise FileNotFoundError(f"No cached table {name} in {cache_dir}")
+
+    path = cache_file(name, cache_dir, fmt)
+    if fmt in ('feather', 'parquet'):
+        if fmt == 'feather':
+            from pyarrow import feather
+            data = feather.read_table(path, columns=columns, memory_map=True).to_pandas()
+        else:
+            data = pd.read_parquet(path, columns=columns, memory_map=True)
+        for col in data.columns:
+            if pd.api.types.is_object_dtype(data[col]) or pd.api.types.is_string_dtype(data[col]):
+                data[col] = data[col].astype('category')
+        return data
+
+    # CSV files written by older versions of s1_download_data have an index column
+    data = pd.read_csv(path)
+    data = data.drop(columns=[i for i in data.columns if i.startswith('Unnamed: ')])
+    if columns is not None:
+        data = data[columns]
+
+
+    return to_compact_dtypes(data)
+
+
+if __name__ == '__main__':
+    print("Hello World")
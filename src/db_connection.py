@@ -0,0 +1,138 @@
+import os
+import time
+from contextlib import contextmanager, nullcontext
+
+import pandas as pd
+
+
+# Access database of the ranking results
+DEFAULT_PATH = r"V:\iBroker\stock_database.accdb"
+
+# Environment variables overriding the database: a full ODBC connection string, or the path of an .accdb file
+ENV_DSN = "STOCK_DATABASE_DSN"
+ENV_PATH = "STOCK_DATABASE_PATH"
+
+
+def access_dsn(path: str) -> str:
+    """ ODBC connection string of a Microsoft Access file
+    ================================================================
+    Parameters:
+        path: str
+            e.g. r"V:\\iBroker\\stock_database.accdb"
+    """
+    return f"Driver={{Microsoft Access Driver (*.mdb, *.accdb)}};DBQ={path};"
+
+
+def resolve_dsn(dsn=None) -> str:
+    """ Connection string to use: the given one, else the environment, else the default Access file
+    ================================================================
+    Parameters:
+        dsn: str
+            Defaults to None, which reads STOCK_DATABASE_DSN, then STOCK_DATABASE_PATH,
+            then falls back to DEFAULT_PATH
+    """
+    if dsn is not None:
+        return dsn
+    if os.environ.get(ENV_DSN):
+        return os.environ[ENV_DSN]
+
+
+    return access_dsn(os.environ.get(ENV_PATH) or DEFAULT_PATH)
+
+
+def timer(timings=None, stage=None):
+    """ Return a timed(kind) context manager for one stage, or a no-op one without timings
+    ================================================================
+    Parameters:
+        timings: list
+            Records {"stage", "kind", "seconds"} are appended to it. Defaults to None
+        stage: str
+    """
+    @contextmanager
+    def timed(kind: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            timings.append({
+                "stage": stage,
+                "kind": kind,
+                "seconds": time.perf_counter() - start,
+            })
+
+    if timings is None:
+        return lambda kind: nullcontext()
+
+    return timed
+
+
+class Database:
+    """ One connection to the database, shared by every read and write stage of a run
+    ================================================================
+    The connection is opened on first use and closed when the block ends,
+    and the time spent connecting, reading and writing is recorded per stage:
+
+        with db_connection.Database() as db:
+            with db.timed("ptsp_stock_fundamental_score", "read"):
+                df_raw = db_reader.read_table(conn=db.conn, ...)
+        print(db.report())
+
+    Parameters:
+        dsn: str
+            Defaults to None, see resolve_dsn
+        connect: callable
+            connect(dsn) returns a DB-API connection. Defaults to None (pyodbc.connect)
+    """
+
+    def __init__(self, dsn=None, connect=None):
+        self.dsn = resolve_dsn(dsn)
+        self._connect = connect
+        self._conn = None
+        self.timings = []
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            connect = self._connect
+            if connect is None:
+                import pyodbc
+                connect = pyodbc.connect
+
+            with self.timed("connect", "connect"):
+                self._conn = connect(self.dsn)
+
+        return self._conn
+
+    def timed(self, stage: str, kind: str):
+        """ Context manager recording the time spent in a block, e.g. timed("income_statement_insurance", "write") """
+        return timer(self.timings, stage)(kind)
+
+    def timer(self, stage: str):
+        """ timed(kind) of one stage, e.g. for pipeline.save_result """
+        return timer(self.timings, stage)
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def report(self) -> pd.DataFrame:
+        """ Seconds spent per stage (rows) in connect / read / write (columns) """
+        if not self.timings:
+            return pd.DataFrame()
+
+        report = pd.DataFrame(self.timings).pivot_table(
+            index="stage", columns="kind", values="seconds", aggfunc="sum", sort=False
+        )
+
+        return report.fillna(0).round(2)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+if __name__ == '__main__':
+    print("Hello World")
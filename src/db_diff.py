@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+
+
+# Columns identifying a row in every result table
+KEYS = ['Symbol', 'Year', 'Quarter']
+
+
+def row_hash(data: pd.DataFrame, columns: list) -> pd.Series:
+    """ Hash the contents of the given columns of every row
+    ================================================================
+    Values are compared as text, which is how they are stored in the Access tables.
+    The columns are converted one at a time, so the text of the whole frame is never held at once.
+
+    Parameters:
+        data: pd.DataFrame
+        columns: list
+    """
+    hashes = np.zeros(len(data), dtype='uint64')
+    for col in columns:
+        col_hash = pd.util.hash_pandas_object(data[col].astype(str), index=False).to_numpy()
+        # Overflow wraps around, which is what a hash needs
+        hashes = hashes*np.uint64(1000003) ^ col_hash
+
+
+    return pd.Series(hashes, index=data.index)
+
+
+def diff_rows(data: pd.DataFrame, existing: pd.DataFrame, keys=KEYS, value_columns=None) -> dict:
+    """ Classify new rows as insert / update / unchanged against the rows already in a table
+    ================================================================
+    Rows are matched on keys and compared through a hash of value_columns,
+    so only rows which are new or whose values changed have to be written.
+
+    Parameters:
+        data: pd.DataFrame
+            Latest result, may hold more columns than value_columns (e.g. Update)
+        existing: pd.DataFrame
+            Rows already in the table, with the same column names as data
+        keys: list
+            Defaults to ['Symbol', 'Year', 'Quarter']
+        value_columns: list
+            Columns to compare. Defaults to every column of data but keys
+    Returns:
+        dict:
+            'insert': rows of data whose key is not in the table
+            'update': rows of data whose key is in the table with different values
+            'unchanged': number of rows which need no write
+    """
+    if value_columns is None:
+        value_columns = [i for i in data.columns if i not in keys]
+
+    new = data[keys].astype(str)
+    new['_hash'] = row_hash(data, value_columns).to_numpy()
+    new['_row'] = range(len(data))
+
+    old = existing[keys].astype(str)
+    old['_hash'] = row_hash(existing, value_columns).to_numpy()
+
+    # A key is unchanged only if every row stored under it holds the same values
+    old = old.groupby(keys).agg(
+        _old_hash=('_hash', 'first'),
+        _versions=('_hash', 'nunique')
+    ).reset_index()
+
+    new = new.merge(old, how='left', on=keys)
+    is_new = new['_old_hash'].isna()
+    is_changed = ~is_new & ((new['_old_hash'] != new['_hash']) | (new['_versions'] > 1))
+
+    insert = data.iloc[new.loc[is_new, '_row'].to_numpy()]
+    update = data.iloc[new.loc[is_changed, '_row'].to_numpy()]
+
+
+    return {
+        'insert': insert,
+        'update': update,
+        'unchanged': int(len(data) - len(insert) - len(update)),
+    }
+
+
+if __name__ == '__main__':
+    print("Hello World")
@@ -0,0 +1,98 @@
+import pandas as pd
+
+
+def select_sql(table: str, columns=None, n_symbols=0, period_from=None, period_to=None, not_null=None) -> str:
+    """ Build a parameterized SELECT statement with the filters pushed into the WHERE clause
+    ================================================================
+    The period bounds compare Year and Quarter as they are, not a computed Year*4 + Quarter,
+    so an index on (Year, Quarter) can serve them. Each bound takes three parameters: Year, Year, Quarter
+    (see period_params).
+
+    Parameters:
+        table: str
+        columns: list
+            Defaults to None, which selects every column
+        n_symbols: int
+            Number of ? placeholders in the Symbol IN (...) list, 0 for no symbol filter
+        period_from, period_to: tuple (Year, Quarter)
+            Inclusive bounds of the period. Defaults to None (no bound)
+        not_null: list
+            Columns which must not be NULL, e.g. ['score_lte'] to keep the securities rows
+    """
+    col_sql = "*" if columns is None else ",".join(f"[{i}]" for i in columns)
+    where = []
+    if n_symbols:
+        where.append("[Symbol] IN (" + ",".join("?" for _ in range(n_symbols)) + ")")
+    if period_from is not None:
+        where.append("([Year] > ? OR ([Year] = ? AND [Quarter] >= ?))")
+    if period_to is not None:
+        where.append("([Year] < ? OR ([Year] = ? AND [Quarter] <= ?))")
+    for i in not_null or []:
+        where.append(f"[{i}] IS NOT NULL")
+
+    sql = f"SELECT {col_sql} FROM {table}"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+
+
+    return sql
+
+
+def period_params(period_from=None, period_to=None) -> list:
+    """ Parameters of the period bounds of select_sql: Year, Year, Quarter for each given bound """
+    params = []
+    for period in (period_from, period_to):
+        if period is not None:
+            year, quarter = int(period[0]), int(period[1])
+            params += [year, year, quarter]
+
+
+    return params
+
+
+def read_table(conn, table: str, columns=None, symbols=None, period_from=None, period_to=None, not_null=None, chunk_size=100) -> pd.DataFrame:
+    """ Read only the rows and columns which are needed from a table
+    ================================================================
+    Filters run in the database, so only the relevant rows cross the ODBC boundary.
+    Long symbol lists are split into IN-lists of chunk_size symbols, one query each.
+    An empty symbol list returns an empty table without querying when columns are given;
+    without columns, only the column names of the table are read.
+
+    Parameters:
+        conn: DB-API connection using the qmark paramstyle (pyodbc, sqlite3)
+        table: str
+        columns: list
+            Defaults to None, which reads every column
+        symbols: list
+            Defaults to None, which reads every symbol
+        period_from, period_to: tuple (Year, Quarter)
+            Inclusive bounds of the period. Defaults to None (no bound)
+        not_null: list
+            Columns which must not be NULL
+        chunk_size: int
+            Maximum number of symbols per query. Defaults to 100
+    """
+    params = period_params(period_from, period_to)
+
+    if symbols is None:
+        sql = select_sql(table, columns, 0, period_from, period_to, not_null)
+        return pd.read_sql(sql=sql, con=conn, params=params or None)
+
+    symbols = [str(i) for i in pd.unique(pd.Series(list(symbols), dtype=object))]
+    if not symbols:
+        if columns is not None:
+            return pd.DataFrame(columns=list(columns))
+        return pd.read_sql(sql=f"SELECT * FROM {table} WHERE 1 = 0", con=conn)
+
+    frames = []
+    for start in range(0, len(symbols), chunk_size):
+        chunk = symbols[start:start+chunk_size]
+        sql = select_sql(table, columns, len(chunk), period_from, period_to, not_null)
+        frames.append(pd.read_sql(sql=sql, con=conn, params=chunk + params))
+
+
+    return pd.concat(frames, ignore_index=True)
+
+
+if __name__ == '__main__':
+    print("Hello World")
@@ -0,0 +1,189 @@
+import pandas as pd
+
+
+# Result tables which are written by the ranking scripts
+TARGET_TABLES = [
+    'income_statement_insurance',
+    'stock_financial_ratio_insurance',
+    'income_statement_securities',
+    'stock_financial_ratio_securities',
+    'ptsp_stock_fundamental_score_financial',
+]
+
+
+def supports_fast_executemany(conn) -> bool:
+    """ Check whether the connection is a pyodbc connection whose driver handles fast_executemany
+    ================================================================
+    Parameters:
+        conn: DB-API connection
+            The Microsoft Access driver does not implement parameter arrays,
+            so it falls back to the plain executemany.
+    """
+    try:
+        import pyodbc
+    except ImportError:
+        return False
+
+    if not isinstance(conn, pyodbc.Connection):
+        return False
+
+    driver = conn.getinfo(pyodbc.SQL_DRIVER_NAME).lower()
+
+    return not ('ace' in driver or 'odbcjt' in driver)
+
+
+def insert_sql(table: str, columns: list) -> str:
+    """ Build a parameterized INSERT statement
+    ================================================================
+    Parameters:
+        table: str
+        columns: list
+            Column names in the database, quoted with [] (Access and SQLite both accept it)
+    """
+    col_sql = ",".join(f"[{i}]" for i in columns)
+    placeholders = ",".join("?" for _ in columns)
+
+    return f"INSERT INTO {table} ({col_sql}) VALUES ({placeholders})"
+
+
+def update_sql(table: str, columns: list, key_columns: list) -> str:
+    """ Build a parameterized UPDATE statement: values of columns first, then the keys
+    ================================================================
+    Parameters:
+        table: str
+        columns: list
+            Columns to set
+        key_columns: list
+            Columns of the WHERE clause
+    """
+    set_sql = ",".join(f"[{i}]=?" for i in columns)
+    where_sql = " AND ".join(f"[{i}]=?" for i in key_columns)
+
+    return f"UPDATE {table} SET {set_sql} WHERE {where_sql}"
+
+
+def executemany_batches(conn, sql: str, rows: list, batch_size=1000, fast_executemany=None) -> int:
+    """ Run executemany in batches, committing once per batch and rolling back a failed batch
+    ================================================================
+    Parameters:
+        conn: DB-API connection
+        sql: str
+        rows: list of tuple
+        batch_size: int
+        fast_executemany: bool
+            Defaults to None, which enables it when the driver supports it
+    """
+    if batch_size < 1:
+        raise ValueError("batch_size must be a positive integer")
+
+    if fast_executemany is None:
+        fast_executemany = supports_fast_executemany(conn)
+
+    cursor = conn.cursor()
+    if fast_executemany:
+        cursor.fast_executemany = True
+
+    try:
+        for start in range(0, len(rows), batch_size):
+            try:
+                cursor.executemany(sql, rows[start:start+batch_size])
+            except Exception:
+                conn.rollback()
+                raise
+            conn.commit()
+    finally:
+        cursor.close()
+
+
+    return len(rows)
+
+
+def bulk_insert(conn, table: str, data: pd.DataFrame, columns=None, batch_size=1000, fast_executemany=None) -> int:
+    """ Insert a DataFrame into a table with parameterized executemany, committing once per batch
+    ================================================================
+    Parameters:
+        conn: DB-API connection (pyodbc, sqlite3, ...) using the qmark paramstyle
+        table: str
+        data: pd.DataFrame
+            Values are sent as they are, so convert them (e.g. astype(str)) before calling
+        columns: list
+            Column names in the database, in the same order as data.columns.
+            Defaults to data.columns
+        batch_size: int
+            Number of rows per executemany call and commit. Defaults to 1000
+        fast_executemany: bool
+            Defaults to None, which enables it when the driver supports it
+    Returns:
+        The number of inserted rows
+    """
+    if columns is None:
+        columns = data.columns.to_list()
+    if len(columns) != data.shape[1]:
+        raise ValueError(f"{table}: {len(columns)} columns given for {data.shape[1]} columns of data")
+
+    sql = insert_sql(table, columns)
+    rows = list(data.itertuples(index=False, name=None))
+
+
+    return executemany_batches(conn, sql, rows, batch_size=batch_size, fast_executemany=fast_executemany)
+
+
+def bulk_update(conn, table: str, data: pd.DataFrame, key_columns: list, columns=None, batch_size=1000, fast_executemany=None) -> int:
+    """ Update the rows of a table matching the keys of a DataFrame, in batches
+    ================================================================
+    Parameters:
+        conn: DB-API connection using the qmark paramstyle
+        table: str
+        data: pd.DataFrame
+            Values are sent as they are, so convert them (e.g. astype(str)) before calling
+        key_columns: list
+            Columns of data identifying a row, e.g. ['Symbol', 'Year', 'Quarter']
+        columns: list
+            Column names in the database, in the same order as data.columns.
+            Defaults to data.columns
+        batch_size: int
+        fast_executemany: bool
+            See bulk_insert
+    Returns:
+        The number of updated rows of data
+    """
+    if columns is None:
+        columns = data.columns.to_list()
+    if len(columns) != data.shape[1]:
+        raise ValueError(f"{table}: {len(columns)} columns given for {data.shape[1]} columns of data")
+
+    db_name = dict(zip(data.columns, columns))
+    value_columns = [i for i in data.columns if i not in key_columns]
+
+    sql = update_sql(table, [db_name[i] for i in value_columns], [db_name[i] for i in key_columns])
+    rows = list(data[value_columns + list(key_columns)].itertuples(index=False, name=None))
+
+
+    return executemany_batches(conn, sql, rows, batch_size=batch_size, fast_executemany=fast_executemany)
+
+
+def write_changes(conn, table: str, changes: dict, key_columns=('Symbol', 'Year', 'Quarter'), columns=None, batch_size=1000) -> dict:
+    """ Insert the new rows and update the changed rows found by db_diff.diff_rows
+    ================================================================
+    Parameters:
+        conn: DB-API connection using the qmark paramstyle
+        table: str
+        changes: dict
+            Output of db_diff.diff_rows
+        key_columns: tuple
+            Defaults to ('Symbol', 'Year', 'Quarter')
+        columns: list
+            Column names in the database, in the same order as the columns of the changed rows
+        batch_size: int
+    Returns:
+        dict: number of inserted, updated and unchanged rows
+    """
+    inserted = bulk_insert(conn, table, changes['insert'], columns=columns, batch_size=batch_size)
+    updated = bulk_update(conn, table, changes['update'], key_columns=key_columns, columns=columns, batch_size=batch_size)
+
+
+    return {'inserted': inserted, 'updated': updated, 'unchanged': changes['unchanged']}
+
+
+if __name__ == '__main__':
+    print("Hello World")
@@ -0,0 +1,117 @@
+import os
+import json
+
+import numpy as np
+import pandas as pd
+
+
+def period_code(data: pd.DataFrame) -> np.ndarray:
+    """ Year*4 + Quarter of every row, so that consecutive quarters are consecutive numbers """
+    return data['Year'].astype(int).to_numpy()*4 + data['Quarter'].astype(int).to_numpy()
+
+
+def period_hashes(frames: list) -> dict:
+    """ Fingerprint of the inputs of every (Year, Quarter)
+    ================================================================
+    Every row is hashed from its typed columns (hash_pandas_object, without converting them to text),
+    and the hashes of the rows of a period are combined in one groupby, regardless of their order:
+    the number and the sum (modulo 2**64) of the row hashes of every frame, hashed together per period.
+
+    Parameters:
+        frames: list of pd.DataFrame
+            Inputs of a sector, each with Year and Quarter columns
+    Returns:
+        dict: {"Year-Quarter": hash}
+    """
+    parts = pd.concat(
+        [
+            pd.DataFrame({
+                'period': period_code(data),
+                'frame': k,
+                'hash': pd.util.hash_pandas_object(data, index=False).to_numpy(),
+            })
+            for k, data in enumerate(frames)
+        ],
+        ignore_index=True
+    )
+
+    per_frame = parts.groupby(['period', 'frame'])['hash'].agg(['size', 'sum']).unstack('frame', fill_value=0)
+    period_hash = pd.util.hash_pandas_object(per_frame, index=True).to_numpy()
+
+
+    return {to_key(period): f"{value:016x}" for period, value in zip(per_frame.index, period_hash)}
+
+
+def to_key(code: int) -> str:
+    """ Year*4 + Quarter -> "Year-Quarter" """
+    return f"{(code - 1) // 4}-{(code - 1) % 4 + 1}"
+
+
+def to_period(key: str) -> tuple:
+    """ "2023-1" -> (2023, 1) """
+    year, quarter = key.split('-')
+
+    return int(year), int(quarter)
+
+
+def dirty_periods(hashes: dict, saved: dict, lookback=0) -> list:
+    """ Periods whose inputs are new or changed since the last run, and the periods depending on them
+    ================================================================
+    A change in a quarter also changes the rolling metrics (TTM, 8Q, 12Q, 4-quarter averages)
+    of the next quarters, so every changed period is extended by lookback quarters.
+
+    Parameters:
+        hashes: dict
+            Output of period_hashes for the current inputs
+        saved: dict
+            Output of period_hashes saved by the last run
+        lookback: int
+            Number of following quarters depending on a quarter, e.g. 11 for a 12-quarter window
+    Returns:
+        list of (Year, Quarter), sorted
+    """
+    codes = {k: to_period(k)[0]*4 + to_period(k)[1] for k in hashes}
+    changed = [codes[k] for k in hashes if saved.get(k) != hashes[k]]
+    # A period which disappeared from the inputs changes the windows after it as well
+    changed += [to_period(k)[0]*4 + to_period(k)[1] for k in saved if k not in hashes]
+
+    dirty = set()
+    for code in changed:
+        dirty.update(c for c in codes.values() if code <= c <= code + lookback)
+
+
+    return sorted(((c - 1) // 4, (c - 1) % 4 + 1) for c in dirty)
+
+
+def select_periods(data: pd.DataFrame, periods) -> pd.DataFrame:
+    """ Rows of data in the given periods, data itself if periods is None
+    ================================================================
+    Parameters:
+        data: pd.DataFrame
+        periods: list of (Year, Quarter)
+    """
+    if periods is None:
+        return data
+
+    return data.loc[np.isin(period_code(data), [y*4 + q for y, q in periods])].copy()
+
+
+def load_hashes(path: str) -> dict:
+    """ Fingerprints saved by the last run, empty if there is none """
+    if not os.path.exists(path):
+        return {}
+
+    with open(path, mode="r", encoding="utf-8") as fp:
+        return json.load(fp)
+
+
+def save_hashes(hashes: dict, path: str):
+    """ Save the fingerprints (to a temporary file first, then renamed) """
+    tmp_path = path + '.tmp'
+    with open(tmp_path, mode="w", encoding="utf-8") as fp:
+        json.dump(hashes, fp, indent=4)
+    os.replace(tmp_path, path)
+
+
+if __name__ == '__main__':
+    print("Hello World")
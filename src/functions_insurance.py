@@ -1,27 +1,78 @@
 import pandas as pd
 import numpy as np
 
+from src import rolling_state
 
-def combined_ratio_ttm(panel_data, window=4) -> pd.DataFrame():
+
+def combined_ratio_ttm(panel_data, window=4, state_dir=None, rebuild=False) -> pd.DataFrame():
     """ This function is to calculate combined ratio TTM
     ================================================================
     panel_data: pd.DataFrame
     window: int
         Default value is 4
+    state_dir: str
+        Folder of the rolling states kept between runs (see rolling_state.rolling_stats).
+        Default value is None, which calculates the windows from the whole history
+    rebuild: bool
+        Rebuild the rolling states from the whole history. Default value is False
     """
-    incurred_losses_ttm = panel_data.groupby('Symbol')['IncurredLosses'].rolling(window=window).sum().to_list()
-    expenses_ttm = panel_data.groupby('Symbol')['Expenses'].rolling(window=window).sum().to_list()
-    revenues_ttm = panel_data.groupby('Symbol')['Revenues'].rolling(window=window).sum().to_list()
+    ttm = rolling_state.rolling_columns(
+        panel_data, ['IncurredLosses', 'Expenses', 'Revenues'], window,
+        state_dir=state_dir, prefix='insurance', rebuild=rebuild
+    )
 
-    panel_data['incurred_losses_ttm'] = incurred_losses_ttm
-    panel_data['expenses_ttm'] = expenses_ttm
-    panel_data['revenues_ttm'] = revenues_ttm
+    panel_data['incurred_losses_ttm'] = ttm[('IncurredLosses', 'sum')]
+    panel_data['expenses_ttm'] = ttm[('Expenses', 'sum')]
+    panel_data['revenues_ttm'] = ttm[('Revenues', 'sum')]
     panel_data['combined_ratio_ttm'] = (panel_data['incurred_losses_ttm'] + panel_data['expenses_ttm'])/panel_data['revenues_ttm']
         
     
     return panel_data
 
 
+def quantile_bucket_score(panel_data, metrics: dict, quantiles=(0.25, 0.50, 0.75), by=('Year', 'Quarter')) -> pd.DataFrame:
+    """ Score several metrics against their own quantiles for each period of time in one grouped pass.
+    A value below the first cut point gets the highest score (len(quantiles) + 1), 
+    a value at or above the last cut point (or missing) gets 1.
+    panel_data is not modified: the scores are added to a copy, which is returned.
+    ================================================================
+    Parameters:
+        panel_data: pd.DataFrame()
+        metrics: dict
+            Mapping of metric column -> score column, e.g. {'npw_to_equity': 'score_npw2equity'}
+        quantiles: tuple
+            Cut points, defaults to (0.25, 0.50, 0.75)
+        by: tuple
+            Columns defining a period, defaults to ('Year', 'Quarter')
+    """
+    grouped = panel_data.groupby(list(by), sort=True)
+    
+    # All cut points of all metrics: index (period, quantile) x metric
+    cut_points = grouped[list(metrics)].quantile(list(quantiles))
+    
+    # Position of every row's period in the table of cut points, -1 if Year or Quarter is missing
+    group_code = grouped.ngroup().fillna(-1).to_numpy(dtype='int64')
+    in_group = group_code >= 0
+    
+    scores = {}
+    for metric, score_column in metrics.items():
+        cuts = cut_points[metric].unstack().to_numpy()
+        values = panel_data[metric].to_numpy(dtype=float)
+        
+        # The first cut point above the value decides the score, as in an if/elif chain
+        # (cut points may be NaN when a period holds infinite ratios)
+        is_below = np.zeros((len(panel_data), len(quantiles)), dtype=bool)
+        is_below[in_group] = values[in_group, None] < cuts[group_code[in_group]]
+        scores[score_column] = np.where(
+            is_below.any(axis=1),
+            len(quantiles) + 1 - is_below.argmax(axis=1),
+            1
+        ).astype('int64')
+    
+    
+    return panel_data.assign(**scores)
+
+
 def npw_to_equity_score(panel_data) -> pd.DataFrame:
     """ 
     This fuction is to calculate quantiles of Net Premium Written to Equity for each period of time, 
@@ -31,36 +82,7 @@ def npw_to_equity_score(panel_data) -> pd.DataFrame:
     ================================================================
     panel_data: pd.DataFrame()
     """
-    npw_to_equity = panel_data.groupby(['Year', 'Quarter'])['npw_to_equity'].quantile(0.25).reset_index(name='npw_to_equity_25')
-    npw_to_equity['npw_to_equity_50'] = panel_data.groupby(['Year', 'Quarter'])['npw_to_equity'].quantile(0.50).to_list()
-    npw_to_equity['npw_to_equity_75'] = panel_data.groupby(['Year', 'Quarter'])['npw_to_equity'].quantile(0.75).to_list()
-
-    panel_data = pd.merge(
-        panel_data,
-        npw_to_equity,
-        how='outer',
-        on=['Year', 'Quarter']
-    )
-
-    npw_to_equity_score = []
-
-    for _, items in panel_data.iterrows():
-        if items['npw_to_equity'] < items['npw_to_equity_25']:
-            npw_to_equity_score.append(4)
-        elif items['npw_to_equity'] < items['npw_to_equity_50']:
-            npw_to_equity_score.append(3)
-        elif items['npw_to_equity'] < items['npw_to_equity_75']:
-            npw_to_equity_score.append(2)
-        else:
-            npw_to_equity_score.append(1)
-    panel_data['score_npw2equity'] = npw_to_equity_score
-    
-    del panel_data['npw_to_equity_25']
-    del panel_data['npw_to_equity_50'] 
-    del panel_data['npw_to_equity_75']
-    
-    
-    return panel_data
+    return quantile_bucket_score(panel_data, {'npw_to_equity': 'score_npw2equity'})
 
 
 def net_leverage_score(panel_data) -> pd.DataFrame:
@@ -70,36 +92,7 @@ def net_leverage_score(panel_data) -> pd.DataFrame:
     ================================================================
     panel_data: pd.DataFrame()
     """
-    net_leverage = panel_data.groupby(['Year', 'Quarter'])['net_leverage'].quantile(0.25).reset_index(name='net_leverage_25')
-    net_leverage['net_leverage_50'] = panel_data.groupby(['Year', 'Quarter'])['net_leverage'].quantile(0.50).to_list()
-    net_leverage['net_leverage_75'] = panel_data.groupby(['Year', 'Quarter'])['net_leverage'].quantile(0.75).to_list()
-
-    panel_data = pd.merge(
-        panel_data,
-        net_leverage,
-        how='outer',
-        on=['Year', 'Quarter']
-    )
-
-    net_leverage_score = []
-
-    for _, items in panel_data.iterrows():
-        if items['net_leverage'] < items['net_leverage_25']:
-            net_leverage_score.append(4)
-        elif items['net_leverage'] < items['net_leverage_50']:
-            net_leverage_score.append(3)
-        elif items['net_leverage'] < items['net_leverage_75']:
-            net_leverage_score.append(2)
-        else:
-            net_leverage_score.append(1)
-    panel_data['score_net_leverage'] = net_leverage_score
-    
-    del panel_data['net_leverage_25']
-    del panel_data['net_leverage_50'] 
-    del panel_data['net_leverage_75']
-    
-    
-    return panel_data
+    return quantile_bucket_score(panel_data, {'net_leverage': 'score_net_leverage'})
 
 
 def gross_reserves_to_equity_score(panel_data) -> pd.DataFrame:
@@ -109,36 +102,7 @@ def gross_reserves_to_equity_score(panel_data) -> pd.DataFrame:
     ================================================================
     panel_data: pd.DataFrame()
     """
-    gross_reserves_to_equity = panel_data.groupby(['Year', 'Quarter'])['gross_reserves_to_equity'].quantile(0.25).reset_index(name='gross_reserves_to_equity_25')
-    gross_reserves_to_equity['gross_reserves_to_equity_50'] = panel_data.groupby(['Year', 'Quarter'])['gross_reserves_to_equity'].quantile(0.50).to_list()
-    gross_reserves_to_equity['gross_reserves_to_equity_75'] = panel_data.groupby(['Year', 'Quarter'])['gross_reserves_to_equity'].quantile(0.75).to_list()
-
-    panel_data = pd.merge(
-        panel_data,
-        gross_reserves_to_equity,
-        how='outer',
-        on=['Year', 'Quarter']
-    )
-
-    gross_reserves_to_equity_score = []
-
-    for _, items in panel_data.iterrows():
-        if items['gross_reserves_to_equity'] < items['gross_reserves_to_equity_25']:
-            gross_reserves_to_equity_score.append(4)
-        elif items['gross_reserves_to_equity'] < items['gross_reserves_to_equity_50']:
-            gross_reserves_to_equity_score.append(3)
-        elif items['gross_reserves_to_equity'] < items['gross_reserves_to_equity_75']:
-            gross_reserves_to_equity_score.append(2)
-        else:
-            gross_reserves_to_equity_score.append(1)
-    panel_data['score_grossreserve2equity'] = gross_reserves_to_equity_score
-    
-    del panel_data['gross_reserves_to_equity_25']
-    del panel_data['gross_reserves_to_equity_50'] 
-    del panel_data['gross_reserves_to_equity_75']
-    
-    
-    return panel_data
+    return quantile_bucket_score(panel_data, {'gross_reserves_to_equity': 'score_grossreserve2equity'})
 
 
 def npw_gpw_score(panel_data) -> pd.DataFrame:
@@ -148,36 +112,7 @@ def npw_gpw_score(panel_data) -> pd.DataFrame:
     ================================================================
     panel_data: pd.DataFrame()
     """
-    npw_gpw = panel_data.groupby(['Year', 'Quarter'])['npw_gpw'].quantile(0.25).reset_index(name='npw_gpw_25')
-    npw_gpw['npw_gpw_50'] = panel_data.groupby(['Year', 'Quarter'])['npw_gpw'].quantile(0.50).to_list()
-    npw_gpw['npw_gpw_75'] = panel_data.groupby(['Year', 'Quarter'])['npw_gpw'].quantile(0.75).to_list()
-
-    panel_data = pd.merge(
-        panel_data,
-        npw_gpw,
-        how='outer',
-        on=['Year', 'Quarter']
-    )
-
-    npw_gpw_score = []
-
-    for _, items in panel_data.iterrows():
-        if items['npw_gpw'] < items['npw_gpw_25']:
-            npw_gpw_score.append(4)
-        elif items['npw_gpw'] < items['npw_gpw_50']:
-            npw_gpw_score.append(3)
-        elif items['npw_gpw'] < items['npw_gpw_75']:
-            npw_gpw_score.append(2)
-        else:
-            npw_gpw_score.append(1)
-    panel_data['score_npw2gpw'] = npw_gpw_score
-    
-    del panel_data['npw_gpw_25']
-    del panel_data['npw_gpw_50'] 
-    del panel_data['npw_gpw_75']
-    
-    
-    return panel_data
+    return quantile_bucket_score(panel_data, {'npw_gpw': 'score_npw2gpw'})
 
 
 if __name__ == '__main__':
@@ -1,24 +1,100 @@
 import pandas as pd
 import numpy as np
 
+from src import rolling_state
+
 
 # Function for scoring based on loans-to-equity
-def score_lte(panel_data) -> pd.DataFrame():    
-    score_lte = []
-    for _, item in panel_data.iterrows():
-        if item['lte'] >= item['lte_8q']*1.6:
-            score_lte.append(0)
-        elif item['lte'] >= item['lte_8q']*1.3:
-            score_lte.append(0.5)
-        elif item['lte'] >= item['lte_8q']*0.7:
-            score_lte.append(1)
-        else:
-            score_lte.append(0)
+def score_lte(panel_data) -> pd.DataFrame():
+    """ Score loans-to-equity against its 8-quarter level
+    ================================================================
+    Meanings:
+        lte at least 1.6 times lte_8q. Score = 0
+        lte at least 1.3 times lte_8q. Score = 0.5
+        lte at least 0.7 times lte_8q. Score = 1
+        Otherwise (or missing). Score = 0
+
+    Parameters:
+        panel_data: pd.DataFrame()
+    """
+    lte = panel_data['lte'].to_numpy(dtype=float)
+    lte_8q = panel_data['lte_8q'].to_numpy(dtype=float)
+
+    panel_data['score_lte'] = np.select(
+        [lte >= lte_8q*1.6, lte >= lte_8q*1.3, lte >= lte_8q*0.7],
+        [0.0, 0.5, 1.0],
+        default=0.0
+    )
+
+
+    return panel_data
+
+
+def score_below_median(panel_data, column: str, median_column: str, score_column: str, by=['Year', 'Quarter']) -> pd.DataFrame():
+    """ Score a ratio against its median of every period of time
+    ================================================================
+    Meanings:
+        Above the median. Score = 0
+        Equal to the median. Score = 0.5
+        Below the median (or missing). Score = 1
+
+    Parameters:
+        panel_data: pd.DataFrame()
+        column: str
+            e.g. 'debt_to_equity'
+        median_column: str
+            Column added with the median of the period, e.g. 'dte_median'
+        score_column: str
+        by: list
+            Defaults to ['Year', 'Quarter']
+    """
+    panel_data[median_column] = panel_data.groupby(by)[column].transform('median')
+
+    value = panel_data[column].to_numpy(dtype=float)
+    median = panel_data[median_column].to_numpy(dtype=float)
+    panel_data[score_column] = np.select(
+        [value > median, value == median],
+        [0.0, 0.5],
+        default=1.0
+    )
+
+
+    return panel_data
+
+
+# Score based on debt-to-equity
+def score_dte(panel_data) -> pd.DataFrame():
+    """ Score based on debt-to-equity compared with the median of the sector
+    ================================================================
+    Parameters:
+        panel_data: pd.DataFrame()
+    """
+    return score_below_median(panel_data, 'debt_to_equity', 'dte_median', 'score_dte')
+
+
+def top_share_matrix(shares, percent_sales=0.8) -> np.ndarray:
+    """ Count, for every row at once, the number of top lines which contribute to the given percentage of sales
+    ================================================================
+    Each row is sorted in descending order (missing shares last), and the lines
+    whose cumulative share is still below percent_sales are counted.
+    Missing shares are counted as well, as in top_share.
     
-    panel_data['score_lte'] = score_lte
+    Parameters:
+        shares: pd.DataFrame() or np.ndarray
+            One row per stock and period, one column per line of sales
+        percent_sales: float
+            Defaults equal to 0.8
+    """
+    values = np.asarray(shares, dtype=float)
     
+    # Descending sort with NaN last: sort the negated values (NaN goes last) and negate back
+    values = -np.sort(-values, axis=1)
+    cum_share = np.cumsum(values, axis=1)
     
-    return panel_data
+    # NaN >= percent_sales is False, so missing shares are counted like in top_share
+    a = (~(cum_share >= percent_sales)).sum(axis=1)
+    
+    return a
 
 
 def top_share(dictionary: dict, percent_sales: float):
@@ -29,17 +105,7 @@ def top_share(dictionary: dict, percent_sales: float):
         percent_sales: float
             Defaults equal to 0.8
     """
-    df1 = pd.DataFrame.from_dict(
-        data=dictionary, 
-        orient='index'
-    )
-    df1.sort_values(
-        by=[0],
-        ascending=False, 
-        inplace=True
-    )
-    df1['position_score'] = np.where(df1[0].cumsum()>=percent_sales, 1, 0)
-    a = df1.loc[df1['position_score'] == 0].count()['position_score']
+    a = top_share_matrix([list(dictionary.values())], percent_sales=percent_sales)[0]
     
     return a
 
@@ -62,17 +128,55 @@ def score_share(a: int):
     return score
 
 
+def score_share_array(a) -> np.ndarray:
+    """ Ranking based on top lines for many rows at once, same meanings as score_share
+    ================================================================
+    Parameters:
+        a: np.ndarray
+            Number of top lines, e.g. from top_share_matrix
+    """
+    a = np.asarray(a)
+    
+    return np.select([a > 2, a > 1], [1.0, 0.5], default=0.0)
+
+
+def diversified_sales_score(panel_data, share_columns: list, percent_sales=0.8) -> pd.DataFrame():
+    """ Score the diversification of sales for every row
+    ================================================================
+    Parameters:
+        panel_data: pd.DataFrame()
+        share_columns: list
+            Columns holding the share of each line in sales, e.g. 'IncomeFVTPL_%'
+        percent_sales: float
+            Defaults equal to 0.8
+    """
+    a = top_share_matrix(panel_data[share_columns], percent_sales=percent_sales)
+    panel_data['score_diversified_sale'] = score_share_array(a)
+    
+    
+    return panel_data
+
+
 # Calculate the coefficient variation the income from financial assets recognized through profit/loss
-def coef_variation_fvtpl(panel_data, window=12) -> pd.DataFrame():
+def coef_variation_fvtpl(panel_data, window=12, state_dir=None, rebuild=False) -> pd.DataFrame():
     """ Calculate the coefficient variation the income from financial assets recognized through profit/loss (FVTPL)
     ================================================================
     Parameters:
         panel_data: pd.DataFrame()
         window: int
             The number of period to calculate coefficient variation for FVTPL
+        state_dir: str
+            Folder of the rolling states kept between runs (see rolling_state.rolling_stats).
+            Defaults to None, which calculates the windows from the whole history
+        rebuild: bool
+            Rebuild the rolling state from the whole history. Defaults to False
     """
-    panel_data['FVTPL_m'] = panel_data.groupby('Symbol')['FVTPL'].rolling(window=window).mean().to_list()
-    panel_data['FVTPL_std'] = panel_data.groupby('Symbol')['FVTPL'].rolling(window=window).std().to_list()
+    fvtpl = rolling_state.rolling_stats(
+        panel_data, 'FVTPL', window, stats=['mean', 'std'],
+        state_dir=state_dir, name='securities_FVTPL', rebuild=rebuild
+    )
+    panel_data['FVTPL_m'] = fvtpl['mean']
+    panel_data['FVTPL_std'] = fvtpl['std']
     panel_data[f'coef_var_{window}q'] = panel_data['FVTPL_m']/panel_data['FVTPL_std']
     
     # del panel_data['FVTPL_m']
@@ -89,20 +193,7 @@ def score_coef(panel_data) -> pd.DataFrame():
         panel_data: pd.DataFrame()
     
     """
-    coef_var_12_med = panel_data.groupby([
-        'Year', 'Quarter'
-    ])['coef_var_12q'].median().reset_index(name='coef_var_12_med')
-    panel_data = pd.merge(panel_data, coef_var_12_med, how='outer', on=['Year', 'Quarter'])
-    
-    score_coef_var = []
-    for _, item in panel_data.iterrows():
-        if item['coef_var_12q'] > item['coef_var_12_med']:
-            score_coef_var.append(0)
-        elif item['coef_var_12q'] == item['coef_var_12_med']:
-            score_coef_var.append(0.5)
-        else:
-            score_coef_var.append(1)
-    panel_data['score_coef_variation'] = score_coef_var
+    panel_data = score_below_median(panel_data, 'coef_var_12q', 'coef_var_12_med', 'score_coef_variation')
     
     # del panel_data['coef_var_12_med']
     
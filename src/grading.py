@@ -0,0 +1,99 @@
+import pandas as pd
+import numpy as np
+
+
+# Grades of score_profit, score_final: below 1 -> D, below 2 -> C, below 3 -> B, otherwise A
+LETTER_THRESHOLDS = (1, 2, 3)
+LETTER_LABELS = ('D', 'C', 'B', 'A')
+
+# Grades of score_health: above 3 -> Safe +, above 2 -> Safe, above 1 -> Warning, otherwise Danger
+HEALTH_THRESHOLDS = (3, 2, 1)
+HEALTH_LABELS = ('Safe +', 'Safe', 'Warning', 'Danger')
+
+
+def grade_below(scores, thresholds=LETTER_THRESHOLDS, labels=LETTER_LABELS) -> np.ndarray:
+    """ Give every score the label of the first threshold it is below, or the last label
+    ================================================================
+    Works like an if/elif chain on `score < threshold`, so a missing score gets the last label.
+
+    Parameters:
+        scores: pd.Series or np.ndarray
+        thresholds: tuple
+            Defaults to (1, 2, 3)
+        labels: tuple
+            One more label than thresholds. Defaults to ('D', 'C', 'B', 'A')
+    """
+    if len(labels) != len(thresholds) + 1:
+        raise ValueError("labels must have one more item than thresholds")
+
+    scores = np.asarray(scores, dtype=float)
+
+    return np.select(
+        [scores < i for i in thresholds],
+        list(labels[:-1]),
+        default=labels[-1]
+    ).astype(object)
+
+
+def grade_above(scores, thresholds=HEALTH_THRESHOLDS, labels=HEALTH_LABELS) -> np.ndarray:
+    """ Give every score the label of the first threshold it is above, or the last label
+    ================================================================
+    Works like an if/elif chain on `score > threshold`, so a missing score gets the last label.
+
+    Parameters:
+        scores: pd.Series or np.ndarray
+        thresholds: tuple
+            Defaults to (3, 2, 1)
+        labels: tuple
+            One more label than thresholds. Defaults to ('Safe +', 'Safe', 'Warning', 'Danger')
+    """
+    if len(labels) != len(thresholds) + 1:
+        raise ValueError("labels must have one more item than thresholds")
+
+    scores = np.asarray(scores, dtype=float)
+
+    return np.select(
+        [scores > i for i in thresholds],
+        list(labels[:-1]),
+        default=labels[-1]
+    ).astype(object)
+
+
+def rank_letter(panel_data, score_column: str, rank_column: str, thresholds=LETTER_THRESHOLDS, labels=LETTER_LABELS) -> pd.DataFrame:
+    """ Add a letter grade (A/B/C/D) of a score column, e.g. score_profit -> rank_profit
+    ================================================================
+    Parameters:
+        panel_data: pd.DataFrame()
+        score_column: str
+        rank_column: str
+        thresholds: tuple
+        labels: tuple
+            See grade_below
+    """
+    panel_data[rank_column] = grade_below(panel_data[score_column], thresholds, labels)
+
+
+    return panel_data
+
+
+def rank_health(panel_data, score_column='score_health', rank_column='rank_health', thresholds=HEALTH_THRESHOLDS, labels=HEALTH_LABELS) -> pd.DataFrame:
+    """ Add a health label (Safe +/Safe/Warning/Danger) of a score column
+    ================================================================
+    Parameters:
+        panel_data: pd.DataFrame()
+        score_column: str
+            Defaults to 'score_health'
+        rank_column: str
+            Defaults to 'rank_health'
+        thresholds: tuple
+        labels: tuple
+            See grade_above
+    """
+    panel_data[rank_column] = grade_above(panel_data[score_column], thresholds, labels)
+
+
+    return panel_data
+
+
+if __name__ == '__main__':
+    print("Hello World")
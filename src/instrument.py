@@ -0,0 +1,244 @@
+import os
+import json
+import time
+import threading
+import functools
+import tracemalloc
+import datetime as dt
+from contextlib import contextmanager
+
+import pandas as pd
+
+
+# Reports being recorded, the stages of the scripts are added to the last one
+_active = []
+_lock = threading.Lock()
+
+
+def count_rows(value):
+    """ Number of rows of a result: a DataFrame, a list of them, or a list of tables to save (dicts with 'data')
+    ================================================================
+    Returns None when the value holds no table.
+    """
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return len(value)
+    if isinstance(value, dict):
+        value = list(value.values()) if 'data' not in value else [value['data']]
+    if isinstance(value, (list, tuple)):
+        counts = [count_rows(i) for i in value]
+        counts = [i for i in counts if i is not None]
+        return sum(counts) if counts else None
+
+    return None
+
+
+class RunReport:
+    """ Wall time, CPU time, rows and peak memory of every stage of a run, saved as JSON
+    ================================================================
+        run_report = instrument.RunReport("s3_ranking_insurance")
+        run_report.start()
+        with run_report.stage("read cache") as record:
+            df_is = cache_io.read_table("is_insurance", cache_dir)
+            record['rows_out'] = len(df_is)
+        run_report.stop()
+        run_report.save(report_dir)
+        print(run_report.summary())
+
+    Stages may be nested, and may run in several threads at once (e.g. the save callbacks of
+    sql_download.run_queries): the CPU time is the one of the thread running the stage.
+    With trace_memory, peak_mb is the largest memory traced by tracemalloc while the stage was open
+    (all threads together), which slows the allocations down a little.
+    With a profiler (profiling.Profiler), the run or the stages it selects are profiled as well.
+
+    Parameters:
+        name: str
+            Name of the run, e.g. the script
+        trace_memory: bool
+            Defaults to True
+        profiler: profiling.Profiler
+            Defaults to None
+    """
+
+    def __init__(self, name: str, trace_memory=True, profiler=None):
+        self.name = name
+        self.trace_memory = trace_memory
+        self.profiler = profiler
+        self.records = []
+        self.meta = {}
+        self._open = []
+        self._local = threading.local()
+        self._own_tracing = False
+        self._started = None
+
+    # ----------------------------------------------------------------
+    # Run
+    def start(self):
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._own_tracing = True
+        self._started = {
+            "at": dt.datetime.now(),
+            "wall": time.perf_counter(),
+            "cpu": time.process_time(),
+        }
+        self._total = {"peak": 0}
+        _active.append(self)
+        if self.profiler is not None:
+            self.profiler.start()
+
+        return self
+
+    def stop(self):
+        if self.profiler is not None:
+            self.profiler.stop()
+        self._checkpoint()
+        self.meta.update({
+            "wall_seconds": round(time.perf_counter() - self._started["wall"], 3),
+            "cpu_seconds": round(time.process_time() - self._started["cpu"], 3),
+            "peak_mb": self._mb(self._total["peak"]) if self.trace_memory else None,
+        })
+        if self._own_tracing:
+            tracemalloc.stop()
+            self._own_tracing = False
+        if self in _active:
+            _active.remove(self)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    # ----------------------------------------------------------------
+    # Stages
+    @staticmethod
+    def _mb(size):
+        return round(size/2**20, 1)
+
+    def _checkpoint(self):
+        """ Give the peak since the last checkpoint to every open stage, then start a new interval """
+        if not (self.trace_memory and tracemalloc.is_tracing()):
+            return
+        _, peak = tracemalloc.get_traced_memory()
+        for record in self._open:
+            record["_peak"] = max(record["_peak"], peak)
+        self._total["peak"] = max(self._total["peak"], peak)
+        tracemalloc.reset_peak()
+
+    @contextmanager
+    def stage(self, name: str, rows_in=None):
+        """ Record one stage; set record['rows_out'] (or 'rows_in') in the block """
+        stack = self._local.__dict__.setdefault("stack", [])
+        record = {
+            "stage": name,
+            "parent": stack[-1]["stage"] if stack else None,
+            "thread": threading.current_thread().name,
+            "rows_in": rows_in,
+            "rows_out": None,
+            "_peak": 0,
+        }
+        with _lock:
+            self._checkpoint()
+            current = tracemalloc.get_traced_memory()[0] if self.trace_memory and tracemalloc.is_tracing() else 0
+            self._open.append(record)
+        stack.append(record)
+
+        if self.profiler is not None:
+            self.profiler.enter(name)
+        start_wall, start_cpu = time.perf_counter(), time.thread_time()
+        try:
+            yield record
+        finally:
+            wall, cpu = time.perf_counter() - start_wall, time.thread_time() - start_cpu
+            if self.profiler is not None:
+                self.profiler.exit(name)
+            stack.pop()
+            with _lock:
+                self._checkpoint()
+                self._open.remove(record)
+                peak = record.pop("_peak")
+                record.update({
+                    "start_seconds": round(start_wall - self._started["wall"], 3),
+                    "wall_seconds": round(wall, 3),
+                    "cpu_seconds": round(cpu, 3),
+                    "memory_start_mb": self._mb(current) if self.trace_memory else None,
+                    "peak_mb": self._mb(peak) if self.trace_memory else None,
+                })
+                self.records.append(record)
+
+    # ----------------------------------------------------------------
+    # Output
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "started": self._started["at"].isoformat(timespec="seconds"),
+            **self.meta,
+            "stages": sorted(self.records, key=lambda i: i["start_seconds"]),
+        }
+
+    def save(self, report_dir: str) -> str:
+        """ Write the report to report_dir/<name>_<start>.json (to a temporary file first, then renamed) """
+        os.makedirs(report_dir, exist_ok=True)
+        path = os.path.join(report_dir, f"{self.name}_{self._started['at']:%Y%m%d_%H%M%S}.json")
+        tmp_path = path + ".tmp"
+        with open(tmp_path, mode="w", encoding="utf-8") as fp:
+            json.dump(self.to_dict(), fp, indent=4, default=str)
+        os.replace(tmp_path, path)
+
+
+        return path
+
+    def summary(self) -> pd.DataFrame:
+        """ One row per stage, in the order they started """
+        if not self.records:
+            return pd.DataFrame()
+
+        summary = pd.DataFrame(self.to_dict()["stages"])
+        summary["stage"] = [
+            ("- " if parent is not None else "") + stage
+            for stage, parent in zip(summary["stage"], summary["parent"])
+        ]
+        columns = ["stage", "wall_seconds", "cpu_seconds", "rows_in", "rows_out", "peak_mb"]
+
+        return summary[columns].set_index("stage")
+
+
+@contextmanager
+def stage(name: str, rows_in=None):
+    """ Record a stage in the report being recorded, if any (e.g. inside the ranking modules)
+    ================================================================
+    Parameters:
+        name: str
+        rows_in: int
+    """
+    if not _active:
+        yield {}
+        return
+
+    with _active[-1].stage(name, rows_in=rows_in) as record:
+        yield record
+
+
+def track(name=None):
+    """ Decorator recording every call of a function as a stage, with the rows of its inputs and result
+    ================================================================
+    Parameters:
+        name: str
+            Defaults to the name of the function
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name or func.__name__, rows_in=count_rows(list(args) + list(kwargs.values()))) as record:
+                result = func(*args, **kwargs)
+                record["rows_out"] = count_rows(result)
+
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+if __name__ == '__main__':
+    print("Hello World")
@@ -0,0 +1,124 @@
+import numpy as np
+import pandas as pd
+
+
+# Columns identifying a row of a panel
+KEYS = ['Symbol', 'Year', 'Quarter']
+
+# dtypes of the keys of a compact panel; Symbol is a category
+KEY_DTYPES = {
+    'Year': 'int16',
+    'Quarter': 'int8',
+}
+
+# Levels of the index of a panel: Symbol and period_code. In lower case, as Symbol, Year and Quarter
+# stay columns (groupby('Symbol') would be ambiguous otherwise)
+INDEX_NAMES = ['symbol', 'period']
+
+
+def compact(data: pd.DataFrame, value_dtype='float64') -> pd.DataFrame:
+    """ A statement panel with compact dtypes: one row per Symbol, Year, Quarter
+    ================================================================
+    - Symbol: category
+    - Year: int16, Quarter: int8 (see period_code for both in one number)
+    - Values (float columns): value_dtype
+
+    Only the columns whose dtype differs are converted, so a panel which is already compact
+    (e.g. read by cache_io.read_table) is returned as it is, without a copy.
+    The values are formatted as text only when they are written (see to_db_strings).
+
+    Parameters:
+        data: pd.DataFrame
+        value_dtype: str
+            'float64' (default) or 'float32', which halves the memory of the values;
+            the scores may then differ in the last digits
+    """
+    converted = {}
+    for col in data.columns:
+        dtype = data[col].dtype
+        if col == 'Symbol':
+            if not isinstance(dtype, pd.CategoricalDtype):
+                converted[col] = data[col].astype('category')
+        elif col in KEY_DTYPES:
+            if dtype != KEY_DTYPES[col]:
+                converted[col] = data[col].astype(KEY_DTYPES[col])
+        elif pd.api.types.is_float_dtype(dtype) and dtype != value_dtype:
+            converted[col] = data[col].astype(value_dtype)
+
+    if not converted:
+        return data
+
+    return data.assign(**converted)
+
+
+def period_code(data: pd.DataFrame) -> np.ndarray:
+    """ Year*4 + Quarter of every row as int16, so that consecutive quarters are consecutive numbers """
+    return data['Year'].to_numpy().astype('int16')*4 + data['Quarter'].to_numpy().astype('int16')
+
+
+def panel_index(data: pd.DataFrame) -> pd.MultiIndex:
+    """ (symbol, period) of every row """
+    return pd.MultiIndex.from_arrays(
+        [data['Symbol'].astype(str).to_numpy(), period_code(data)],
+        names=INDEX_NAMES
+    )
+
+
+def index_panel(data: pd.DataFrame) -> pd.DataFrame:
+    """ data indexed by (symbol, period) and sorted on it; returned as it is when it already is
+    ================================================================
+    Panels carrying this index are joined (see join) and assigned to each other by index alignment,
+    without rebuilding a hash table on Symbol, Year, Quarter every time.
+
+    Parameters:
+        data: pd.DataFrame
+            With Symbol, Year, Quarter columns
+    """
+    if list(data.index.names) == INDEX_NAMES and data.index.is_monotonic_increasing:
+        return data
+
+    data = data.set_axis(panel_index(data))
+    if not data.index.is_monotonic_increasing:
+        data = data.sort_index()
+
+
+    return data
+
+
+def join(left: pd.DataFrame, right: pd.DataFrame, how='inner') -> pd.DataFrame:
+    """ The columns of right added to the rows of left with the same Symbol, Year, Quarter
+    ================================================================
+    Same rows and columns as pd.merge(left, right, how=how, on=['Symbol', 'Year', 'Quarter']), but both
+    sides are aligned on their sorted (symbol, period) index (see index_panel), so joining panels which
+    already carry it is a single pass. The result carries the index too, and is sorted on it.
+
+    Parameters:
+        left, right: pd.DataFrame
+            With Symbol, Year, Quarter columns, and no other column in common
+        how: str
+            'inner' (default) or 'left'
+    """
+    right = index_panel(right)
+
+
+    return index_panel(left).join(right.drop(columns=[i for i in KEYS if i in right.columns]), how=how)
+
+
+def memory_mb(frames: list) -> float:
+    """ Memory of a list of data frames, text included """
+    return round(sum(i.memory_usage(index=True, deep=True).sum() for i in frames)/2**20, 1)
+
+
+def to_db_strings(data: pd.DataFrame) -> pd.DataFrame:
+    """ Every value as the text stored in the result tables, e.g. 2023 -> '2023', NaN -> 'nan'
+    ================================================================
+    The boundary with the database: the rows stay typed until they are written.
+
+    Parameters:
+        data: pd.DataFrame
+    """
+    return data.astype(str)
+
+
+if __name__ == '__main__':
+    print("Hello World")
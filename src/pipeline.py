@@ -0,0 +1,131 @@
+import time
+
+import pandas as pd
+
+from src import db_connection
+from src import db_diff
+from src import db_reader
+from src import db_writer
+from src import panel
+
+
+def save_result(conn, table: str, data: pd.DataFrame, now: str, columns=None, not_null=None, period_from=None, batch_size=1000, timer=None) -> dict:
+    """ Write the rows of a result table which are new or changed
+    ================================================================
+    The rows already in the table are read for the symbols of data only,
+    compared key by key (db_diff.diff_rows), and the differences are written.
+
+    Parameters:
+        conn: DB-API connection using the qmark paramstyle
+        table: str
+        data: pd.DataFrame
+            Result with Symbol, Year, Quarter first, without the Update column
+        now: str
+            Update day, e.g. "20230725"
+        columns: list
+            Column names in the database, in the same order as data.columns + ['Update'].
+            Defaults to None, which uses the columns of the table
+        not_null: list
+            Columns which must not be NULL in the rows of the same sector, e.g. ['score_lte']
+        period_from: tuple (Year, Quarter)
+            First period of data, so that the earlier rows are not read. Defaults to None
+        batch_size: int
+        timer: callable
+            timer(kind) returns a context manager timing the "read" and "write" of the table,
+            e.g. Database.timer(table). Defaults to None
+    Returns:
+        dict: number of inserted, updated and unchanged rows
+    """
+    if timer is None:
+        timer = db_connection.timer()
+
+    with timer("read"):
+        existing = db_reader.read_table(
+            conn=conn,
+            table=table,
+            symbols=data['Symbol'].unique(),
+            period_from=period_from,
+            not_null=not_null
+        )
+    if columns is None:
+        columns = existing.columns.to_list()
+
+    # Access keeps the case of the column names of the table (e.g. score_roe_sector)
+    lower_name = {i.lower(): i for i in data.columns}
+    existing = existing.rename(columns=lambda i: lower_name.get(i.lower(), i))
+
+    # Values are compared as text (db_diff.row_hash), but only the rows to write are converted
+    changes = db_diff.diff_rows(
+        data=data,
+        existing=existing,
+        value_columns=data.columns[3:].to_list()
+    )
+    for kind in ('insert', 'update'):
+        # Implement update day
+        changes[kind] = panel.to_db_strings(changes[kind])
+        changes[kind]['Update'] = now
+    with timer("write"):
+        counts = db_writer.write_changes(
+            conn=conn,
+            table=table,
+            changes=changes,
+            columns=columns,
+            batch_size=batch_size
+        )
+
+
+    return counts
+
+
+def _timed(func, kwargs: dict):
+    start = time.perf_counter()
+    result = func(**kwargs)
+
+    return result, time.perf_counter() - start
+
+
+def run_sectors(tasks: dict, max_workers=None, on_result=None) -> pd.DataFrame:
+    """ Run the ranking of several sectors at the same time, one process each
+    ================================================================
+    The functions must be importable (module level) and their inputs picklable.
+    Results come back to the calling process, so a single connection can write them all.
+
+    Parameters:
+        tasks: dict
+            {name: (func, kwargs)}, e.g. {"bank": (ranking_bank.rank, {"df_raw": df_raw})}
+        max_workers: int
+            Defaults to None, which starts one process per task
+        on_result: callable
+            on_result(name, result) is called in the calling process as soon as a sector has finished,
+            e.g. to write its tables while the other sectors are still running
+    Returns:
+        pd.DataFrame: name, seconds (spent in the worker), finished (since the start) of every sector,
+        in the order they finished
+    """
+    # Only the scripts running several sectors need the process pool
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    report = []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=max_workers or len(tasks)) as executor:
+        futures = {
+            executor.submit(_timed, func, kwargs): name
+            for name, (func, kwargs) in tasks.items()
+        }
+        for future in as_completed(futures):
+            name = futures[future]
+            result, seconds = future.result()
+            report.append({
+                "name": name,
+                "seconds": round(seconds, 2),
+                "finished": round(time.perf_counter() - start, 2),
+            })
+            if on_result is not None:
+                on_result(name, result)
+
+
+    return pd.DataFrame(report)
+
+
+if __name__ == '__main__':
+    print("Hello World")
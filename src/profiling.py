@@ -0,0 +1,219 @@
+import os
+import threading
+import datetime as dt
+
+
+class Profiler:
+    """ Profile of a whole run, or of some of its stages, saved as pstats and as collapsed stacks
+    ================================================================
+        profiler = profiling.Profiler("s4_ranking_securities", stages=['securities_health'])
+        run_report = instrument.RunReport("s4_ranking_securities", profiler=profiler).start()
+        ...
+        run_report.stop()
+        profiler.save(profile_dir)
+
+    Without stages the profiler runs from start() to stop(); with stages it only runs inside the
+    stages of the run report with these names (see instrument.RunReport.stage).
+    The .pstats file opens with pstats.Stats or snakeviz, the .collapsed file (one "a;b;c microseconds"
+    line per stack) with flamegraph.pl or speedscope, so nothing needs a display.
+
+    Only the thread creating the profiler is profiled: the stages running in other threads
+    (the save callbacks of s1_download_data.py) are not.
+
+    Parameters:
+        name: str
+            Name of the run, e.g. the script
+        engine: str
+            'cprofile' (default) or 'pyinstrument' (sampling, if installed)
+        stages: list of str
+            Names of the stages to profile. Defaults to None, the whole run
+        interval: float
+            Seconds between two samples of pyinstrument. Defaults to 0.001
+    """
+
+    def __init__(self, name: str, engine='cprofile', stages=None, interval=0.001):
+        if engine not in ('cprofile', 'pyinstrument'):
+            raise ValueError(f"Unknown profiling engine: {engine}")
+        self.name = name
+        self.engine = engine
+        self.stages = None if stages is None else set(stages)
+        self.interval = interval
+        self._thread = threading.get_ident()
+        self._depth = 0
+        self._started = None
+
+        # Imported here, as the scripts only profile with --profile
+        if engine == 'pyinstrument':
+            import pyinstrument
+            self._profile = pyinstrument.Profiler(interval=interval)
+        else:
+            import cProfile
+            self._profile = cProfile.Profile()
+
+    # ----------------------------------------------------------------
+    # Run
+    def _enable(self):
+        if self.engine == 'pyinstrument':
+            self._profile.start()
+        else:
+            self._profile.enable()
+
+    def _disable(self):
+        if self.engine == 'pyinstrument':
+            self._profile.stop()
+        else:
+            self._profile.disable()
+
+    def start(self):
+        self._started = dt.datetime.now()
+        if self.stages is None:
+            self._enable()
+
+        return self
+
+    def stop(self):
+        if self.stages is None:
+            self._disable()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def enter(self, stage: str):
+        """ Called when a stage starts: profile it if it is one of self.stages """
+        if self.stages is None or stage not in self.stages or threading.get_ident() != self._thread:
+            return
+        self._depth += 1
+        if self._depth == 1:
+            self._enable()
+
+    def exit(self, stage: str):
+        """ Called when a stage ends """
+        if self.stages is None or stage not in self.stages or threading.get_ident() != self._thread:
+            return
+        self._depth -= 1
+        if self._depth == 0:
+            self._disable()
+
+    # ----------------------------------------------------------------
+    # Output
+    def save(self, profile_dir: str) -> list:
+        """ Write profile_dir/<name>_<start>.pstats and .collapsed, returns their paths """
+        os.makedirs(profile_dir, exist_ok=True)
+        started = self._started or dt.datetime.now()
+        path = os.path.join(profile_dir, f"{self.name}_{started:%Y%m%d_%H%M%S}")
+
+        if self.engine == 'pyinstrument':
+            from pyinstrument.renderers import PstatsRenderer
+            session = self._profile.last_session
+            if session is None:
+                print("Profile: no stage was profiled")
+                return []
+            data = PstatsRenderer().render(session)
+            with open(path + ".pstats", mode="wb" if isinstance(data, bytes) else "w") as fp:
+                fp.write(data)
+            stacks = frame_stacks(session.root_frame())
+        else:
+            import pstats
+            self._profile.create_stats()
+            if not self._profile.stats:
+                print("Profile: no stage was profiled")
+                return []
+            self._profile.dump_stats(path + ".pstats")
+            stacks = collapsed_stacks(pstats.Stats(self._profile))
+
+        write_collapsed(stacks, path + ".collapsed")
+
+
+        return [path + ".pstats", path + ".collapsed"]
+
+
+def label(func: tuple) -> str:
+    """ Name of a function of pstats, e.g. 'health (ranking_securities.py:95)' """
+    file_name, line, name = func
+    if file_name == '~':
+        # Built-in functions, e.g. "<method 'sort' of 'list' objects>"
+        return name.replace(';', ',')
+
+    return f"{name} ({os.path.basename(file_name)}:{line})".replace(';', ',')
+
+
+def collapsed_stacks(stats, min_seconds=1e-3) -> dict:
+    """ Own time of every call stack, rebuilt from the caller -> callee times of cProfile
+    ================================================================
+    cProfile keeps the time of every (caller, callee) pair, not of every stack: the time of a callee
+    is split between the stacks of its caller in proportion of the caller's time in each of them.
+    Recursive calls are cut, and the callees of a stack under min_seconds are not split any further
+    (their time is given to the stack), which keeps the file small.
+
+    Parameters:
+        stats: pstats.Stats
+        min_seconds: float
+            Defaults to 1e-3
+    Returns:
+        dict: {"a;b;c": seconds}
+    """
+    entries = stats.stats
+    callees = {}
+    for func, (_, _, _, _, callers) in entries.items():
+        for caller in callers:
+            callees.setdefault(caller, []).append(func)
+
+    stacks = {}
+
+    def add(stack, seconds):
+        key = ";".join(stack)
+        stacks[key] = stacks.get(key, 0) + seconds
+
+    def walk(func, stack, path, share):
+        _, _, own_time, _, _ = entries[func]
+        stack = stack + [label(func)]
+        add(stack, own_time*share)
+
+        for callee in callees.get(func, []):
+            if callee in path:
+                continue
+            callee_cum = entries[callee][3]
+            edge_cum = entries[callee][4][func][3]*share
+            if callee_cum <= 0 or edge_cum <= 0:
+                continue
+            if edge_cum < min_seconds:
+                add(stack + [label(callee)], edge_cum)
+            else:
+                walk(callee, stack, path | {callee}, edge_cum/callee_cum)
+
+    roots = [func for func, entry in entries.items() if not any(caller in entries for caller in entry[4])]
+    for func in roots:
+        walk(func, [], {func}, 1.0)
+
+
+    return stacks
+
+
+def frame_stacks(frame, stack=None, stacks=None) -> dict:
+    """ Own time of every call stack of a pyinstrument session, {"a;b;c": seconds} """
+    stack = (stack or []) + [f"{frame.function} ({os.path.basename(frame.file_path or '')}:{frame.line_no})".replace(';', ',')]
+    stacks = {} if stacks is None else stacks
+    own_time = frame.time - sum(child.time for child in frame.children)
+    if own_time > 0:
+        key = ";".join(stack)
+        stacks[key] = stacks.get(key, 0) + own_time
+    for child in frame.children:
+        frame_stacks(child, stack, stacks)
+
+
+    return stacks
+
+
+def write_collapsed(stacks: dict, path: str):
+    """ One "a;b;c microseconds" line per stack, the input of flamegraph.pl and speedscope """
+    with open(path, mode="w", encoding="utf-8") as fp:
+        for key, seconds in sorted(stacks.items()):
+            if round(seconds*1e6) > 0:
+                fp.write(f"{key} {round(seconds*1e6)}\n")
+
+
+if __name__ == '__main__':
+    print("Hello World")
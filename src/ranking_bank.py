@@ -0,0 +1,94 @@
+import pandas as pd
+import numpy as np
+
+from src import dirty_periods
+from src import grading
+
+
+# Columns of ptsp_stock_fundamental_score used by the banking sector
+RAW_COLUMNS = [
+    'Symbol', 'Year', 'Quarter', 'score_ROE_sector',
+    'score_ROA_sector', 'score_NIM_sector', 'score_profit', 'rank_profit',
+    'z_LoanProvisionRatio', 'z_Deposit2Loan', 'z_NPL_ratio_inv',
+    'z_NPL_coverage', 'score_health', 'rank_health',
+    'score_EPS_above_average', 'score_EPS_growth', 'score_EPS_above_sector',
+    'score_EPS_above_group', 'score_growth', 'rank_growth', 'score_PE_5Y',
+    'score_PB_5Y', 'score_PE_sector', 'score_PB_sector', 'score_valuation',
+    'rank_valuation', 'score_final', 'rank_final', 'Update'
+]
+
+# Columns of ptsp_stock_fundamental_score_financial, in the order of the result
+COL_FINAL = [
+    'Symbol', 'Year', 'Quarter', 'score_roe_sector', 'score_roa_sector', 'score_nim_sector',
+    'score_profit', 'rank_profit', 'z_LoanProvisionRatio', 'z_Deposit2Loan', 'z_NPL_ratio_inv',
+    'z_NPL_coverage', 'score_health', 'rank_health', 'score_EPS_above_average', 'score_EPS_growth',
+    'score_EPS_above_sector', 'score_EPS_above_group', 'score_growth', 'rank_growth', 'score_PE_5Y',
+    'score_PB_5Y', 'score_PE_sector', 'score_PB_sector', 'score_valuation', 'rank_valuation',
+    'score_final', 'rank_final', 'update'
+]
+
+# Number of following quarters whose scores depend on a quarter: none, every score uses its own quarter only
+LOOKBACK = 0
+
+
+def rank(df_raw: pd.DataFrame, periods=None) -> list:
+    """ Ranking: Banking Sector
+    ================================================================
+    The profit score is calculated again from the sector scores (ROE, ROA, NIM),
+    the other scores are kept from ptsp_stock_fundamental_score.
+
+    Parameters:
+        df_raw: pd.DataFrame
+            Rows of ptsp_stock_fundamental_score of the banks, columns RAW_COLUMNS
+        periods: list of (Year, Quarter)
+            Only score these periods (see dirty_periods). Defaults to None (every period)
+    Returns:
+        list of dict: the tables to save, as keyword arguments of pipeline.save_result
+    """
+    df_bank = dirty_periods.select_periods(df_raw, periods).copy()
+
+    # Change type of data
+    df_bank[[
+        'score_ROE_sector', 'score_ROA_sector', 'score_NIM_sector', 'score_profit',
+        'z_LoanProvisionRatio', 'z_Deposit2Loan', 'z_NPL_ratio_inv',
+        'z_NPL_coverage', 'score_health', 'score_EPS_above_average',
+        'score_EPS_growth', 'score_EPS_above_sector', 'score_EPS_above_group',
+        'score_growth', 'score_PE_5Y', 'score_PB_5Y', 'score_PE_sector',
+        'score_PB_sector', 'score_valuation', 'score_final'
+    ]] = df_bank[[
+        'score_ROE_sector', 'score_ROA_sector', 'score_NIM_sector', 'score_profit',
+        'z_LoanProvisionRatio', 'z_Deposit2Loan', 'z_NPL_ratio_inv',
+        'z_NPL_coverage', 'score_health', 'score_EPS_above_average',
+        'score_EPS_growth', 'score_EPS_above_sector', 'score_EPS_above_group',
+        'score_growth', 'score_PE_5Y', 'score_PB_5Y', 'score_PE_sector',
+        'score_PB_sector', 'score_valuation', 'score_final'
+    ]].astype(float)
+
+    # Calculate score_profit
+    df_bank['score_profit'] = round((df_bank['score_ROE_sector'] + df_bank['score_ROA_sector'] + df_bank['score_NIM_sector'])*4/3,2)
+
+    # Ranking based on score_profit
+    df_bank = grading.rank_letter(df_bank, 'score_profit', 'rank_profit')
+
+    # Calculate score_final
+    df_bank['score_final'] = round(np.mean(df_bank[['score_profit', 'score_health', 'score_growth', 'score_valuation']], axis=1),2)
+
+    # Ranking based on score_final
+    df_bank = grading.rank_letter(df_bank, 'score_final', 'rank_final')
+
+    # Assign variable for selected columns
+    select_column = df_bank.columns[:-1].to_list()
+
+
+    return [
+        {
+            'table': "ptsp_stock_fundamental_score_financial",
+            'data': df_bank[select_column],
+            'columns': COL_FINAL,
+            'period_from': min(periods) if periods else None,
+        },
+    ]
+
+
+if __name__ == '__main__':
+    print("Hello World")
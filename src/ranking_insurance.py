@@ -0,0 +1,423 @@
+import pandas as pd
+import numpy as np
+
+from src import functions_insurance as fi
+from src import dirty_periods
+from src import grading
+from src import panel
+from src import rolling_state
+from src import stage_cache
+
+
+# Columns of ptsp_stock_fundamental_score used to get the growth and valuation scores
+RAW_COLUMNS = [
+    'Symbol', 'Year', 'Quarter', 'score_EPS_above_average',
+    'score_EPS_growth', 'score_EPS_above_sector',
+    'score_EPS_above_group', 'score_growth', 'rank_growth',
+    'score_PE_5Y', 'score_PB_5Y', 'score_PE_sector',
+    'score_PB_sector', 'score_valuation', 'rank_valuation',
+    'score_final', 'rank_final', 'Update'
+]
+
+# Columns of ptsp_stock_fundamental_score_financial, in the order of the result
+COL_FINAL = [
+    'Symbol', 'Year', 'Quarter', 'score_roe_sector', 'score_roa_sector', 'score_combined_ratio_sector',
+    'score_profit', 'rank_profit', 'score_npw2equity', 'score_net_leverage', 'score_grossreserve2equity',
+    'score_npw2gpw', 'score_health', 'rank_health', 'score_EPS_above_average', 'score_EPS_growth',
+    'score_EPS_above_sector', 'score_EPS_above_group', 'score_growth', 'rank_growth', 'score_PE_5Y',
+    'score_PB_5Y', 'score_PE_sector', 'score_PB_sector', 'score_valuation', 'rank_valuation',
+    'score_final', 'rank_final', 'update'
+]
+
+# Number of following quarters whose scores depend on a quarter: the TTM sums and the averages with the quarter a year before
+LOOKBACK = 4
+
+
+def preprocess(df_bs: pd.DataFrame, df_is: pd.DataFrame) -> tuple:
+    """ Drop the yearly rows, fill the missing values and sort the statements of the insurance sector
+    ================================================================
+    Parameters:
+        df_bs: pd.DataFrame
+            Balance sheet (cache: bs_insurance)
+        df_is: pd.DataFrame
+            Income statement (cache: is_insurance)
+    Returns:
+        tuple: df_bs, df_is
+    """
+    df_is = df_is.loc[df_is['Quarter'] != 0]
+    df_bs = df_bs.loc[df_bs['Quarter'] != 0]
+    df_is = df_is.fillna(0)
+    df_bs = df_bs.fillna(0)
+
+    # Sort data
+    df_bs = df_bs.sort_values(by=['Symbol', 'Year', 'Quarter'], ascending=[True, True, True])
+    df_is = df_is.sort_values(by=['Symbol', 'Year', 'Quarter'], ascending=[True, True, True])
+
+
+    return df_bs, df_is
+
+
+def income_ratios(df_is: pd.DataFrame, net_revenue: pd.DataFrame, window=4, state_dir=None, rebuild_state=False) -> pd.DataFrame:
+    """ Income statement with the net revenue from VND and the combined ratio (TTM)
+    ================================================================
+    Parameters:
+        df_is: pd.DataFrame
+            Output of preprocess
+        net_revenue: pd.DataFrame
+            Symbol, Year, Quarter, Revenues (VND's income statement)
+        window: int
+            Number of quarters of the TTM sums. Defaults to 4
+        state_dir, rebuild_state:
+            See rank
+    """
+    # Merge Net Revenue to Income Statement
+    df_is = panel.join(df_is, net_revenue)
+
+    # - Combined Ratio (TTM)
+    df_is = fi.combined_ratio_ttm(panel_data=df_is, window=window, state_dir=state_dir, rebuild=rebuild_state)
+    df_is.fillna(0, inplace=True)
+
+
+    return df_is
+
+
+def profit(df_bs: pd.DataFrame, df_is: pd.DataFrame, periods=None, window=4, state_dir=None, rebuild_state=False) -> pd.DataFrame:
+    """ Profit rank: ROE, ROA and Combined Ratio compared with the sector
+    ================================================================
+    Parameters:
+        df_bs: pd.DataFrame
+            Balance sheet with the ceded reserves
+        df_is: pd.DataFrame
+            Output of income_ratios
+        periods: list of (Year, Quarter)
+            See rank
+        window: int
+            Number of quarters of the TTM net income. Defaults to 4
+        state_dir, rebuild_state:
+            See rank
+    """
+    # Merge balance sheet and income statement
+    df_profit = panel.join(
+        df_bs[['Symbol', 'Year', 'Quarter', 'Equity', 'Assets']],
+        df_is[['Symbol', 'Year', 'Quarter', 'NetIncome2', 'combined_ratio_ttm']]
+    )
+
+    #### 2.1.1 Calculate ratios
+    # Same quarter a year before, aligned on the index
+    year_before = df_profit.groupby('Symbol')[['Equity', 'Assets']].shift(4)
+    df_profit['Equity_m'] = year_before['Equity']
+    df_profit['Assets_m'] = year_before['Assets']
+
+    df_profit['Equity_m'] = df_profit[['Equity', 'Equity_m']].mean(axis=1)
+    df_profit['Assets_m'] = df_profit[['Assets', 'Assets_m']].mean(axis=1)
+
+    df_profit['NetIncome2_ttm'] = rolling_state.rolling_stats(
+        df_profit, 'NetIncome2', window,
+        state_dir=state_dir, name='insurance_NetIncome2', rebuild=rebuild_state
+    )['sum']
+
+    df_profit['ROE_ttm'] = df_profit['NetIncome2_ttm']/df_profit['Equity_m']
+    df_profit['ROA_ttm'] = df_profit['NetIncome2_ttm']/df_profit['Assets_m']
+
+    # The scores below compare the stocks of the same period only
+    df_profit = dirty_periods.select_periods(df_profit, periods)
+    df_is = dirty_periods.select_periods(df_is, periods)
+
+    #### 2.1.2 Calculate ratios of the Insurance sector
+    # Sector totals of every period, broadcast to the stocks of the period
+    # # Median approach
+    df_sector = df_profit.groupby(["Year", "Quarter"])[["NetIncome2_ttm", "Equity_m", "Assets_m"]].transform("sum")
+    df_profit['ROE_sector_ttm'] = df_sector['NetIncome2_ttm']/df_sector['Equity_m']
+    df_profit['ROA_sector_ttm'] = df_sector['NetIncome2_ttm']/df_sector['Assets_m']
+    df_profit['combined_ratio_sector_ttm_median'] = df_profit.groupby(["Year", "Quarter"])['combined_ratio_ttm'].transform("median")
+
+    # # Average approach: from the income statement, aligned on the index
+    df_sector_avg_a = df_is.groupby(["Year", "Quarter"])[["incurred_losses_ttm", "expenses_ttm", "revenues_ttm"]].transform("sum")
+    df_profit['combined_ratio_sector_ttm_avg'] = (df_sector_avg_a['incurred_losses_ttm']+df_sector_avg_a['expenses_ttm'])/df_sector_avg_a['revenues_ttm']
+
+    #### 2.1.3 Scoring profit criteria
+    # Rank based on median approach (No use average approach)
+    """
+    If you want to use average approach instead of median approach.
+    Replace combined_ratio_sector_ttm_median by combined_ratio_sector_ttm_avg
+    """
+    df_profit['score_roe_sector'] = np.where(df_profit['ROE_ttm'] > df_profit['ROE_sector_ttm'], 1, 0)
+    df_profit['score_roa_sector'] = np.where(df_profit['ROA_ttm'] > df_profit['ROA_sector_ttm'], 1, 0)
+    df_profit['score_combined_ratio_sector'] = np.where(df_profit['combined_ratio_ttm'] < df_profit['combined_ratio_sector_ttm_median'], 1, 0)
+    df_profit['score_profit'] = round((df_profit['score_roe_sector']+df_profit['score_roa_sector']+df_profit['score_combined_ratio_sector'])*4/3,2)
+
+    # Ranking based on score_profit
+    df_profit = grading.rank_letter(df_profit, 'score_profit', 'rank_profit')
+    df_profit.sort_values(
+        by=['Symbol', 'Year', 'Quarter'],
+        ascending=[True, True, True],
+        inplace=True
+    )
+
+
+    return df_profit
+
+
+def health(df_bs: pd.DataFrame, df_is: pd.DataFrame, periods=None) -> pd.DataFrame:
+    """ Health rank: NPW to Equity, Net Leverage, Gross Reserve to Equity, NPW to GPW
+    ================================================================
+    Parameters:
+        df_bs: pd.DataFrame
+            Balance sheet with the ceded reserves
+        df_is: pd.DataFrame
+            Output of income_ratios
+        periods: list of (Year, Quarter)
+            See rank
+    """
+    #### 2.2.1 Calculate ratios
+    df_health = panel.join(
+        df_is[['Symbol', 'Year', 'Quarter', 'GrossPremiumWritten','NetPremiumWritten']],
+        df_bs[['Symbol', 'Year', 'Quarter', 'Equity', 'Provisions', 'CededReserves']]
+    )
+    # The scores below compare the stocks of the same period only
+    df_health = dirty_periods.select_periods(df_health, periods)
+    df_health.sort_values(
+        by=['Symbol', 'Year', 'Quarter'],
+        ascending=[True, True, True],
+        inplace=True
+    )
+
+    # Calculate ratios
+    df_health['npw_to_equity'] = df_health['NetPremiumWritten']/df_health['Equity']
+    df_health['net_leverage'] = (df_health['NetPremiumWritten'] + df_health['Provisions'] - df_health['CededReserves'])/df_health['Equity']
+    df_health['gross_reserves_to_equity'] = df_health['Provisions']/df_health['Equity']
+    df_health['npw_gpw']= df_health['NetPremiumWritten']/df_health['GrossPremiumWritten']
+
+    #### 2.2.3 Scoring health criteria by using functions
+    df_health = fi.npw_to_equity_score(
+        panel_data=df_health
+    )
+    df_health = fi.net_leverage_score(
+        panel_data=df_health
+    )
+    df_health = fi.gross_reserves_to_equity_score(
+        panel_data=df_health
+    )
+    df_health = fi.npw_gpw_score(
+        panel_data=df_health
+    )
+    df_health['score_health'] = round(
+        number=np.mean(
+            df_health[[
+                'score_npw2equity', 'score_net_leverage',
+                'score_grossreserve2equity', 'score_npw2gpw'
+            ]],
+            axis=1
+        ),
+        ndigits=2
+    )
+
+    # Rankiing based on score_health
+    df_health = grading.rank_health(df_health)
+
+
+    return df_health
+
+
+def final(df_profit: pd.DataFrame, df_health: pd.DataFrame, df_raw: pd.DataFrame) -> pd.DataFrame:
+    """ Final rank: the profit and health ranks with the current growth and valuation ranks
+    ================================================================
+    Parameters:
+        df_profit: pd.DataFrame
+            Output of profit
+        df_health: pd.DataFrame
+            Output of health
+        df_raw: pd.DataFrame
+            See rank
+    Returns:
+        pd.DataFrame: the rows of ptsp_stock_fundamental_score_financial, without the Update column
+    """
+    # Create df_final by merging df_profit and df_health
+    df_final = panel.join(
+        df_profit[[
+            'Symbol', 'Year', 'Quarter',
+            'score_roe_sector', 'score_roa_sector', 'score_combined_ratio_sector',
+            'score_profit', 'rank_profit'
+        ]],
+        df_health[[
+            'Symbol', 'Year', 'Quarter',
+            'score_npw2equity', 'score_net_leverage',
+            'score_grossreserve2equity', 'score_npw2gpw',
+            'score_health', 'rank_health'
+        ]]
+    )
+
+    ### 3.2 Merge the current growth and valuation ranks
+    df_raw = df_raw.copy()
+    df_raw[['Year', 'Quarter']] = df_raw[['Year', 'Quarter']].astype(int)
+
+    df_final = panel.join(df_final, df_raw[RAW_COLUMNS])
+
+    # Change type of data in order to calculate
+    list_col = [
+        'score_roe_sector',
+        'score_roa_sector',
+        'score_combined_ratio_sector',
+        'score_profit',
+        'score_npw2equity',
+        'score_net_leverage',
+        'score_grossreserve2equity',
+        'score_npw2gpw',
+        'score_health',
+        'score_EPS_above_average',
+        'score_EPS_growth',
+        'score_EPS_above_sector',
+        'score_EPS_above_group',
+        'score_growth',
+        'score_PE_5Y',
+        'score_PB_5Y',
+        'score_PE_sector',
+        'score_PB_sector',
+        'score_valuation',
+    ]
+
+    for i in list_col:
+        df_final[i] = df_final[i].astype(float)
+
+    ### 3.3 Calculate Final Score
+    df_final['score_final'] = round(
+        number=np.mean(
+            df_final[[
+                'score_profit',
+                'score_health',
+                'score_growth',
+                'score_valuation'
+            ]],
+            axis=1
+        ),
+        ndigits=2
+    )
+
+    # Ranking based on score_final
+    df_final = grading.rank_letter(df_final, 'score_final', 'rank_final')
+
+    # Assign variable for selected columns
+    select_column_final = df_final.columns[:-1].to_list()
+
+
+    return df_final[select_column_final]
+
+
+def rank(df_bs: pd.DataFrame, df_is: pd.DataFrame, ceded_reserves: pd.DataFrame, net_revenue: pd.DataFrame, df_raw: pd.DataFrame, state_dir=None, rebuild_state=False, periods=None, cache=None) -> list:
+    """ Ranking: Insurance Sector
+    ================================================================
+    Profit: ROE, ROA, Combined Ratio
+    Health: Net Premium Written to Equity, Net Leverage,
+        Gross Reserve to Equity, Net Premium Written to Gross Premium Written
+
+    Parameters:
+        df_bs, df_is: pd.DataFrame
+            Output of preprocess
+        ceded_reserves: pd.DataFrame
+            Symbol, Year, Quarter, CededReserves (VND's balance sheet)
+        net_revenue: pd.DataFrame
+            Symbol, Year, Quarter, Revenues (VND's income statement)
+        df_raw: pd.DataFrame
+            Rows of ptsp_stock_fundamental_score of the insurers, columns RAW_COLUMNS
+        state_dir: str
+            Folder of the rolling states (TTM, 8Q, 12Q windows) kept between runs.
+            Defaults to None, which calculates the windows from the whole history
+        rebuild_state: bool
+            Rebuild the rolling states from the whole history. Defaults to False
+        periods: list of (Year, Quarter)
+            Only score these periods (see dirty_periods). The rolling windows still use the whole history,
+            and the rolling states append again the symbols whose past quarters changed, so the windows
+            of a restated quarter and of the LOOKBACK quarters after it are new. Defaults to None (every period)
+        cache: stage_cache.StageCache
+            Re-use the stages (income ratios, profit, health, final) whose inputs have not changed.
+            Defaults to None
+    Returns:
+        list of dict: the tables to save, as keyword arguments of pipeline.save_result
+    """
+    # Merge Ceded_reserves to Balance Sheet
+    df_bs = panel.join(df_bs, ceded_reserves)
+
+    ## 1. Income statement: Net Revenue, Combined Ratio (TTM)
+    df_is = stage_cache.run(
+        cache, 'insurance_income_ratios', income_ratios,
+        df_is=df_is, net_revenue=net_revenue, window=4,
+        state_dir=state_dir, rebuild_state=rebuild_state
+    )
+
+    ## 2. Process data for Ranking
+    ### 2.1 Profit Rank
+    df_profit = stage_cache.run(
+        cache, 'insurance_profit', profit,
+        df_bs=df_bs, df_is=df_is, periods=periods, window=4,
+        state_dir=state_dir, rebuild_state=rebuild_state
+    )
+
+    ### 2.2 Health Rank
+    df_health = stage_cache.run(
+        cache, 'insurance_health', health,
+        df_bs=df_bs, df_is=df_is, periods=periods
+    )
+
+    ## 3. Merge data
+    ### 3.1 Final rank
+    df_final = stage_cache.run(
+        cache, 'insurance_final', final,
+        df_profit=df_profit, df_health=df_health, df_raw=df_raw
+    )
+
+    ### 3.2 Merge profit & health
+    # Merge data with aming at saving data to stock_financial_ratio_insurance
+    df_sfri = panel.join(
+        df_profit[[
+            'Symbol', 'Year', 'Quarter',
+            'combined_ratio_ttm'
+        ]],
+        df_health[[
+            'Symbol', 'Year', 'Quarter',
+            'npw_to_equity', 'net_leverage',
+            'gross_reserves_to_equity', 'npw_gpw'
+        ]]
+    )
+
+    # Assign variable for selected coloumns
+    select_column = [
+        'Symbol',
+        'Year',
+        'Quarter',
+        'incurred_losses_ttm',
+        'expenses_ttm',
+        'revenues_ttm'
+    ]
+    select_column_ratio = [
+        'Symbol', 'Year', 'Quarter',
+        'combined_ratio_ttm', 'npw_to_equity',
+        'net_leverage', 'gross_reserves_to_equity', 'npw_gpw'
+    ]
+
+    # Only the rows from the first scored period on are compared with the database
+    period_from = min(periods) if periods else None
+
+
+    return [
+        {
+            'table': "income_statement_insurance",
+            'data': dirty_periods.select_periods(df_is, periods)[select_column],
+            'period_from': period_from,
+        },
+        {
+            'table': "stock_financial_ratio_insurance",
+            'data': df_sfri[select_column_ratio],
+            'period_from': period_from,
+        },
+        {
+            'table': "ptsp_stock_fundamental_score_financial",
+            'data': df_final,
+            'columns': COL_FINAL,
+            'not_null': ['score_combined_ratio_sector'],
+            'period_from': period_from,
+        },
+    ]
+
+
+if __name__ == '__main__':
+    print("Hello World")
@@ -0,0 +1,413 @@
+import pandas as pd
+import numpy as np
+
+from src import functions_securities as fs
+from src import dirty_periods
+from src import grading
+from src import panel
+from src import rolling_state
+from src import stage_cache
+
+
+# Columns of ptsp_stock_fundamental_score used to get the growth and valuation scores
+RAW_COLUMNS = [
+    'Symbol', 'Year', 'Quarter',
+    'score_EPS_above_average', 'score_EPS_growth',
+    'score_EPS_above_sector', 'score_EPS_above_group',
+    'score_growth', 'rank_growth',
+    'score_PE_5Y', 'score_PB_5Y',
+    'score_PE_sector', 'score_PB_sector',
+    'score_valuation', 'rank_valuation',
+    'score_final', 'rank_final',
+    'Update'
+]
+
+# Columns of ptsp_stock_fundamental_score_financial, in the order of the result
+COL_FINAL = [
+    'Symbol', 'Year', 'Quarter', 'score_roe_sector', 'score_roa_sector', 'score_nim_sector',
+    'score_profit', 'rank_profit', 'score_lte', 'score_dte', 'score_diversified_sale',
+    'score_coef_variation', 'score_health', 'rank_health', 'score_EPS_above_average', 'score_EPS_growth',
+    'score_EPS_above_sector', 'score_EPS_above_group', 'score_growth', 'rank_growth', 'score_PE_5Y',
+    'score_PB_5Y', 'score_PE_sector', 'score_PB_sector', 'score_valuation', 'rank_valuation',
+    'score_final', 'rank_final', 'update'
+]
+
+# Number of following quarters whose scores depend on a quarter: the 12-quarter coefficient of variation of FVTPL
+LOOKBACK = 11
+
+# Lines of sales whose share is scored for diversification
+SALES_LINES = [
+    'IncomeFVTPL', 'IncomeHTM',
+    'IncomeLoansReceivables', 'IncomeAFS',
+    'IncomeDerivatives', 'RevenueBrokerageServices',
+    'RevenueUnderwritingIssuuanceServices', 'RevenueAdvisoryServices',
+    'RevenueAuctionTrustServices', 'RevenueCustodyServices',
+    'OtherRevenues'
+]
+SHARE_COLUMNS = [f"{i}_%" for i in SALES_LINES]
+
+
+def preprocess(df_is: pd.DataFrame, df_bs: pd.DataFrame) -> tuple:
+    """ Drop the yearly rows and fill the missing values of the statements of the securities sector
+    ================================================================
+    Parameters:
+        df_is: pd.DataFrame
+            Income statement (cache: is_securities)
+        df_bs: pd.DataFrame
+            Balance sheet (cache: bs_securities)
+    Returns:
+        tuple: df_is, df_bs
+    """
+    df_is = df_is.loc[df_is['Quarter'] != 0]
+    df_bs = df_bs.loc[df_bs['Quarter'] != 0]
+    df_is = df_is.fillna(0)
+    df_bs = df_bs.fillna(0)
+
+
+    return df_is, df_bs
+
+
+def profit(df_bs: pd.DataFrame, df_is: pd.DataFrame, periods=None, window=4, state_dir=None, rebuild_state=False) -> pd.DataFrame:
+    """ Profit rank: ROE, ROA and NIM compared with the sector
+    ================================================================
+    Parameters:
+        df_bs, df_is: pd.DataFrame
+            Balance sheet, and income statement with the provision for losses, sorted by Symbol, Year, Quarter
+        periods: list of (Year, Quarter)
+            See rank
+        window: int
+            Number of quarters of the TTM net income. Defaults to 4
+        state_dir, rebuild_state:
+            See rank
+    """
+    # Get the suitable columns from the balance sheet and the income statement
+    df_profit = panel.join(
+        df_bs[[
+            'Symbol', 'Year', 'Quarter', 'Assets', 'Equity', 'Loans'
+        ]],
+        df_is[[
+            'Symbol', 'Year', 'Quarter', 'IncomeLoansReceivables',
+            'InterestExpenses', 'ProvisionForLosses', 'NetIncome2'
+        ]]
+    )
+
+    #### 2.1.1 Calculate ratios
+    # Calculate ratios of Individual Stocks
+    # Same quarter a year before, aligned on the index
+    year_before = df_profit.groupby('Symbol')[['Equity', 'Assets']].shift(4)
+    df_profit['Equity_m'] = year_before['Equity']
+    df_profit['Assets_m'] = year_before['Assets']
+
+    df_profit['NetIncome2_ttm'] = rolling_state.rolling_stats(
+        df_profit, 'NetIncome2', window,
+        state_dir=state_dir, name='securities_NetIncome2', rebuild=rebuild_state
+    )['sum']
+
+    df_profit['Equity_m'] = df_profit[['Equity', 'Equity_m']].mean(axis=1)
+    df_profit['Assets_m'] = df_profit[['Assets_m', 'Assets_m']].mean(axis=1)
+
+    df_profit['ROE_ttm'] = df_profit['NetIncome2_ttm']/df_profit['Equity_m']
+    df_profit['ROA_ttm'] = df_profit['NetIncome2_ttm']/df_profit['Assets_m']
+    df_profit['nim_securities'] = (df_profit['IncomeLoansReceivables'] - df_profit['InterestExpenses'] - df_profit['ProvisionForLosses'])/df_profit['Loans']
+
+    # The scores below compare the stocks of the same period only
+    df_profit = dirty_periods.select_periods(df_profit, periods)
+
+    # Calculate ratios of the securities sector: totals of every period, broadcast to the stocks of the period
+    df_sector = df_profit.groupby(["Year", "Quarter"])[[
+        "NetIncome2", "Equity_m", "Assets_m", "IncomeLoansReceivables",
+        "InterestExpenses", "ProvisionForLosses", "Loans"
+    ]].transform("sum")
+
+    df_profit['ROE_sector_ttm'] = df_sector['NetIncome2']/df_sector['Equity_m']
+    df_profit['ROA_sector_ttm'] = df_sector['NetIncome2']/df_sector['Assets_m']
+    df_profit['NIM_sector_securities'] = (
+        df_sector['IncomeLoansReceivables']-df_sector['InterestExpenses'] -
+        df_sector['ProvisionForLosses'])/df_sector['Loans']
+
+    #### 2.1.2 Scoring profit criteria
+    df_profit['score_roe_sector'] = np.where(df_profit['ROE_ttm'] > df_profit['ROE_sector_ttm'], 1, 0)
+    df_profit['score_roa_sector'] = np.where(df_profit['ROA_ttm'] > df_profit['ROA_sector_ttm'], 1, 0)
+    df_profit['score_nim_sector'] = np.where(df_profit['nim_securities'] > df_profit['NIM_sector_securities'], 1, 0)
+    df_profit['score_profit'] = round((df_profit['score_roe_sector']+df_profit['score_roa_sector']+df_profit['score_nim_sector'])*4/3,2)
+
+    # Ranking based on score_profit
+    df_profit = grading.rank_letter(df_profit, 'score_profit', 'rank_profit')
+
+
+    return df_profit
+
+
+def health(df_bs: pd.DataFrame, df_is: pd.DataFrame, periods=None, window=12, percent_sales=0.8, state_dir=None, rebuild_state=False) -> pd.DataFrame:
+    """ Health rank: Loans-to-Equity, Debt-to-Equity, Top % Share, Coefficient Variation of FVTPL
+    ================================================================
+    Parameters:
+        df_bs, df_is: pd.DataFrame
+            See profit
+        periods: list of (Year, Quarter)
+            See rank
+        window: int
+            Number of quarters of the coefficient variation of FVTPL. Defaults to 12
+        percent_sales: float
+            Share of the sales the top lines must reach, see functions_securities.diversified_sales_score.
+            Defaults to 0.8
+        state_dir, rebuild_state:
+            See rank
+    """
+    #### 2.2.1 Merge data
+    # Get the suitable columns from the balance sheet and the income statement
+    df_health = panel.join(
+        df_bs[['Symbol', 'Year', 'Quarter', 'Loans', 'Debt', 'Equity']],
+        df_is[['Symbol', 'Year', 'Quarter', 'Sales'] + SALES_LINES + ['FVTPL']]
+    )
+
+    #### 2.2.2 Calculate ratios
+    # - Loans-to-equity
+    sum_8q = rolling_state.rolling_columns(
+        df_health, ['Loans', 'Equity'], 8,
+        state_dir=state_dir, prefix='securities', rebuild=rebuild_state
+    )
+    df_health['Loans_8Q'] = sum_8q[('Loans', 'sum')]
+    df_health['Equity_8Q'] = sum_8q[('Equity', 'sum')]
+    df_health['lte_8q'] = df_health['Loans_8Q']/df_health['Equity_8Q']
+    df_health['lte'] = df_health['Loans']/df_health['Equity']
+
+    # - Coefficient Variation: FVTPL (before the periods are selected)
+    df_health = fs.coef_variation_fvtpl(panel_data=df_health, window=window, state_dir=state_dir, rebuild=rebuild_state)
+
+    # The scores below compare the stocks of the same period only
+    df_health = dirty_periods.select_periods(df_health, periods)
+
+    df_health = fs.score_lte(panel_data=df_health)
+
+    # - Debt-to-Equity
+    df_health['debt_to_equity'] = df_health['Debt']/df_health['Equity']
+
+    # Calculate and compare based on median value of the sector
+    df_health = fs.score_dte(panel_data=df_health)
+
+    # - Diversified sales
+    # Calculate the ratios of each lines which contribute to the sales
+    df_health = df_health.assign(**{
+        share: df_health[line]/df_health['Sales'] for line, share in zip(SALES_LINES, SHARE_COLUMNS)
+    })
+
+    # Scoring top_share for all rows at once
+    df_health = fs.diversified_sales_score(
+        panel_data=df_health,
+        share_columns=SHARE_COLUMNS,
+        percent_sales=percent_sales
+    )
+
+    # - Coefficient Variation: FVTPL
+    df_health = fs.score_coef(panel_data=df_health)
+
+    #### 2.2.3 Scoring health criteria
+    df_health['score_health'] = (
+        df_health['score_lte'] +
+        df_health['score_dte'] +
+        df_health['score_diversified_sale'] +
+        df_health['score_coef_variation']
+    )
+
+    # Ranking based on score_health
+    df_health = grading.rank_health(df_health)
+
+
+    return df_health
+
+
+def final(df_profit: pd.DataFrame, df_health: pd.DataFrame, df_raw: pd.DataFrame) -> pd.DataFrame:
+    """ Final rank: the profit and health ranks with the current growth and valuation ranks
+    ================================================================
+    Parameters:
+        df_profit: pd.DataFrame
+            Output of profit
+        df_health: pd.DataFrame
+            Output of health
+        df_raw: pd.DataFrame
+            See rank
+    Returns:
+        pd.DataFrame: the rows of ptsp_stock_fundamental_score_financial, without the Update column
+    """
+    # Create df_final (table) to store final result by mergin df_profit and df_health
+    # Sorted by Symbol, Year, Quarter (the index)
+    df_final = panel.join(
+        df_profit[['Symbol', 'Year', 'Quarter',
+                   'score_roe_sector', 'score_roa_sector', 'score_nim_sector',
+                   'score_profit', 'rank_profit']],
+        df_health[['Symbol', 'Year', 'Quarter',
+                   'score_lte', 'score_dte',
+                   'score_diversified_sale', 'score_coef_variation',
+                   'score_health', 'rank_health']]
+    )
+
+    df_raw = df_raw.copy()
+    df_raw[['Year', 'Quarter']] = df_raw[['Year', 'Quarter']].astype(int)
+
+    #### 2.3.3 Merge all data
+    # - New profit rank
+    # - New health rank
+    # - Current growth rank
+    # - Currnet valuation rank
+    df_final = panel.join(df_final, df_raw[RAW_COLUMNS])
+
+    # Change type of data to calculate final score
+    list_col = [
+        'score_roe_sector',
+        'score_roa_sector',
+        'score_nim_sector',
+        'score_profit',
+        'score_lte',
+        'score_dte',
+        'score_diversified_sale',
+        'score_coef_variation',
+        'score_health',
+        'score_EPS_above_average',
+        'score_EPS_growth',
+        'score_EPS_above_sector',
+        'score_EPS_above_group',
+        'score_growth',
+        'score_PE_5Y',
+        'score_PB_5Y',
+        'score_PE_sector',
+        'score_PB_sector',
+        'score_valuation',
+    ]
+    for i in list_col:
+        df_final[i] = df_final[i].astype(float)
+
+    # Calculate score_final
+    df_final['score_final'] = round(
+        number=np.mean(
+            df_final[[
+                'score_profit',
+                'score_health',
+                'score_growth',
+                'score_valuation'
+            ]],
+            axis=1
+        ),
+        ndigits=2
+    )
+
+    # Ranking based on score_final
+    df_final = grading.rank_letter(df_final, 'score_final', 'rank_final')
+
+    # Assign variable for selected columns
+    final_column = df_final.columns[:-1].to_list()
+
+
+    return df_final[final_column]
+
+
+def rank(df_is: pd.DataFrame, df_bs: pd.DataFrame, provision_for_losses: pd.DataFrame, df_raw: pd.DataFrame, state_dir=None, rebuild_state=False, periods=None, cache=None) -> list:
+    """ Ranking: Securities Sector
+    ================================================================
+    Profit: ROE, ROA, NIM
+    Health: Loans-to-Equity, Debt-to-Equity, Top % Share, Coefficient Variation of FVTPL
+
+    Parameters:
+        df_is, df_bs: pd.DataFrame
+            Output of preprocess
+        provision_for_losses: pd.DataFrame
+            Symbol, Year, Quarter, ProvisionForLosses (VND's income statement)
+        df_raw: pd.DataFrame
+            Rows of ptsp_stock_fundamental_score of the securities companies, columns RAW_COLUMNS
+        state_dir: str
+            Folder of the rolling states (TTM, 8Q, 12Q windows) kept between runs.
+            Defaults to None, which calculates the windows from the whole history
+        rebuild_state: bool
+            Rebuild the rolling states from the whole history. Defaults to False
+        periods: list of (Year, Quarter)
+            Only score these periods (see dirty_periods). The rolling windows still use the whole history,
+            and the rolling states append again the symbols whose past quarters changed, so the windows
+            of a restated quarter and of the LOOKBACK quarters after it are new. Defaults to None (every period)
+        cache: stage_cache.StageCache
+            Re-use the stages (profit, health, final) whose inputs have not changed. Defaults to None
+    Returns:
+        list of dict: the tables to save, as keyword arguments of pipeline.save_result
+    """
+    # Merge all the data belonging to the Income Statement
+    # Both statements are indexed and sorted by Symbol, Year and Quarter (see panel.index_panel)
+    df_is = panel.join(df_is, provision_for_losses)
+    df_bs = panel.index_panel(df_bs)
+
+
+    # ================================================================
+    ## 2. Process data
+    ### 2.1 Profit Rank
+    df_profit = stage_cache.run(
+        cache, 'securities_profit', profit,
+        df_bs=df_bs, df_is=df_is, periods=periods, window=4,
+        state_dir=state_dir, rebuild_state=rebuild_state
+    )
+
+    ### 2.2 Health Rank
+    df_health = stage_cache.run(
+        cache, 'securities_health', health,
+        df_bs=df_bs, df_is=df_is, periods=periods, window=12, percent_sales=0.8,
+        state_dir=state_dir, rebuild_state=rebuild_state
+    )
+
+
+    ### 2.3 Merge data
+    # TABLE: income_statement_securities
+    list_col_isr = [
+        'Symbol', 'Year', 'Quarter',
+        'IncomeFVTPL_%', 'IncomeHTM_%',
+        'IncomeLoansReceivables_%', 'IncomeAFS_%',
+        'IncomeDerivatives_%', 'RevenueBrokerageServices_%',
+        'RevenueUnderwritingIssuuanceServices_%',
+        'RevenueAdvisoryServices_%', 'RevenueAuctionTrustServices_%',
+        'RevenueCustodyServices_%', 'OtherRevenues_%',
+        'FVTPL_m', 'FVTPL_std',
+    ]
+
+    # TABLE: stock_financial_ratio_securities
+    # Create sfri (table) by merging df_profit and df_health
+    sfri = panel.join(
+        df_profit[[
+            'Symbol', 'Year', 'Quarter',
+            'nim_securities'
+        ]],
+        df_health[[
+            'Symbol', 'Year', 'Quarter',
+            'lte_8q', 'lte', 'debt_to_equity',
+            'coef_var_12q'
+        ]]
+    )
+
+    # TABLE: ptsp_stock_fundamental_score_financial
+    df_final = stage_cache.run(
+        cache, 'securities_final', final,
+        df_profit=df_profit, df_health=df_health, df_raw=df_raw
+    )
+
+    # Only the rows from the first scored period on are compared with the database
+    period_from = min(periods) if periods else None
+
+
+    return [
+        {
+            'table': "income_statement_securities",
+            'data': df_health[list_col_isr],
+            'period_from': period_from,
+        },
+        {
+            'table': "stock_financial_ratio_securities",
+            'data': sfri,
+            'period_from': period_from,
+        },
+        {
+            'table': "ptsp_stock_fundamental_score_financial",
+            'data': df_final,
+            'columns': COL_FINAL,
+            'not_null': ['score_lte'],
+            'period_from': period_from,
+        },
+    ]
+
+
+if __name__ == '__main__':
+    print("Hello World")
@@ -0,0 +1,428 @@
+import os
+import glob
+
+import numpy as np
+import pandas as pd
+
+from src import panel
+
+
+# Statistics of a window which can be asked for
+STATS = ('sum', 'mean', 'std')
+
+# The statistics of a state are appended as one part per run; above this many parts they are merged into one
+MAX_PARTS = 32
+
+
+def window_sum(windows: np.ndarray) -> np.ndarray:
+    """ Sum of every row of a 2-D array, added left to right with the rounding errors carried along
+    ================================================================
+    Every addition keeps its exact rounding error (two-sum), and the errors are added back at the end,
+    so the result is as accurate as a sum in twice the precision: for windows of a few quarters it is the
+    correctly rounded sum (as math.fsum), and it does not depend on what came before the window.
+    pandas' running sums may differ from it in the last digit; on whole amounts (VND) both are exact.
+
+    Parameters:
+        windows: np.ndarray
+            One window per row, oldest value first
+    """
+    total = windows[:, 0].copy()
+    error = np.zeros(len(windows))
+    for k in range(1, windows.shape[1]):
+        value = windows[:, k]
+        added = total + value
+        part = added - total
+        error += (total - (added - part)) + (value - part)
+        total = added
+
+
+    return total + error
+
+
+class RollingState:
+    """ Ring buffers of the last `window` values of one column for every symbol, with the last period seen
+    ================================================================
+    Appending the next quarter of a symbol writes one value into its ring buffer, and the statistics
+    of the window are computed from the buffer itself (see window_sum), so they are the same whether
+    the history was appended in one run or over many.
+
+    The statistics follow pandas rolling(window): NaN until the window is full,
+    or while a missing value is inside the window; std uses ddof=1.
+
+    Parameters:
+        window: int
+            e.g. 4 (TTM), 8 (8Q) or 12 (12Q)
+    """
+
+    def __init__(self, window: int):
+        if window < 2:
+            raise ValueError("window must be at least 2")
+
+        self.window = window
+        self.symbols = pd.Index([], dtype=object)
+        self.buffer = np.full((0, window), np.nan)
+        self.count = np.zeros(0, dtype='int64')          # values appended so far
+        self.last_period = np.zeros(0, dtype='int64')    # Year*4 + Quarter of the last value
+
+    def rows(self, symbols, add=True) -> np.ndarray:
+        """ Position of every symbol in the buffers (-1 if unknown and add is False) """
+        symbols = pd.Index(np.asarray(symbols, dtype=object))
+        if add:
+            unknown = symbols.unique().difference(self.symbols, sort=False)
+            if len(unknown):
+                n = len(unknown)
+                self.symbols = self.symbols.append(unknown)
+                self.buffer = np.vstack([self.buffer, np.full((n, self.window), np.nan)])
+                self.count = np.concatenate([self.count, np.zeros(n, dtype='int64')])
+                self.last_period = np.concatenate([self.last_period, np.full(n, -1, dtype='int64')])
+
+
+        return self.symbols.get_indexer(symbols)
+
+    def drop(self, symbols):
+        """ Forget the windows of some symbols: their next values are appended from an empty window """
+        keep = ~self.symbols.isin(symbols)
+        self.symbols = self.symbols[keep]
+        self.buffer = self.buffer[keep]
+        self.count = self.count[keep]
+        self.last_period = self.last_period[keep]
+
+    def watermark(self, symbols) -> np.ndarray:
+        """ Last period seen of every symbol, -1 if it is unknown """
+        rows = self.rows(symbols, add=False)
+        if not len(self.last_period):
+            return np.full(len(rows), -1, dtype='int64')
+
+        return np.where(rows >= 0, self.last_period[np.maximum(rows, 0)], -1)
+
+    def push(self, rows, periods, values) -> dict:
+        """ Append one value to every row (rows must be distinct) and return the statistics of the windows """
+        w = self.window
+        self.buffer[rows, self.count[rows] % w] = values
+        self.count[rows] += 1
+        self.last_period[rows] = periods
+
+
+        return self.stats(rows)
+
+    def stats(self, rows) -> dict:
+        """ sum, mean and std of the current window of every row """
+        w = self.window
+        oldest = self.count[rows] - w
+        windows = self.buffer[rows[:, None], (oldest[:, None] + np.arange(w)) % w]
+        ready = (oldest >= 0) & ~np.isnan(windows).any(axis=1)
+
+        window_sum_ = np.where(ready, window_sum(np.where(np.isnan(windows), 0.0, windows)), np.nan)
+        mean = window_sum_/w
+        var = window_sum((windows - mean[:, None])**2)/(w - 1)
+
+
+        return {
+            'sum': window_sum_,
+            'mean': mean,
+            'std': np.where(ready, np.sqrt(np.maximum(var, 0.0)), np.nan),
+        }
+
+    def append(self, symbols, periods, values) -> pd.DataFrame:
+        """ Append many values, in the order of the periods within every symbol
+        ================================================================
+        Parameters:
+            symbols, periods, values: np.ndarray
+                Periods as Year*4 + Quarter, after the last period seen of every symbol
+        Returns:
+            pd.DataFrame: sum, mean, std after every appended value, in the order of the input
+        """
+        periods = np.asarray(periods, dtype='int64')
+        values = np.asarray(values, dtype=float)
+        rows = self.rows(symbols)
+
+        out = {i: np.full(len(rows), np.nan) for i in STATS}
+
+        # The k-th new value of every symbol is appended in round k, all symbols at once
+        order = np.lexsort((periods, rows))
+        sorted_rows = rows[order]
+        first = np.r_[True, sorted_rows[1:] != sorted_rows[:-1]]
+        start = np.maximum.accumulate(np.where(first, np.arange(len(order)), 0))
+        rank = np.empty(len(order), dtype='int64')
+        rank[order] = np.arange(len(order)) - start
+        for k in range(rank.max() + 1 if len(rank) else 0):
+            at = np.flatnonzero(rank == k)
+            stats = self.push(rows[at], periods[at], values[at])
+            for i in STATS:
+                out[i][at] = stats[i]
+
+
+        return pd.DataFrame(out)
+
+    def to_frame(self) -> pd.DataFrame:
+        """ The state as a table: one row per symbol, v0 the oldest value of the window """
+        oldest = self.count - self.window
+        data = pd.DataFrame({
+            'Symbol': self.symbols.to_numpy(dtype=object),
+            'count': self.count,
+            'last_period': self.last_period,
+        })
+        windows = self.buffer[np.arange(len(self.count))[:, None], (oldest[:, None] + np.arange(self.window)) % self.window]
+        for k in range(self.window):
+            data[f'v{k}'] = windows[:, k]
+
+
+        return data
+
+    @classmethod
+    def from_frame(cls, data: pd.DataFrame, window: int):
+        """ Rebuild a state saved with to_frame """
+        state = cls(window)
+        state.symbols = pd.Index(data['Symbol'].astype(str).to_numpy(dtype=object))
+        state.count = data['count'].to_numpy(dtype='int64', copy=True)
+        state.last_period = data['last_period'].to_numpy(dtype='int64', copy=True)
+
+        # Back to the ring: the oldest value of the window goes where the next value will be written
+        windows = data[[f'v{k}' for k in range(window)]].to_numpy(dtype=float).reshape(-1, window)
+        state.buffer = np.empty_like(windows)
+        positions = (state.count[:, None] - window + np.arange(window)) % window
+        state.buffer[np.arange(len(windows))[:, None], positions] = windows
+
+
+        return state
+
+
+def _paths(state_dir: str, name: str, window: int) -> tuple:
+    """ File of the state and folder of the appended statistics """
+    path = os.path.join(state_dir, f"{name}_{window}q")
+
+    return path + ".parquet", path + "_stats"
+
+
+def _write_parquet(data: pd.DataFrame, path: str):
+    # Write to a temporary file first, so a crash never leaves half a file behind
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = path + '.tmp'
+    data.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+
+def _empty_stats() -> pd.DataFrame:
+    return pd.DataFrame({
+        'Symbol': pd.Series(dtype=object),
+        'period': pd.Series(dtype='int64'),
+        'value': pd.Series(dtype=float),
+        **{i: pd.Series(dtype=float) for i in STATS},
+    })
+
+
+def load_state(state_dir: str, name: str, window: int) -> tuple:
+    """ Load a saved rolling state and the statistics of the rows it has seen
+    ================================================================
+    Statistics appended by a run whose state was not saved (e.g. it crashed in between)
+    are after the last period of the state, and are left out.
+
+    Parameters:
+        state_dir: str
+        name: str
+            e.g. 'insurance_NetIncome2'
+        window: int
+    Returns:
+        tuple: RollingState (empty if nothing is saved), pd.DataFrame of Symbol, period, value, sum, mean, std
+    """
+    path_state, stats_dir = _paths(state_dir, name, window)
+    parts = sorted(glob.glob(os.path.join(stats_dir, "part-*.parquet")))
+    if not (os.path.exists(path_state) and parts):
+        return RollingState(window), _empty_stats()
+
+    state = RollingState.from_frame(pd.read_parquet(path_state), window)
+    stats = pd.concat([pd.read_parquet(i) for i in parts], ignore_index=True)
+    stats = stats.loc[stats['period'].to_numpy() <= state.watermark(stats['Symbol'].to_numpy(dtype=object))]
+
+
+    return state, stats.drop_duplicates(subset=['Symbol', 'period'], keep='last')
+
+
+def save_state(state: RollingState, new_stats: pd.DataFrame, state_dir: str, name: str, replace=False):
+    """ Save a rolling state, appending the statistics of its new rows as a new part
+    ================================================================
+    Only the new rows are written: the saved statistics are not rewritten, except that
+    the parts are merged into one every MAX_PARTS runs, so reading them stays quick.
+
+    Parameters:
+        state: RollingState
+        new_stats: pd.DataFrame
+            Symbol, period, value, sum, mean, std of the rows appended to the state
+        state_dir: str
+        name: str
+        replace: bool
+            Drop the saved statistics first and keep new_stats only, e.g. when the state was rebuilt.
+            Defaults to False
+    """
+    path_state, stats_dir = _paths(state_dir, name, state.window)
+    os.makedirs(stats_dir, exist_ok=True)
+    parts = sorted(glob.glob(os.path.join(stats_dir, "part-*.parquet")))
+    if replace:
+        for i in parts:
+            os.remove(i)
+        parts = []
+    elif len(parts) >= MAX_PARTS:
+        merged = pd.concat([pd.read_parquet(i) for i in parts], ignore_index=True)
+        _write_parquet(merged, parts[-1])
+        for i in parts[:-1]:
+            os.remove(i)
+        parts = parts[-1:]
+
+    # The statistics first: if the run stops before the state is written, they are left out by load_state
+    if len(new_stats) or not parts:
+        number = int(os.path.basename(parts[-1])[5:-8]) + 1 if parts else 0
+        _write_parquet(new_stats, os.path.join(stats_dir, f"part-{number:05d}.parquet"))
+    _write_parquet(state.to_frame(), path_state)
+
+
+def changed_symbols(state: RollingState, saved: pd.DataFrame, symbols, periods, values) -> np.ndarray:
+    """ Symbols whose rows already appended to the state have changed since
+    ================================================================
+    A row at or before the last period seen of its symbol is changed when its value differs from the
+    saved one (restated), or when it was not saved (a quarter inserted in the past); a saved row missing
+    from the rows is a quarter removed. NaN equals NaN. Symbols absent from the rows are left as they are.
+
+    Parameters:
+        state: RollingState
+        saved: pd.DataFrame
+            Statistics of the state, see load_state
+        symbols, periods, values: np.ndarray
+            Every row of the panel, periods as Year*4 + Quarter
+    """
+    seen = periods <= state.watermark(symbols)
+    saved_index = pd.MultiIndex.from_arrays([saved['Symbol'].to_numpy(dtype=object), saved['period'].to_numpy()])
+    found = saved_index.get_indexer(pd.MultiIndex.from_arrays([symbols[seen], periods[seen]]))
+    saved_values = saved['value'].to_numpy(dtype=float)[np.maximum(found, 0)]
+    same = (found >= 0) & ((saved_values == values[seen]) | (np.isnan(saved_values) & np.isnan(values[seen])))
+
+    removed = (
+        saved['Symbol'].isin(pd.unique(symbols)).to_numpy()
+        & ~saved_index.isin(pd.MultiIndex.from_arrays([symbols, periods]))
+    )
+
+
+    return pd.unique(np.concatenate([symbols[seen][~same], saved['Symbol'].to_numpy(dtype=object)[removed]]))
+
+
+def rolling_columns(panel_data, columns: list, window: int, stats=('sum',), state_dir=None, prefix=None, rebuild=False) -> pd.DataFrame:
+    """ Rolling sum / mean / std of several columns over the last `window` rows of every symbol, in one pass
+    ================================================================
+    Without state_dir, every statistic of every column comes from a single groupby('Symbol').rolling(window),
+    aligned on the index: rows need not be grouped by symbol (e.g. after an outer merge on the period).
+    With state_dir, each column keeps its own rolling state, see rolling_stats.
+
+    Parameters:
+        panel_data: pd.DataFrame()
+            Symbol, Year, Quarter and the columns, every symbol's rows in the order of the periods
+        columns: list
+        window: int
+        stats: list
+            Any of 'sum', 'mean', 'std'. Defaults to ('sum',)
+        state_dir: str
+            Folder of the saved states. Defaults to None (no state)
+        prefix: str
+            The state of a column is named f"{prefix}_{column}", e.g. 'insurance' -> 'insurance_Expenses'
+        rebuild: bool
+            Ignore the saved states and rebuild them from the whole history. Defaults to False
+    Returns:
+        pd.DataFrame: columns (column, stat), same index as panel_data
+    """
+    columns, stats = list(columns), list(stats)
+    if state_dir is not None:
+        return pd.concat(
+            {
+                i: rolling_stats(
+                    panel_data, i, window, stats,
+                    state_dir=state_dir, name=f"{prefix}_{i}", rebuild=rebuild
+                )
+                for i in columns
+            },
+            axis=1
+        )
+
+    rolling = panel_data.groupby('Symbol', observed=True)[columns].rolling(window=window)
+
+
+    return rolling.agg(stats).droplevel(0).reindex(panel_data.index)
+
+
+def rolling_stats(panel_data, column: str, window: int, stats=('sum',), state_dir=None, name=None, rebuild=False) -> pd.DataFrame:
+    """ Rolling sum / mean / std of a column over the last `window` rows of every symbol
+    ================================================================
+    Without state_dir, it is the usual groupby('Symbol').rolling(window).
+    With state_dir, the windows are kept between runs: only the rows after the last period seen
+    of every symbol are appended to its ring buffer, and only their statistics are computed and saved.
+    The rows already seen take their statistics from the saved ones, so the cost follows the new data.
+    A symbol whose rows already seen have changed (restated values, a quarter inserted or removed
+    in the past, see changed_symbols) is dropped from the state and appended again from its first row.
+
+    Parameters:
+        panel_data: pd.DataFrame()
+            Symbol, Year, Quarter and column, every symbol's rows in the order of the periods
+        column: str
+        window: int
+        stats: list
+            Any of 'sum', 'mean', 'std'. Defaults to ('sum',)
+        state_dir: str
+            Folder of the saved states. Defaults to None (no state)
+        name: str
+            Name of the state, e.g. 'insurance_NetIncome2'. Required with state_dir
+        rebuild: bool
+            Ignore the saved state and rebuild it from the whole history. Defaults to False
+    Returns:
+        pd.DataFrame: one column per stat, same index as panel_data
+    """
+    stats = list(stats)
+    if state_dir is None:
+        return rolling_columns(panel_data, [column], window, stats)[column]
+    if name is None:
+        raise ValueError("name is required with state_dir")
+
+    if rebuild:
+        state, saved = RollingState(window), _empty_stats()
+    else:
+        state, saved = load_state(state_dir, name, window)
+    # A new state does not keep the statistics saved by an earlier one
+    replace = rebuild or len(state.symbols) == 0
+
+    symbols = panel_data['Symbol'].astype(str).to_numpy(dtype=object)
+    periods = panel.period_code(panel_data).astype('int64')
+    values = panel_data[column].to_numpy(dtype=float)
+
+    # The symbols changed in the past are appended again, and their saved statistics rewritten
+    changed = changed_symbols(state, saved, symbols, periods, values)
+    if len(changed):
+        state.drop(changed)
+        saved = saved.loc[~saved['Symbol'].isin(changed)]
+        replace = True
+
+    # Only the rows after the last period seen of their symbol are appended
+    new = periods > state.watermark(symbols)
+    out = np.full((len(panel_data), len(STATS)), np.nan)
+    if new.any():
+        appended = state.append(symbols[new], periods[new], values[new])
+        out[new] = appended[list(STATS)].to_numpy()
+        new_stats = pd.concat(
+            [pd.DataFrame({'Symbol': symbols[new], 'period': periods[new], 'value': values[new]}), appended[list(STATS)]],
+            axis=1
+        )
+        save_state(state, pd.concat([saved, new_stats], ignore_index=True) if replace else new_stats, state_dir, name, replace=replace)
+    elif replace:
+        save_state(state, saved, state_dir, name, replace=True)
+
+    # The rows already seen
+    old = ~new
+    if old.any() and len(saved):
+        saved_index = pd.MultiIndex.from_arrays([saved['Symbol'].to_numpy(dtype=object), saved['period'].to_numpy()])
+        found = saved_index.get_indexer(pd.MultiIndex.from_arrays([symbols[old], periods[old]]))
+        old_stats = saved[list(STATS)].to_numpy(dtype=float)[np.maximum(found, 0)]
+        out[old] = np.where((found >= 0)[:, None], old_stats, np.nan)
+
+    out = pd.DataFrame(out, columns=list(STATS), index=panel_data.index)
+
+
+    return out[stats]
+
+
+if __name__ == '__main__':
+    print("Hello World")
@@ -0,0 +1,258 @@
+import os
+import re
+import json
+import time
+import queue
+import datetime as dt
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+
+
+# Columns identifying a row of a financial statement table
+KEYS = ['Symbol', 'Year', 'Quarter']
+
+
+def load_watermarks(path: str) -> dict:
+    """ Read the high-water mark of every cached table
+    ================================================================
+    Parameters:
+        path: str
+            JSON file: {table: {"Year": ..., "Quarter": ..., "Update": ..., "downloaded_at": ...}}
+    """
+    if not os.path.exists(path):
+        return {}
+
+    with open(path, mode="r", encoding="utf-8") as fp:
+        return json.load(fp)
+
+
+def save_watermarks(watermarks: dict, path: str):
+    """ Write the high-water marks (to a temporary file first, then renamed)
+    ================================================================
+    Parameters:
+        watermarks: dict
+        path: str
+    """
+    tmp_path = path + '.tmp'
+    with open(tmp_path, mode="w", encoding="utf-8") as fp:
+        json.dump(watermarks, fp, indent=4, default=str)
+    os.replace(tmp_path, path)
+
+
+def high_water_mark(data: pd.DataFrame, update_column=None) -> dict:
+    """ Latest (Year, Quarter) and, if the table has one, latest update timestamp of a table
+    ================================================================
+    Parameters:
+        data: pd.DataFrame
+        update_column: str
+            Column holding the last modification time of a row. Defaults to None
+    """
+    latest = data.sort_values(by=['Year', 'Quarter']).iloc[-1]
+    mark = {
+        "Year": int(latest['Year']),
+        "Quarter": int(latest['Quarter']),
+        "downloaded_at": dt.datetime.now().isoformat(timespec='seconds'),
+    }
+    if update_column is not None:
+        mark["Update"] = str(data[update_column].max())
+
+
+    return mark
+
+
+def strip_order_by(query: str) -> str:
+    """ A query without its final ORDER BY (and semicolon), so that it can become a subquery
+    ================================================================
+    SQL Server rejects ORDER BY in a subquery. The ORDER BY of nested queries (inside
+    parentheses) is kept; the downloaded rows are sorted again by merge_delta.
+
+    Parameters:
+        query: str
+    """
+    query = query.strip().rstrip(';').rstrip()
+    depth, cut = 0, None
+    for match in re.finditer(r"\(|\)|\bORDER\s+BY\b", query, flags=re.IGNORECASE):
+        if match.group() == '(':
+            depth += 1
+        elif match.group() == ')':
+            depth -= 1
+        elif depth == 0:
+            cut = match.start()
+
+    if cut is None:
+        return query
+
+    return query[:cut].rstrip()
+
+
+def incremental_query(query: str, mark: dict, lookback=1, update_column=None):
+    """ Wrap a statement query so that it only returns rows at or after the high-water mark
+    ================================================================
+    The last `lookback` quarters before the mark are downloaded again, because companies
+    keep publishing (and correcting) the latest quarters for a while. Without update_column,
+    a quarter restated after it left the lookback is not downloaded again: keep lookback
+    long enough for the restatements (see lookback_quarters in s1_download_data.py),
+    or run with --full now and then.
+
+    Parameters:
+        query: str
+            Query from RANKING_FIN_STOCKS_SQL.toml. Its final ORDER BY is dropped, as it becomes a subquery
+        mark: dict
+            See high_water_mark
+        lookback: int
+            Defaults to 1
+        update_column: str
+            Column of the query holding the last modification time of a row. When given,
+            rows modified after the recorded update timestamp are downloaded as well
+    Returns:
+        (sql, params) for pd.read_sql with pymssql
+    """
+    period = mark["Year"]*4 + mark["Quarter"] - lookback
+    sql = f"SELECT * FROM ({strip_order_by(query)}) AS q WHERE q.[Year]*4 + q.[Quarter] >= %s"
+    params = [period]
+
+    if update_column is not None and mark.get("Update") is not None:
+        sql += f" OR q.[{update_column}] > %s"
+        params.append(mark["Update"])
+
+
+    return sql, params
+
+
+def merge_delta(cached: pd.DataFrame, delta: pd.DataFrame, keys=KEYS) -> pd.DataFrame:
+    """ Append new rows to a cached table, replacing the cached rows which were downloaded again
+    ================================================================
+    Parameters:
+        cached: pd.DataFrame
+        delta: pd.DataFrame
+        keys: list
+            Defaults to ['Symbol', 'Year', 'Quarter']
+    """
+    if delta.empty:
+        return cached
+
+    cached = cached.astype({i: delta[i].dtype for i in keys if i in cached.columns})
+    merged = pd.concat([cached, delta], ignore_index=True)
+    merged = merged.drop_duplicates(subset=keys, keep='last')
+    merged = merged.sort_values(by=keys).reset_index(drop=True)
+
+
+    return merged
+
+
+def peak_rss_mb():
+    """ Peak resident memory of this process so far, in MB (None if it cannot be measured)
+    ================================================================
+    Uses resource on Linux/macOS and psutil, if installed, on Windows.
+    """
+    try:
+        import resource
+        import sys
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+        return round(peak/2**20 if sys.platform == 'darwin' else peak/2**10, 1)
+    except ImportError:
+        pass
+
+    try:
+        import psutil
+        return round(psutil.Process().memory_info().peak_wset/2**20, 1)
+    except (ImportError, AttributeError):
+        return None
+
+
+def run_queries(jobs: list, connect, pool_size=3, on_result=None) -> pd.DataFrame:
+    """ Run several queries concurrently over a small pool of connections
+    ================================================================
+    Every worker thread borrows its own connection (pymssql connections must not be
+    shared between threads), so at most pool_size connections are opened.
+
+    Parameters:
+        jobs: list of dict
+            {"name": str, "sql": str, "params": list or None, "chunksize": int or None}
+            With a chunksize, on_result gets an iterator of DataFrames instead of one
+            DataFrame, so a large table never has to be held in memory at once
+        connect: callable
+            Returns a new DB-API connection, e.g. lambda: pymssql.connect(...)
+        pool_size: int
+            Defaults to 3
+        on_result: callable
+            on_result(name, data) is called as soon as a query has finished,
+            e.g. to write the table to the cache
+    Returns:
+        pd.DataFrame: name, rows, read_seconds, save_seconds, peak_rss_mb of every query,
+        in the order they finished
+    """
+    pool = queue.Queue()
+    connections = []
+
+    def run(job):
+        try:
+            conn = pool.get_nowait()
+        except queue.Empty:
+            conn = connect()
+            connections.append(conn)
+
+        chunksize = job.get("chunksize")
+        timing = {"rows": 0, "read": 0.0}
+
+        def stream(chunks):
+            # Count rows and the time spent waiting for the server while the chunks are consumed
+            while True:
+                start = time.perf_counter()
+                chunk = next(chunks, None)
+                timing["read"] += time.perf_counter() - start
+                if chunk is None:
+                    return
+                timing["rows"] += len(chunk)
+                yield chunk
+
+        try:
+            start = time.perf_counter()
+            data = pd.read_sql(sql=job["sql"], con=conn, params=job.get("params"), chunksize=chunksize)
+            timing["read"] += time.perf_counter() - start
+
+            if chunksize is None:
+                timing["rows"] = len(data)
+            else:
+                data = stream(iter(data))
+
+            read_before = timing["read"]
+            start = time.perf_counter()
+            if on_result is not None:
+                on_result(job["name"], data)
+            elif chunksize is not None:
+                for _ in data:
+                    pass
+            # Time spent waiting for chunks is reading, not saving
+            save_seconds = time.perf_counter() - start - (timing["read"] - read_before)
+        finally:
+            pool.put(conn)
+
+        return {
+            "name": job["name"],
+            "rows": timing["rows"],
+            "read_seconds": round(timing["read"], 3),
+            "save_seconds": round(save_seconds, 3),
+            "peak_rss_mb": peak_rss_mb(),
+        }
+
+    report = []
+    try:
+        with ThreadPoolExecutor(max_workers=pool_size) as executor:
+            futures = [executor.submit(run, job) for job in jobs]
+            for future in as_completed(futures):
+                result = future.result()
+                print(f"{result['name']}: {result['rows']} rows in {result['read_seconds']}s (saved in {result['save_seconds']}s)")
+                report.append(result)
+    finally:
+        for conn in connections:
+            conn.close()
+
+
+    return pd.DataFrame(report)
+
+
+if __name__ == '__main__':
+    print("Hello World")
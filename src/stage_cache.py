@@ -0,0 +1,190 @@
+import os
+import glob
+import json
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+from src import instrument
+
+
+# Source files whose changes invalidate every cached stage
+SOURCE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+_source_hash = None
+
+
+def source_hash() -> str:
+    """ Fingerprint of the code of the package (src/*.py), so that a change of a calculation is never served from the cache """
+    global _source_hash
+    if _source_hash is None:
+        digest = hashlib.sha1()
+        for path in sorted(glob.glob(os.path.join(SOURCE_DIR, "*.py"))):
+            with open(path, mode="rb") as fp:
+                digest.update(fp.read())
+        _source_hash = digest.hexdigest()
+
+    return _source_hash
+
+
+def state_files(state_dir: str) -> list:
+    """ Path, size and modification time of every file in a folder of rolling states, empty if there is none """
+    files = []
+    for root, _, names in os.walk(state_dir):
+        for i in names:
+            path = os.path.join(root, i)
+            info = os.stat(path)
+            files.append([os.path.relpath(path, state_dir), info.st_size, info.st_mtime_ns])
+
+    return sorted(files)
+
+
+def fingerprint(name: str, inputs: dict) -> str:
+    """ Hash of the inputs of a stage: its data frames (values, columns, dtypes, index) and its parameters
+    ================================================================
+    A stage with a state_dir also depends on the rolling states it reads and writes: their files
+    (see state_files) are part of the hash, so a state deleted or written by another run is never
+    skipped by a cached output.
+
+    Parameters:
+        name: str
+            Name of the stage, e.g. 'securities_health'
+        inputs: dict
+            Keyword arguments of the stage: pd.DataFrame, or parameters which can be written as JSON
+            (window, percent_sales, periods, state_dir, ...)
+    """
+    digest = hashlib.sha1()
+    digest.update(name.encode())
+    digest.update(source_hash().encode())
+    for key in sorted(inputs):
+        value = inputs[key]
+        digest.update(key.encode())
+        if isinstance(value, pd.DataFrame):
+            digest.update(json.dumps([[str(i), str(value[i].dtype)] for i in value.columns]).encode())
+            # Every NaN the same, whatever its sign bit (0/0 is -nan, Parquet writes nan back)
+            floats = [i for i in value.columns if pd.api.types.is_float_dtype(value[i].dtype)]
+            if floats:
+                value = value.assign(**{i: value[i].where(value[i].notna(), np.nan) for i in floats})
+            # The typed columns and the index, without a copy as text (object columns, e.g. Decimal, are hashed as text by pandas)
+            digest.update(pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes())
+        else:
+            digest.update(json.dumps(value, default=str, sort_keys=True).encode())
+        if key == 'state_dir' and value is not None:
+            digest.update(json.dumps(state_files(value)).encode())
+
+    return digest.hexdigest()
+
+
+class StageCache:
+    """ Outputs of the ranking stages, stored as Parquet files keyed by the hash of their inputs
+    ================================================================
+    A stage whose inputs and parameters have not changed is read from the cache instead of being
+    calculated again, e.g. when a run is repeated after its write step failed:
+
+        cache = stage_cache.StageCache(cache_dir)
+        df_health = cache.run('securities_health', health, df_bs=df_bs, df_is=df_is, window=12)
+
+    The least recently used files are deleted once the folder grows above max_mb.
+    A stage asked to rebuild its rolling state (rebuild_state=True) is always calculated.
+
+    Parameters:
+        cache_dir: str
+        max_mb: float
+            Defaults to 512
+    """
+
+    def __init__(self, cache_dir: str, max_mb=512):
+        self.cache_dir = cache_dir
+        self.max_mb = max_mb
+
+    def path(self, name: str, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{name}-{key}.parquet")
+
+    def get(self, name: str, key: str):
+        """ Cached output of a stage, None if it is not cached """
+        path = self.path(name, key)
+        if not os.path.exists(path):
+            return None
+
+        data = pd.read_parquet(path)
+        # The modification time orders the files for the eviction
+        os.utime(path)
+
+        return data
+
+    def put(self, name: str, key: str, data: pd.DataFrame):
+        """ Save the output of a stage (to a temporary file first, then renamed), then evict the oldest files """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self.path(name, key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        data.to_parquet(tmp_path)
+        os.replace(tmp_path, path)
+        self.evict(keep=path)
+
+    def evict(self, keep=None):
+        """ Delete the least recently used files (except keep) until the folder holds at most max_mb """
+        files = []
+        for path in glob.glob(os.path.join(self.cache_dir, "*.parquet")):
+            try:
+                files.append((os.path.getmtime(path), os.path.getsize(path), path))
+            except FileNotFoundError:
+                # Deleted by another process meanwhile
+                continue
+
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_mb*2**20:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def run(self, name: str, func, **kwargs) -> pd.DataFrame:
+        """ func(**kwargs), read from the cache when the same inputs were already calculated
+        ================================================================
+        The stage is recorded in the run report being recorded, if any, with record['cached'].
+
+        Parameters:
+            name: str
+                Name of the stage, part of the file name
+            func: callable
+                Returns a pd.DataFrame
+            kwargs:
+                Inputs of func, see fingerprint
+        """
+        with instrument.stage(name, rows_in=instrument.count_rows(list(kwargs.values()))) as record:
+            key = fingerprint(name, kwargs)
+            data = None if kwargs.get('rebuild_state') else self.get(name, key)
+            record['cached'] = data is not None
+            if data is None:
+                data = func(**kwargs)
+                # The state written by func is part of the key of the next run
+                self.put(name, fingerprint(name, kwargs), data)
+            record['rows_out'] = len(data)
+
+        return data
+
+
+def run(cache, name: str, func, **kwargs) -> pd.DataFrame:
+    """ cache.run(name, func, **kwargs), or func(**kwargs) without a cache (cache is None)
+    ================================================================
+    The stage is recorded in the run report being recorded, if any (see instrument.RunReport).
+    """
+    if cache is not None:
+        return cache.run(name, func, **kwargs)
+
+    with instrument.stage(name, rows_in=instrument.count_rows(list(kwargs.values()))) as record:
+        data = func(**kwargs)
+        record['rows_out'] = len(data)
+
+
+    return data
+
+
+if __name__ == '__main__':
+    print("Hello World")
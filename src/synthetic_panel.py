@@ -0,0 +1,206 @@
+import numpy as np
+import pandas as pd
+
+from src import ranking_insurance
+from src import ranking_securities
+
+
+# Value columns of the statement caches (cache/*.csv), after Symbol, Year, Quarter
+SCHEMAS = {
+    'bs_insurance': ['Assets', 'Debt', 'Equity', 'Liabilities', 'Provisions'],
+    'is_insurance': ['GrossPremiumWritten', 'NetPremiumWritten', 'IncurredLosses', 'Expenses', 'NetIncome', 'NetIncome2'],
+    'bs_securities': ['Assets', 'Debt', 'Equity', 'Loans'],
+    'is_securities': [
+        'Sales', 'IncomeFVTPL', 'IncomeHTM', 'IncomeLoansReceivables', 'IncomeAFS',
+        'IncomeDerivatives', 'RevenueBrokerageServices', 'RevenueUnderwritingIssuuanceServices',
+        'RevenueAdvisoryServices', 'RevenueAuctionTrustServices', 'RevenueCustodyServices',
+        'OtherRevenues', 'FVTPL', 'Revenues', 'InterestExpenses', 'NetIncome', 'NetIncome2'
+    ],
+}
+
+# Lines of the securities sales, Sales is their sum
+SALES_LINES = SCHEMAS['is_securities'][1:12]
+
+# Size of the sectors today (symbols in the cache)
+BASE_SYMBOLS = {
+    'insurance': 12,
+    'securities': 45,
+}
+
+# Letters of the rank columns of ptsp_stock_fundamental_score
+LETTERS = np.array(['A', 'B', 'C', 'D'])
+
+
+def panel_keys(n_symbols: int, n_quarters: int, last_period=(2023, 2), seed=0) -> pd.DataFrame:
+    """ Symbol, Year, Quarter of a panel where every symbol has between half and all of n_quarters
+    ================================================================
+    Parameters:
+        n_symbols: int
+        n_quarters: int
+            Longest history, ending with last_period
+        last_period: tuple (Year, Quarter)
+            Defaults to (2023, 2)
+        seed: int
+    """
+    rng = np.random.default_rng(seed)
+    last = last_period[0]*4 + last_period[1]
+    lengths = rng.integers(max(n_quarters//2, 1), n_quarters + 1, size=n_symbols)
+
+    symbols = np.repeat([f"S{i:05d}" for i in range(n_symbols)], lengths)
+    # Position of every row from the end of its symbol's history
+    from_end = np.concatenate([np.arange(n - 1, -1, -1) for n in lengths])
+    codes = last - from_end
+
+
+    return pd.DataFrame({
+        'Symbol': symbols,
+        'Year': (codes - 1)//4,
+        'Quarter': (codes - 1) % 4 + 1,
+    })
+
+
+def random_values(keys: pd.DataFrame, columns: list, rng, scale=1e12, missing_rate=0.0) -> pd.DataFrame:
+    """ Positive values following a random walk per symbol, with a share of missing values
+    ================================================================
+    Parameters:
+        keys: pd.DataFrame
+            Output of panel_keys
+        columns: list
+        rng: np.random.Generator
+        scale: float
+            Typical size of the values. Defaults to 1e12 (VND)
+        missing_rate: float
+            Share of the values set to NaN. Defaults to 0
+    """
+    n = len(keys)
+    first = (keys['Symbol'] != keys['Symbol'].shift()).to_numpy()
+    group = np.cumsum(first) - 1
+
+    data = keys.copy()
+    for col in columns:
+        # Level of the symbol, then a random walk of the log value within the symbol
+        level = rng.lognormal(mean=0, sigma=1.5, size=group[-1] + 1)[group] if n else np.empty(0)
+        steps = rng.normal(0, 0.1, size=n)
+        walk = pd.Series(steps).groupby(group).cumsum().to_numpy()
+        data[col] = scale*level*np.exp(walk)
+        data.loc[rng.random(n) < missing_rate, col] = np.nan
+
+
+    return data
+
+
+def statement(keys: pd.DataFrame, table: str, rng, missing_rate=0.0) -> pd.DataFrame:
+    """ A synthetic statement with the columns of a cache table, e.g. 'is_securities'
+    ================================================================
+    Net incomes can be negative, and the sales of securities companies are the sum of their lines,
+    so that the shares of the lines are meaningful.
+
+    Parameters:
+        keys: pd.DataFrame
+            Output of panel_keys
+        table: str
+            One of SCHEMAS
+        rng: np.random.Generator
+        missing_rate: float
+    """
+    data = random_values(keys, SCHEMAS[table], rng, missing_rate=missing_rate)
+    for col in ['NetIncome', 'NetIncome2']:
+        if col in data.columns:
+            data[col] = data[col]*rng.normal(0.1, 0.3, size=len(data))
+    if table == 'is_securities':
+        # A few lines of sales are empty for every company
+        for col in SALES_LINES:
+            data.loc[rng.random(len(data)) < 0.3, col] = 0
+        data['Sales'] = data[SALES_LINES].sum(axis=1, min_count=1)
+
+
+    return data
+
+
+def fundamental_scores(keys: pd.DataFrame, columns: list, rng) -> pd.DataFrame:
+    """ Rows of ptsp_stock_fundamental_score: scores by half points, letters for the ranks
+    ================================================================
+    Parameters:
+        keys: pd.DataFrame
+        columns: list
+            e.g. ranking_securities.RAW_COLUMNS
+        rng: np.random.Generator
+    """
+    data = keys.copy()
+    for col in columns[3:]:
+        if col == 'Update':
+            data[col] = "20230725"
+        elif col.startswith('rank'):
+            data[col] = LETTERS[rng.integers(0, 4, size=len(data))]
+        else:
+            data[col] = rng.integers(0, 9, size=len(data))/2
+
+
+    return data[columns]
+
+
+def insurance_inputs(n_symbols=BASE_SYMBOLS['insurance'], n_quarters=64, missing_rate=0.0, seed=0) -> dict:
+    """ Inputs of ranking_insurance.rank for a synthetic insurance sector
+    ================================================================
+    Parameters:
+        n_symbols: int
+            Defaults to the size of the sector today
+        n_quarters: int
+            Longest history. Defaults to 64 (16 years)
+        missing_rate: float
+            Share of missing values in the statements. Defaults to 0
+        seed: int
+    Returns:
+        dict: df_bs, df_is (after preprocess), ceded_reserves, net_revenue, df_raw
+    """
+    rng = np.random.default_rng(seed)
+    keys = panel_keys(n_symbols, n_quarters, seed=seed)
+
+    df_bs, df_is = ranking_insurance.preprocess(
+        df_bs=statement(keys, 'bs_insurance', rng, missing_rate),
+        df_is=statement(keys, 'is_insurance', rng, missing_rate)
+    )
+
+
+    return {
+        'df_bs': df_bs,
+        'df_is': df_is,
+        'ceded_reserves': random_values(keys, ['CededReserves'], rng, scale=1e11),
+        'net_revenue': random_values(keys, ['Revenues'], rng),
+        'df_raw': fundamental_scores(keys, ranking_insurance.RAW_COLUMNS, rng),
+    }
+
+
+def securities_inputs(n_symbols=BASE_SYMBOLS['securities'], n_quarters=64, missing_rate=0.0, seed=0) -> dict:
+    """ Inputs of ranking_securities.rank for a synthetic securities sector
+    ================================================================
+    Parameters:
+        n_symbols: int
+            Defaults to the size of the sector today
+        n_quarters: int
+            Longest history. Defaults to 64 (16 years)
+        missing_rate: float
+            Share of missing values in the statements. Defaults to 0
+        seed: int
+    Returns:
+        dict: df_is, df_bs (after preprocess), provision_for_losses, df_raw
+    """
+    rng = np.random.default_rng(seed)
+    keys = panel_keys(n_symbols, n_quarters, seed=seed)
+
+    df_is, df_bs = ranking_securities.preprocess(
+        df_is=statement(keys, 'is_securities', rng, missing_rate),
+        df_bs=statement(keys, 'bs_securities', rng, missing_rate)
+    )
+
+
+    return {
+        'df_is': df_is,
+        'df_bs': df_bs,
+        'provision_for_losses': random_values(keys, ['ProvisionForLosses'], rng, scale=1e10),
+        'df_raw': fundamental_scores(keys, ranking_securities.RAW_COLUMNS, rng),
+    }
+
+
+if __name__ == '__main__':
+    print("Hello World")
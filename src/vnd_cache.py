@@ -0,0 +1,270 @@
+import os
+import datetime as dt
+
+import pandas as pd
+
+from src import vnd_fetch
+
+
+# Columns stored in a statement cache file, one row per symbol, item code and quarter
+CACHE_COLUMNS = ['Symbol', 'itemCode', 'Year', 'Quarter', 'numericValue', 'fetched_at']
+
+# Columns of the file recording when every symbol and item code was last requested,
+# including the ones VND has no rows for
+CHECKED_COLUMNS = ['Symbol', 'itemCode', 'checked_at']
+
+
+def cache_path(cache_dir: str, statement: str) -> str:
+    """ Path of the Parquet file which caches one type of statement, e.g. get_balance_sheet
+    ================================================================
+    Parameters:
+        cache_dir: str
+        statement: str
+    """
+    return os.path.join(cache_dir, f"{statement}.parquet")
+
+
+def checked_path(cache_dir: str, statement: str) -> str:
+    """ Path of the Parquet file next to the cache of a statement, recording when its items were requested """
+    return os.path.join(cache_dir, f"{statement}_checked.parquet")
+
+
+def load_cache(path: str) -> pd.DataFrame:
+    """ Read a statement cache file, or an empty cache if it does not exist yet
+    ================================================================
+    Parameters:
+        path: str
+    """
+    if not os.path.exists(path):
+        return pd.DataFrame({
+            'Symbol': pd.Series(dtype=str),
+            'itemCode': pd.Series(dtype='int64'),
+            'Year': pd.Series(dtype='int16'),
+            'Quarter': pd.Series(dtype='int8'),
+            'numericValue': pd.Series(dtype='float64'),
+            'fetched_at': pd.Series(dtype='datetime64[ns]'),
+        })
+
+    return pd.read_parquet(path)
+
+
+def save_cache(cache: pd.DataFrame, path: str):
+    """ Write a statement cache file (written to a temporary file first, then renamed)
+    ================================================================
+    Parameters:
+        cache: pd.DataFrame
+        path: str
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    cache = cache[CACHE_COLUMNS].astype({
+        'Symbol': str, 'itemCode': 'int64', 'Year': 'int16',
+        'Quarter': 'int8', 'numericValue': 'float64'
+    })
+    cache.sort_values(by=['Symbol', 'itemCode', 'Year', 'Quarter'], inplace=True)
+
+    tmp_path = path + '.tmp'
+    cache.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+
+def load_checked(path: str) -> pd.DataFrame:
+    """ Read the checked_at file of a statement, or an empty one if it does not exist yet """
+    if not os.path.exists(path):
+        return pd.DataFrame({
+            'Symbol': pd.Series(dtype=str),
+            'itemCode': pd.Series(dtype='int64'),
+            'checked_at': pd.Series(dtype='datetime64[ns]'),
+        })
+
+    return pd.read_parquet(path)
+
+
+def mark_checked(checked: pd.DataFrame, symbols, item_codes, checked_at) -> pd.DataFrame:
+    """ Record that the item codes of some symbols were requested at checked_at, whether VND had rows or not
+    ================================================================
+    Parameters:
+        checked: pd.DataFrame
+            Symbol, itemCode, checked_at (see load_checked)
+        symbols: list
+        item_codes: list
+        checked_at: pd.Timestamp
+    """
+    pairs = pd.MultiIndex.from_product([list(symbols), list(item_codes)], names=['Symbol', 'itemCode'])
+    marks = pairs.to_frame(index=False).assign(checked_at=checked_at)
+    kept = checked.loc[~checked.set_index(['Symbol', 'itemCode']).index.isin(pairs), CHECKED_COLUMNS]
+
+
+    return pd.concat([kept, marks], ignore_index=True)
+
+
+def save_checked(checked: pd.DataFrame, path: str):
+    """ Write the checked_at file of a statement (written to a temporary file first, then renamed) """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    checked = checked[CHECKED_COLUMNS].astype({'Symbol': str, 'itemCode': 'int64'})
+    checked = checked.sort_values(by=['Symbol', 'itemCode'])
+
+    tmp_path = path + '.tmp'
+    checked.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+
+def last_closed_period(today=None) -> int:
+    """ Year*4 + Quarter of the last quarter which has already ended
+    ================================================================
+    Parameters:
+        today: dt.date
+            Defaults to today
+    """
+    today = today or dt.date.today()
+    quarter = (today.month - 1)//3 + 1
+
+    return today.year*4 + quarter - 1
+
+
+def stale_symbols(cache: pd.DataFrame, symbols, item_codes, ttl_hours=24, refresh=False, now=None, checked=None) -> list:
+    """ Symbols whose cached items must be requested again
+    ================================================================
+    A symbol is up to date when, for every requested item code, it was checked
+    within ttl_hours or it already holds the last closed quarter, so no newer
+    quarter can exist yet. An item code VND has no rows for is only requested
+    again once its check is older than ttl_hours.
+
+    Parameters:
+        cache: pd.DataFrame
+        symbols: list
+        item_codes: list
+        ttl_hours: float
+            Defaults to 24
+        refresh: bool
+            Request every symbol, whatever is cached
+        now: dt.datetime
+            Defaults to the current time
+        checked: pd.DataFrame
+            Symbol, itemCode, checked_at (see mark_checked). Defaults to None, which
+            uses the fetched_at of the cached rows only
+    """
+    symbols = list(symbols)
+    if refresh:
+        return symbols
+
+    now = now or dt.datetime.now()
+    pairs = pd.MultiIndex.from_product([symbols, list(item_codes)], names=['Symbol', 'itemCode'])
+    cached = cache.loc[cache['Symbol'].isin(symbols) & cache['itemCode'].isin(item_codes)]
+    cached = cached.assign(period=cached['Year'].astype(int)*4 + cached['Quarter'].astype(int))
+    latest = cached.groupby(['Symbol', 'itemCode']).agg(
+        fetched_at=('fetched_at', 'max'),
+        period=('period', 'max')
+    ).reindex(pairs)
+
+    checked_at = latest['fetched_at']
+    if checked is not None:
+        marks = checked.groupby(['Symbol', 'itemCode'])['checked_at'].max().reindex(pairs)
+        checked_at = pd.concat([checked_at, marks], axis=1).max(axis=1)
+
+    # Missing times and periods compare as False: the pair is stale
+    fresh = (checked_at >= now - dt.timedelta(hours=ttl_hours)) | (latest['period'] >= last_closed_period(now.date()))
+    fresh = fresh.groupby(level='Symbol', sort=False).all()
+
+
+    return [symbol for symbol in symbols if not fresh[symbol]]
+
+
+def merge_new_quarters(cache: pd.DataFrame, fetched: pd.DataFrame, refresh=False) -> pd.DataFrame:
+    """ Add fetched rows to the cache
+    ================================================================
+    Historical quarters never change, so only quarters newer than the latest cached
+    quarter of each symbol and item code are appended (every fetched row is kept
+    and replaces the cached ones when refresh is True). The time of the request
+    is recorded separately, see mark_checked.
+
+    Parameters:
+        cache: pd.DataFrame
+        fetched: pd.DataFrame
+            Columns: Symbol, itemCode, Year, Quarter, numericValue, fetched_at
+        refresh: bool
+    """
+    if fetched.empty:
+        return cache
+
+    keys = ['Symbol', 'itemCode']
+    if refresh:
+        fetched_keys = fetched[keys].drop_duplicates()
+        kept = cache.merge(fetched_keys, how='left', on=keys, indicator=True)
+        kept = kept.loc[kept['_merge'] == 'left_only', CACHE_COLUMNS]
+        return pd.concat([kept, fetched[CACHE_COLUMNS]], ignore_index=True)
+
+    latest = cache.assign(period=cache['Year'].astype(int)*4 + cache['Quarter'].astype(int)) \
+        .groupby(keys)['period'].max().reset_index(name='cached_period')
+    fetched = fetched.merge(latest, how='left', on=keys)
+    period = fetched['Year'].astype(int)*4 + fetched['Quarter'].astype(int)
+    new_rows = fetched.loc[fetched['cached_period'].isna() | (period > fetched['cached_period'])]
+
+
+    return pd.concat([cache, new_rows[CACHE_COLUMNS]], ignore_index=True)
+
+
+def cached_fetch_items(symbols, items: list, cache_dir: str, ttl_hours=24, refresh=False, **fetch_kwargs) -> dict:
+    """ Same as vnd_fetch.fetch_items, but served from a local Parquet cache
+    ================================================================
+    Each statement type (the name of its fetch function) has its own cache file keyed by
+    symbol, item code and quarter, and a file recording when every symbol and item code was
+    last requested (see mark_checked). Only symbols which are stale (see stale_symbols) are requested.
+
+    Parameters:
+        symbols: list
+        items: list of tuple (fetch, item_code, column)
+        cache_dir: str
+            Folder of the cache files, e.g. the vnd folder inside the statement cache
+        ttl_hours: float
+            Defaults to 24
+        refresh: bool
+            Ignore the cache and re-download everything. Defaults to False
+        fetch_kwargs:
+            Passed to vnd_fetch.fetch_items (max_workers, retries, backoff, verbose)
+    Returns:
+        dict: column -> pd.DataFrame with Symbol, Year, Quarter, column
+    """
+    symbols = list(symbols)
+    result = {}
+
+    for fetch in dict.fromkeys(fetch for fetch, _, _ in items):
+        statement_items = [item for item in items if item[0] is fetch]
+        item_codes = [item_code for _, item_code, _ in statement_items]
+        path = cache_path(cache_dir, fetch.__name__)
+        path_checked = checked_path(cache_dir, fetch.__name__)
+        cache = load_cache(path)
+        checked = load_checked(path_checked)
+
+        to_fetch = stale_symbols(cache, symbols, item_codes, ttl_hours=ttl_hours, refresh=refresh, checked=checked)
+        if to_fetch:
+            fetched_at = pd.Timestamp.now()
+            fetched = vnd_fetch.fetch_items(to_fetch, statement_items, **fetch_kwargs)
+            fetched = pd.concat(
+                [
+                    fetched[column].rename(columns={column: 'numericValue'}).assign(itemCode=item_code, fetched_at=fetched_at)
+                    for _, item_code, column in statement_items
+                ],
+                ignore_index=True
+            )
+            # Symbols without rows come back as empty statements, which must not turn the values into objects
+            fetched = fetched.astype({'numericValue': 'float64'})
+            cache = merge_new_quarters(cache, fetched, refresh=refresh)
+            save_cache(cache, path)
+            save_checked(mark_checked(checked, to_fetch, item_codes, fetched_at), path_checked)
+
+        cache = cache.loc[cache['Symbol'].isin(symbols)]
+        for _, item_code, column in statement_items:
+            df_i = cache.loc[cache['itemCode'] == item_code, ['Symbol', 'Year', 'Quarter', 'numericValue']]
+            df_i = df_i.rename(columns={'numericValue': column})
+            df_i['Symbol'] = pd.Categorical(df_i['Symbol'], categories=symbols, ordered=True)
+            df_i = df_i.sort_values(by=['Symbol', 'Year', 'Quarter'])
+            df_i['Symbol'] = df_i['Symbol'].astype(str)
+            df_i[['Year', 'Quarter']] = df_i[['Year', 'Quarter']].astype('int64')
+            result[column] = df_i.reset_index(drop=True)
+
+
+    return result
+
+
+if __name__ == '__main__':
+    print("Hello World")
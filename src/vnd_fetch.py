@@ -0,0 +1,148 @@
+import sys
+import time
+import random
+import functools
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+
+
+# Folder of get_vnd_data, the client of VND's API
+VND_DATA_PATH = r"F:\Tùng\Tung\Python\DashBoard\vnd_data"
+
+
+def load_vnd(path=VND_DATA_PATH):
+    """ Import get_vnd_data from path """
+    if path not in sys.path:
+        sys.path.append(path)
+    import get_vnd_data
+
+
+    return get_vnd_data
+
+
+@functools.lru_cache(maxsize=None)
+def vnd_function(name: str, path=VND_DATA_PATH):
+    """ A statement function of get_vnd_data, which imports the module when it is first called
+    ================================================================
+    get_vnd_data and its HTTP client are only imported when a statement is really requested,
+    so the runs served from vnd_cache and the worker processes of s5_ranking_all.py never load them.
+    The same function is returned for the same name, e.g. to group the items of a statement.
+
+        items=[(vnd_fetch.vnd_function('get_balance_sheet'), 411920, 'CededReserves')]
+
+    Parameters:
+        name: str
+            e.g. 'get_balance_sheet', 'get_income_statement'
+        path: str
+            Folder of get_vnd_data. Defaults to VND_DATA_PATH
+    """
+    def fetch(symbol):
+        return getattr(load_vnd(path), name)(symbol)
+
+    # The cache file of a statement is named after its function (see vnd_cache.cached_fetch_items)
+    fetch.__name__ = name
+
+
+    return fetch
+
+
+def fetch_with_retry(fetch, symbol: str, retries=3, backoff=1.0):
+    """ Call fetch(symbol), retrying with exponential backoff when it raises
+    ================================================================
+    Every wait is drawn at random between 0.5 and 1.5 times its backoff, so the symbols
+    failing together (e.g. on a rate limit) do not all retry at the same moment.
+
+    Parameters:
+        fetch: callable
+            e.g. vnd.get_balance_sheet, vnd.get_income_statement
+        symbol: str
+        retries: int
+            Number of retries after the first attempt. Defaults to 3
+        backoff: float
+            Mean seconds to wait before the first retry, doubled on every retry. Defaults to 1.0
+    """
+    for attempt in range(retries + 1):
+        try:
+            return fetch(symbol)
+        except Exception:
+            if attempt == retries:
+                raise
+            time.sleep(backoff * 2**attempt * random.uniform(0.5, 1.5))
+
+
+def extract_item(statement: pd.DataFrame, item_code: int, column: str) -> pd.DataFrame:
+    """ Get one line item of a VND statement as Symbol, Year, Quarter and its value
+    ================================================================
+    Parameters:
+        statement: pd.DataFrame
+            Statement as returned by get_vnd_data (code, fiscalDate, itemCode, numericValue, ...)
+        item_code: int
+            e.g. 411920 (Ceded Reserves), 21001 (Net Revenues), 700053 (Provision for losses)
+        column: str
+            Name given to numericValue
+    """
+    df_i = statement.loc[statement['itemCode'] == item_code, ['code', 'fiscalDate', 'numericValue']]
+    fiscal_date = pd.to_datetime(df_i['fiscalDate'])
+
+    df_i = pd.DataFrame({
+        'Symbol': df_i['code'],
+        'Year': fiscal_date.dt.year,
+        'Quarter': fiscal_date.dt.quarter,
+        column: df_i['numericValue'],
+    })
+
+
+    return df_i
+
+
+def fetch_items(symbols, items: list, max_workers=8, retries=3, backoff=1.0, verbose=True) -> dict:
+    """ Fetch line items of external statements for many symbols concurrently
+    ================================================================
+    Every (statement, symbol) pair is requested once, even when several items
+    come from the same statement, and requests run in a bounded thread pool.
+
+    Parameters:
+        symbols: list
+        items: list of tuple (fetch, item_code, column)
+            fetch: callable taking a symbol and returning a statement DataFrame
+            e.g. [(vnd.get_balance_sheet, 411920, 'CededReserves'),
+                  (vnd.get_income_statement, 21001, 'Revenues')]
+        max_workers: int
+            Maximum number of requests in flight. Defaults to 8
+        retries: int
+        backoff: float
+            See fetch_with_retry
+        verbose: bool
+            Print every symbol when its statement arrives
+    Returns:
+        dict: column -> pd.DataFrame with Symbol, Year, Quarter, column
+            Rows follow the order of symbols.
+    """
+    symbols = list(symbols)
+    fetchers = list(dict.fromkeys(fetch for fetch, _, _ in items))
+    statements = {}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(fetch_with_retry, fetch, symbol, retries, backoff): (fetch, symbol)
+            for fetch in fetchers
+            for symbol in symbols
+        }
+        for future in as_completed(futures):
+            fetch, symbol = futures[future]
+            statements[(fetch, symbol)] = future.result()
+            if verbose:
+                print(f"Stock: {symbol} ({getattr(fetch, '__name__', 'fetch')})")
+
+    result = {}
+    for fetch, item_code, column in items:
+        frames = [extract_item(statements[(fetch, symbol)], item_code, column) for symbol in symbols]
+        result[column] = pd.concat(frames, ignore_index=True)
+
+
+    return result
+
+
+if __name__ == '__main__':
+    print("Hello World")
@@ -0,0 +1,43 @@
+import numpy as np
+import pandas as pd
+
+from src import cache_io
+
+
+def test_to_compact_dtypes_drops_rows_without_keys_and_makes_values_float():
+    data = pd.DataFrame({
+        'Symbol': ['SSI', 'VND', None, 'HCM'],
+        'Year': [2023.0, 2023.0, 2023.0, np.nan],
+        'Quarter': [1, 2, 3, 4],
+        'Revenues': [1, 2, 3, 4],
+        'Expenses': ['1.5', '2.5', '3.5', '4.5'],
+        'CompanyType': ['CK', 'CK', 'BH', 'BH'],
+    })
+
+    compact = cache_io.to_compact_dtypes(data)
+
+    assert compact['Symbol'].tolist() == ['SSI', 'VND']
+    assert isinstance(compact['Symbol'].dtype, pd.CategoricalDtype)
+    assert compact['Year'].dtype == 'int16'
+    assert compact['Quarter'].dtype == 'int8'
+    assert compact['Revenues'].dtype == 'float64'
+    assert compact['Expenses'].tolist() == [1.5, 2.5]
+    assert isinstance(compact['CompanyType'].dtype, pd.CategoricalDtype)
+    assert cache_io.to_compact_dtypes(data, value_dtype='float32')['Revenues'].dtype == 'float32'
+
+
+def test_write_table_chunks_with_text_columns(tmp_path):
+    chunks = [
+        pd.DataFrame({'Symbol': ['SSI', 'VND'], 'Year': 2023, 'Quarter': [1, 1], 'Kind': ['CK', 'CK'], 'Revenues': [1.0, 2.0]}),
+        pd.DataFrame({'Symbol': ['BVH', 'SSI'], 'Year': 2023, 'Quarter': [2, 2], 'Kind': ['BH', None], 'Revenues': [3, 4]}),
+    ]
+
+    for fmt in ('feather', 'parquet'):
+        path, rows = cache_io.write_table_chunks(iter(chunks), 'is_test', str(tmp_path), fmt=fmt)
+        data = cache_io.read_table('is_test', str(tmp_path), fmt=fmt)
+
+        assert rows == 4
+        assert data['Symbol'].tolist() == ['SSI', 'VND', 'BVH', 'SSI']
+        assert data['Kind'].tolist()[:3] == ['CK', 'CK', 'BH'] and pd.isna(data['Kind'].iloc[3])
+        assert isinstance(data['Kind'].dtype, pd.CategoricalDtype)
+        assert data['Revenues'].tolist() == [1.0, 2.0, 3.0, 4.0]
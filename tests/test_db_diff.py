@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+
+from src import db_diff
+from src import panel
+
+
+def result() -> pd.DataFrame:
+    """ Typed result rows, as the ranking returns them """
+    return pd.DataFrame({
+        'Symbol': ['SSI', 'SSI', 'VND'],
+        'Year': pd.Series([2023, 2023, 2023], dtype='int16'),
+        'Quarter': pd.Series([1, 2, 1], dtype='int8'),
+        'score_profit': [1.33, 0.1 + 0.2, np.nan],
+        'rank_profit': ['C', 'D', 'A'],
+    })
+
+
+def stored(data: pd.DataFrame, update: str) -> pd.DataFrame:
+    """ The same rows as read back from the table: text, with their Update day """
+    return panel.to_db_strings(data).assign(Update=update)
+
+
+def diff(data, existing) -> dict:
+    # The columns compared by pipeline.save_result: every column after the keys
+    return db_diff.diff_rows(data, existing, value_columns=data.columns[3:].to_list())
+
+
+def test_unchanged_rows_need_no_write():
+    data = result()
+    changes = diff(data, stored(data, "20230701"))
+
+    # 0.1 + 0.2 and NaN are compared through the text they are stored as
+    assert changes['unchanged'] == 3
+    assert changes['insert'].empty and changes['update'].empty
+
+
+def test_new_key_and_changed_value():
+    data = result()
+    existing = stored(data.iloc[:2], "20230701")
+    existing.loc[1, 'score_profit'] = '0.3'
+
+    changes = diff(data, existing)
+
+    assert changes['insert'][['Symbol', 'Quarter']].values.tolist() == [['VND', 1]]
+    assert changes['update'][['Symbol', 'Quarter']].values.tolist() == [['SSI', 2]]
+    assert changes['unchanged'] == 1
+
+
+def test_update_day_alone_is_not_a_change():
+    data = result()
+    existing = stored(data, "20230701")
+    existing.loc[0, 'Update'] = "20240101"
+
+    assert diff(data, existing)['unchanged'] == 3
+
+
+def test_key_stored_twice_with_different_values_is_updated():
+    data = result()
+    existing = stored(data, "20230701")
+    duplicate = existing.iloc[[0]].assign(rank_profit='B')
+
+    changes = diff(data, pd.concat([existing, duplicate], ignore_index=True))
+
+    assert changes['update'][['Symbol', 'Quarter']].values.tolist() == [['SSI', 1]]
+    assert changes['unchanged'] == 2
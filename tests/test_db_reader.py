@@ -0,0 +1,43 @@
+import sqlite3
+
+import pandas as pd
+
+from src import db_reader
+
+
+def connect() -> sqlite3.Connection:
+    conn = sqlite3.connect(":memory:")
+    data = pd.DataFrame(
+        [(s, y, q, y + q/10) for s in ('SSI', 'VND', 'BVH') for y in (2021, 2022, 2023) for q in (1, 2, 3, 4)],
+        columns=['Symbol', 'Year', 'Quarter', 'score']
+    )
+    data.to_sql('scores', conn, index=False)
+
+    return conn
+
+
+def test_read_table_filters_symbols_and_periods():
+    data = db_reader.read_table(
+        connect(), 'scores', columns=['Symbol', 'Year', 'Quarter'], symbols=['SSI', 'BVH', 'SSI'],
+        period_from=(2021, 3), period_to=(2022, 2), chunk_size=1
+    )
+
+    periods = [(2021, 3), (2021, 4), (2022, 1), (2022, 2)]
+    assert sorted(data.itertuples(index=False, name=None)) == sorted((s, y, q) for s in ('SSI', 'BVH') for y, q in periods)
+
+
+def test_read_table_without_symbols_does_not_query():
+    conn = connect()
+    conn.close()
+
+    data = db_reader.read_table(conn, 'scores', columns=['Symbol', 'score'], symbols=[], period_from=(2022, 1))
+
+    assert data.empty
+    assert data.columns.tolist() == ['Symbol', 'score']
+
+
+def test_read_table_without_symbols_and_columns_reads_the_column_names():
+    data = db_reader.read_table(connect(), 'scores', symbols=[])
+
+    assert data.empty
+    assert data.columns.tolist() == ['Symbol', 'Year', 'Quarter', 'score']
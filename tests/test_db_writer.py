@@ -0,0 +1,81 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from src import db_writer
+
+
+COLUMNS = ['Symbol', 'Year', 'Quarter', 'score', 'Update']
+
+
+def connect() -> sqlite3.Connection:
+    conn = sqlite3.connect(":memory:")
+    conn.execute(
+        "CREATE TABLE scores (Symbol TEXT, Year TEXT, Quarter TEXT, score TEXT, [Update] TEXT, "
+        "PRIMARY KEY (Symbol, Year, Quarter))"
+    )
+    conn.commit()
+
+    return conn
+
+
+def rows(symbols, score, now="20240101") -> pd.DataFrame:
+    return pd.DataFrame({
+        'Symbol': symbols,
+        'Year': '2023',
+        'Quarter': '4',
+        'score': score,
+        'Update': now,
+    })
+
+
+def read(conn) -> list:
+    return conn.execute("SELECT Symbol, score, [Update] FROM scores ORDER BY Symbol").fetchall()
+
+
+def test_write_changes_inserts_and_updates():
+    conn = connect()
+    counts = db_writer.write_changes(
+        conn, 'scores',
+        {'insert': rows(['AAA', 'BBB'], '1.0'), 'update': rows([], []), 'unchanged': 0},
+        columns=COLUMNS
+    )
+    assert counts == {'inserted': 2, 'updated': 0, 'unchanged': 0}
+
+    counts = db_writer.write_changes(
+        conn, 'scores',
+        {'insert': rows(['CCC'], '3.0', "20240102"), 'update': rows(['AAA'], '2.0', "20240102"), 'unchanged': 1},
+        columns=COLUMNS
+    )
+    assert counts == {'inserted': 1, 'updated': 1, 'unchanged': 1}
+    assert read(conn) == [
+        ('AAA', '2.0', '20240102'),
+        ('BBB', '1.0', '20240101'),
+        ('CCC', '3.0', '20240102'),
+    ]
+
+
+def test_write_changes_rolls_back_the_failed_batch():
+    conn = connect()
+    db_writer.write_changes(
+        conn, 'scores',
+        {'insert': rows(['AAA'], '1.0'), 'update': rows([], []), 'unchanged': 0},
+        columns=COLUMNS
+    )
+
+    # The second batch holds a key which is already in the table
+    with pytest.raises(sqlite3.IntegrityError):
+        db_writer.write_changes(
+            conn, 'scores',
+            {'insert': rows(['BBB', 'CCC', 'DDD', 'AAA'], '2.0'), 'update': rows([], []), 'unchanged': 0},
+            columns=COLUMNS,
+            batch_size=2
+        )
+
+    # The first batch is committed, nothing of the failed one is left
+    assert read(conn) == [
+        ('AAA', '1.0', '20240101'),
+        ('BBB', '2.0', '20240101'),
+        ('CCC', '2.0', '20240101'),
+    ]
@@ -0,0 +1,31 @@
+import pandas as pd
+
+from src import dirty_periods
+
+
+def statement() -> pd.DataFrame:
+    return pd.DataFrame({
+        'Symbol': pd.Categorical(['SSI', 'VND', 'SSI', 'VND']),
+        'Year': pd.Series([2023, 2023, 2023, 2023], dtype='int16'),
+        'Quarter': pd.Series([1, 1, 2, 2], dtype='int8'),
+        'Revenues': [1.0, 2.0, 3.0, 4.0],
+    })
+
+
+def test_period_hashes_ignore_the_order_of_the_rows():
+    data = statement()
+    shuffled = data.iloc[[3, 1, 0, 2]]
+    shuffled = shuffled.assign(Symbol=shuffled['Symbol'].cat.reorder_categories(['VND', 'SSI']))
+
+    assert dirty_periods.period_hashes([data]) == dirty_periods.period_hashes([shuffled])
+    assert list(dirty_periods.period_hashes([data])) == ['2023-1', '2023-2']
+
+
+def test_changed_period_is_dirty():
+    data = statement()
+    hashes = dirty_periods.period_hashes([data, data])
+    changed = data.assign(Revenues=[1.0, 2.0, 3.0, 4.5])
+
+    assert dirty_periods.dirty_periods(dirty_periods.period_hashes([data, changed]), hashes) == [(2023, 2)]
+    # The same rows in another frame are another input
+    assert dirty_periods.period_hashes([data, data.iloc[:2]]) != hashes
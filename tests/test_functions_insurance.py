@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+
+from src import functions_insurance as fi
+
+
+def old_score(panel_data: pd.DataFrame, metric: str) -> list:
+    """ Scores of the earlier loop: quantiles merged on Year, Quarter and compared row by row """
+    quantiles = panel_data.groupby(['Year', 'Quarter'])[metric].quantile([0.25, 0.50, 0.75]).unstack()
+    scores = []
+    for _, items in panel_data.iterrows():
+        key = (items['Year'], items['Quarter'])
+        cuts = quantiles.loc[key].to_list() if key in quantiles.index else [np.nan]*3
+        if items[metric] < cuts[0]:
+            scores.append(4)
+        elif items[metric] < cuts[1]:
+            scores.append(3)
+        elif items[metric] < cuts[2]:
+            scores.append(2)
+        else:
+            scores.append(1)
+
+    return scores
+
+
+def test_quantile_bucket_score_follows_the_old_rules():
+    rng = np.random.default_rng(0)
+    data = pd.DataFrame({
+        'Symbol': [f"S{i}" for i in range(24)],
+        'Year': np.repeat([2022.0, 2023.0], 12),
+        'Quarter': np.tile(np.repeat([1.0, 2.0, 3.0], 4), 2),
+        'npw_to_equity': rng.normal(1, 0.5, 24).round(1),
+    })
+    # Values on a cut point, a missing value, an infinite ratio and a row without a period
+    data.loc[[0, 1], 'npw_to_equity'] = 1.0
+    data.loc[2, 'npw_to_equity'] = np.nan
+    data.loc[5, 'npw_to_equity'] = np.inf
+    data.loc[9, 'Year'] = np.nan
+
+    scored = fi.npw_to_equity_score(data)
+
+    assert scored['score_npw2equity'].to_list() == old_score(data, 'npw_to_equity')
+    assert scored.loc[[2, 9], 'score_npw2equity'].to_list() == [1, 1]
+    assert 'score_npw2equity' not in data.columns
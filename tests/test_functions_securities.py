@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+
+from src import functions_securities as fs
+
+
+def old_score_lte(panel_data: pd.DataFrame) -> list:
+    """ Scores of the earlier loop over the rows """
+    scores = []
+    for _, item in panel_data.iterrows():
+        if item['lte'] >= item['lte_8q']*1.6:
+            scores.append(0)
+        elif item['lte'] >= item['lte_8q']*1.3:
+            scores.append(0.5)
+        elif item['lte'] >= item['lte_8q']*0.7:
+            scores.append(1)
+        else:
+            scores.append(0)
+
+    return scores
+
+
+def old_score_below_median(panel_data: pd.DataFrame, column: str) -> list:
+    """ Scores of the earlier loop: median merged on Year, Quarter and compared row by row """
+    median = panel_data.groupby(['Year', 'Quarter'])[column].median()
+    scores = []
+    for _, item in panel_data.iterrows():
+        if item[column] > median[(item['Year'], item['Quarter'])]:
+            scores.append(0)
+        elif item[column] == median[(item['Year'], item['Quarter'])]:
+            scores.append(0.5)
+        else:
+            scores.append(1)
+
+    return scores
+
+
+def old_top_share(dictionary: dict, percent_sales: float) -> int:
+    """ Number of top lines of the earlier version, one row at a time """
+    df1 = pd.DataFrame.from_dict(data=dictionary, orient='index')
+    df1.sort_values(by=[0], ascending=False, inplace=True)
+    df1['position_score'] = np.where(df1[0].cumsum() >= percent_sales, 1, 0)
+
+    return df1.loc[df1['position_score'] == 0].count()['position_score']
+
+
+def test_score_lte_follows_the_old_loop():
+    data = pd.DataFrame({
+        'lte_8q': [1.0, 1.0, 1.0, 1.0, 2.0, 2.0, 1.0, np.nan, 1.0, -1.0, 0.0],
+        'lte': [1.6, 1.59, 1.3, 0.7, 2.6, 1.4, 0.69, 1.0, np.nan, -1.0, 0.0],
+    })
+
+    scores = fs.score_lte(data.copy())['score_lte']
+
+    assert scores.tolist() == old_score_lte(data)
+    assert scores.tolist()[:4] == [0.0, 0.5, 0.5, 1.0]
+
+
+def test_score_below_median_follows_the_old_loop():
+    data = pd.DataFrame({
+        'Year': [2023]*7,
+        'Quarter': [1, 1, 1, 2, 2, 2, 2],
+        'debt_to_equity': [1.0, 2.0, 3.0, 1.0, 1.0, np.nan, 5.0],
+    })
+
+    scored = fs.score_dte(data.copy())
+
+    assert scored['score_dte'].tolist() == old_score_below_median(data, 'debt_to_equity')
+    assert scored['score_dte'].tolist() == [1.0, 0.5, 0.0, 0.5, 0.5, 1.0, 0.0]
+
+
+def test_share_scores_follow_the_old_loop():
+    shares = pd.DataFrame([
+        [0.9, 0.05, 0.05],
+        [0.5, 0.3, 0.2],
+        [0.4, 0.4, 0.2],
+        [0.3, 0.3, 0.2],
+        [0.5, np.nan, 0.2],
+        [np.nan, np.nan, np.nan],
+        [0.8, 0.1, 0.1],
+    ], columns=['A_%', 'B_%', 'C_%'])
+
+    counts = fs.top_share_matrix(shares, percent_sales=0.8)
+
+    assert counts.tolist() == [old_top_share(row.to_dict(), 0.8) for _, row in shares.iterrows()]
+    assert fs.score_share_array(np.arange(5)).tolist() == [fs.score_share(i) for i in range(5)]
+    assert fs.diversified_sales_score(shares.copy(), ['A_%', 'B_%', 'C_%'])['score_diversified_sale'].tolist() == [
+        fs.score_share(i) for i in counts
+    ]
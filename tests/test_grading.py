@@ -0,0 +1,30 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src import grading
+
+
+def test_grade_below_on_the_thresholds():
+    scores = pd.Series([0, 0.99, 1, 1.5, 2, 2.99, 3, 4, np.nan])
+
+    assert grading.grade_below(scores).tolist() == ['D', 'D', 'C', 'C', 'B', 'B', 'A', 'A', 'A']
+
+
+def test_grade_above_on_the_thresholds():
+    scores = pd.Series([4, 3.01, 3, 2.01, 2, 1.01, 1, 0, np.nan])
+
+    assert grading.grade_above(scores).tolist() == [
+        'Safe +', 'Safe +', 'Safe', 'Safe', 'Warning', 'Warning', 'Danger', 'Danger', 'Danger'
+    ]
+
+
+def test_rank_columns_and_labels():
+    data = pd.DataFrame({'score_profit': [0.5, 2.5], 'score_health': [3.5, 1.0]})
+
+    data = grading.rank_health(grading.rank_letter(data, 'score_profit', 'rank_profit'))
+    assert data['rank_profit'].tolist() == ['D', 'B']
+    assert data['rank_health'].tolist() == ['Safe +', 'Danger']
+
+    with pytest.raises(ValueError):
+        grading.grade_below([1.0], thresholds=(1, 2), labels=('B', 'A'))
@@ -0,0 +1,51 @@
+import pandas as pd
+import pytest
+
+from src import dirty_periods
+from src import ranking_insurance
+from src import ranking_securities
+from src import synthetic_panel
+
+
+SECTORS = {
+    'insurance': (ranking_insurance, synthetic_panel.insurance_inputs, ['NetIncome2', 'Expenses']),
+    'securities': (ranking_securities, synthetic_panel.securities_inputs, ['NetIncome2', 'FVTPL']),
+}
+
+
+def scores(results: list, periods) -> dict:
+    """ Rows of every result table in the given periods, in a comparable order """
+    return {
+        i['table']: dirty_periods.select_periods(i['data'], periods)
+        .sort_values(by=['Symbol', 'Year', 'Quarter']).reset_index(drop=True)
+        for i in results
+    }
+
+
+@pytest.mark.parametrize('sector', SECTORS)
+def test_restated_quarter_scored_incrementally_equals_full_run(sector, tmp_path):
+    module, make_inputs, columns = SECTORS[sector]
+    inputs = make_inputs(n_symbols=6, n_quarters=24)
+    state_dir = str(tmp_path / "state")
+    module.rank(**inputs, state_dir=state_dir)
+    hashes = dirty_periods.period_hashes([i for i in inputs.values()])
+
+    # One symbol restated five quarters before its last one
+    df_is = inputs['df_is'].copy()
+    period = df_is['Year']*4 + df_is['Quarter']
+    symbol = df_is['Symbol'].iloc[0]
+    restated = (df_is['Symbol'] == symbol) & (period == period[df_is['Symbol'] == symbol].max() - 5)
+    df_is.loc[restated, columns] = df_is.loc[restated, columns]*1.7 + 1e9
+    inputs['df_is'] = df_is
+
+    periods = dirty_periods.dirty_periods(
+        dirty_periods.period_hashes([i for i in inputs.values()]), hashes, lookback=module.LOOKBACK
+    )
+    assert periods[0] == tuple(df_is.loc[restated, ['Year', 'Quarter']].iloc[0])
+
+    incremental = scores(module.rank(**inputs, state_dir=state_dir, periods=periods), periods)
+    full = scores(module.rank(**inputs, state_dir=str(tmp_path / "full"), rebuild_state=True), periods)
+
+    assert list(incremental) == list(full)
+    for table in full:
+        pd.testing.assert_frame_equal(incremental[table], full[table], check_exact=True)
@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+
+from src import panel
+
+
+def statements() -> tuple:
+    """ Two panels with symbols and periods on one side only, and a key twice on each side """
+    left = pd.DataFrame({
+        'Symbol': ['VND', 'SSI', 'SSI', 'SSI', 'HCM', 'VND'],
+        'Year': [2023, 2022, 2023, 2023, 2023, 2023],
+        'Quarter': [1, 4, 1, 2, 1, 1],
+        'Equity': [1.0, 2.0, 3.0, 4.0, 5.0, 6.0],
+    })
+    right = pd.DataFrame({
+        'Symbol': ['SSI', 'SSI', 'VND', 'VND', 'MBS'],
+        'Year': [2023, 2023, 2023, 2023, 2023],
+        'Quarter': [1, 2, 1, 1, 1],
+        'NetIncome': [10.0, np.nan, 30.0, 40.0, 50.0],
+    })
+
+    return panel.compact(left), panel.compact(right)
+
+
+def as_merged(data: pd.DataFrame) -> pd.DataFrame:
+    """ Rows in a comparable order, without the index """
+    data = data.assign(Symbol=data['Symbol'].astype(str), Year=data['Year'].astype(int), Quarter=data['Quarter'].astype(int))
+
+    return data.sort_values(by=list(data.columns)).reset_index(drop=True)
+
+
+def test_join_equals_merge():
+    left, right = statements()
+
+    for how in ('left', 'inner'):
+        joined = panel.join(left, right, how=how)
+        merged = left.merge(right, how=how, on=['Symbol', 'Year', 'Quarter'])
+
+        pd.testing.assert_frame_equal(as_merged(joined), as_merged(merged))
+        assert list(joined.index.names) == panel.INDEX_NAMES
+        assert joined.index.is_monotonic_increasing
+
+    # VND 2023Q1 is twice on both sides: four rows, as with merge
+    assert len(panel.join(left, right)) == 2 + 4
+
+
+def test_join_of_indexed_panels_keeps_the_index():
+    left, right = statements()
+    indexed = panel.index_panel(left)
+
+    assert panel.index_panel(indexed) is indexed
+    pd.testing.assert_frame_equal(panel.join(indexed, right, how='left'), panel.join(left, right, how='left'))
@@ -0,0 +1,97 @@
+import numpy as np
+import pandas as pd
+
+from src import rolling_state
+
+
+def statements(n_symbols=6, n_periods=20, seed=0) -> pd.DataFrame:
+    """ Quarters of several symbols with different histories, decimals and missing values """
+    rng = np.random.default_rng(seed)
+    rows = []
+    for k in range(n_symbols):
+        first = 2015*4 + int(rng.integers(0, 6))
+        for period in range(first, first + n_periods - int(rng.integers(0, 6))):
+            rows.append((f"S{k}", period//4, period % 4 + 1))
+    data = pd.DataFrame(rows, columns=['Symbol', 'Year', 'Quarter'])
+    data['Value'] = rng.normal(0, 1e6, len(data)).round(3)
+    data.loc[rng.random(len(data)) < 0.05, 'Value'] = np.nan
+
+
+    return data.sort_values(by=['Symbol', 'Year', 'Quarter'], ignore_index=True)
+
+
+def test_incremental_equals_rebuild(tmp_path):
+    data = statements()
+    period = data['Year']*4 + data['Quarter']
+    cuts = [period.min() + 5, period.min() + 9, period.max() - 2, period.max()]
+
+    # Appended over several runs, some of them with new symbols only
+    for cut in cuts:
+        incremental = rolling_state.rolling_stats(
+            data.loc[period <= cut], 'Value', 4, stats=rolling_state.STATS, state_dir=str(tmp_path / "runs"), name='test'
+        )
+
+    rebuilt = rolling_state.rolling_stats(
+        data, 'Value', 4, stats=rolling_state.STATS, state_dir=str(tmp_path / "full"), name='test', rebuild=True
+    )
+
+    pd.testing.assert_frame_equal(incremental, rebuilt, check_exact=True)
+
+
+def test_restated_quarters_equal_rebuild(tmp_path):
+    data = statements(seed=2)
+    period = data['Year']*4 + data['Quarter']
+    state_dir = str(tmp_path / "runs")
+    rolling_state.rolling_stats(data, 'Value', 4, stats=rolling_state.STATS, state_dir=state_dir, name='test')
+
+    # A value restated five quarters back, a quarter removed and a quarter inserted in the past
+    restated = data.copy()
+    restated.loc[(restated['Symbol'] == 'S0') & (period == period.loc[data['Symbol'] == 'S0'].max() - 5), 'Value'] = 123.0
+    restated = restated.drop(index=data.index[(data['Symbol'] == 'S1') & (period == period.loc[data['Symbol'] == 'S1'].min() + 3)])
+    earlier = data.loc[data['Symbol'] == 'S2'].iloc[[0]]
+    earlier = earlier.assign(Year=(earlier['Year']*4 + earlier['Quarter'] - 2)//4, Quarter=(earlier['Quarter'] - 2) % 4 + 1)
+    restated = pd.concat([earlier, restated]).sort_values(by=['Symbol', 'Year', 'Quarter'], ignore_index=True)
+
+    def changed():
+        state, saved = rolling_state.load_state(state_dir, 'test', 4)
+
+        return set(rolling_state.changed_symbols(
+            state, saved, restated['Symbol'].to_numpy(dtype=object),
+            (restated['Year']*4 + restated['Quarter']).to_numpy(dtype='int64'), restated['Value'].to_numpy(dtype=float)
+        ))
+
+    assert changed() == {'S0', 'S1', 'S2'}
+    incremental = rolling_state.rolling_stats(restated, 'Value', 4, stats=rolling_state.STATS, state_dir=state_dir, name='test')
+    rebuilt = rolling_state.rolling_stats(
+        restated, 'Value', 4, stats=rolling_state.STATS, state_dir=str(tmp_path / "full"), name='test', rebuild=True
+    )
+    pd.testing.assert_frame_equal(incremental, rebuilt, check_exact=True)
+
+    # The next run reads the rewritten statistics and finds nothing changed
+    assert changed() == set()
+    again = rolling_state.rolling_stats(restated, 'Value', 4, stats=rolling_state.STATS, state_dir=state_dir, name='test')
+    pd.testing.assert_frame_equal(again, rebuilt, check_exact=True)
+
+
+def test_rolling_stats_follow_pandas(tmp_path):
+    data = statements(seed=1)
+
+    with_state = rolling_state.rolling_stats(data, 'Value', 8, stats=rolling_state.STATS, state_dir=str(tmp_path), name='test')
+    without_state = rolling_state.rolling_stats(data, 'Value', 8, stats=rolling_state.STATS)
+
+    pd.testing.assert_frame_equal(with_state, without_state, check_exact=False, rtol=1e-12, atol=1e-6)
+    assert with_state['std'].notna().sum() > len(data)//3
+
+
+def test_only_the_new_rows_are_appended(tmp_path):
+    data = statements(n_symbols=3)
+    period = data['Year']*4 + data['Quarter']
+    rolling_state.rolling_stats(data.loc[period < period.max()], 'Value', 4, state_dir=str(tmp_path), name='test')
+
+    state, saved = rolling_state.load_state(str(tmp_path), 'test', 4)
+    new = period.to_numpy() > state.watermark(data['Symbol'].to_numpy(dtype=object))
+    rolling_state.rolling_stats(data, 'Value', 4, state_dir=str(tmp_path), name='test')
+
+    parts = sorted((tmp_path / "test_4q_stats").glob("part-*.parquet"))
+    assert len(parts) == 2
+    assert len(pd.read_parquet(parts[-1])) == new.sum()
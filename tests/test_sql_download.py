@@ -0,0 +1,37 @@
+import pandas as pd
+
+from src import sql_download
+
+
+def test_incremental_query_drops_the_final_order_by():
+    query = """
+        SELECT Symbol, Year, Quarter, Revenues
+        FROM (SELECT TOP 10 * FROM statements ORDER BY Year) AS s
+        order by Symbol, Year, Quarter;
+    """
+
+    sql, params = sql_download.incremental_query(query, {"Year": 2023, "Quarter": 2}, lookback=4)
+
+    assert sql.startswith("SELECT * FROM (SELECT Symbol, Year, Quarter, Revenues")
+    assert "ORDER BY Year) AS s) AS q WHERE" in sql
+    assert "order by Symbol" not in sql
+    assert params == [2023*4 + 2 - 4]
+
+
+def test_incremental_query_downloads_modified_rows_with_update_column():
+    mark = {"Year": 2023, "Quarter": 2, "Update": "2023-09-01 00:00:00"}
+
+    sql, params = sql_download.incremental_query("SELECT * FROM statements", mark, update_column='ModifiedDate')
+
+    assert sql.endswith("WHERE q.[Year]*4 + q.[Quarter] >= %s OR q.[ModifiedDate] > %s")
+    assert params == [2023*4 + 1, "2023-09-01 00:00:00"]
+
+
+def test_merge_delta_replaces_the_downloaded_quarters():
+    cached = pd.DataFrame({'Symbol': ['SSI', 'SSI'], 'Year': [2023, 2023], 'Quarter': [1, 2], 'Revenues': [1.0, 2.0]})
+    delta = pd.DataFrame({'Symbol': ['SSI', 'SSI'], 'Year': [2023, 2023], 'Quarter': [2, 3], 'Revenues': [2.5, 3.0]})
+
+    merged = sql_download.merge_delta(cached, delta)
+
+    assert merged['Quarter'].tolist() == [1, 2, 3]
+    assert merged['Revenues'].tolist() == [1.0, 2.5, 3.0]
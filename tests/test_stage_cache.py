@@ -0,0 +1,77 @@
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from src import instrument
+from src import stage_cache
+
+
+def statement() -> pd.DataFrame:
+    return pd.DataFrame({
+        'Symbol': pd.Categorical(['SSI', 'VND']),
+        'Year': pd.Series([2023, 2023], dtype='int16'),
+        'Revenues': [1.0, 2.0],
+    })
+
+
+def test_fingerprint_follows_values_dtypes_index_and_parameters():
+    data = statement()
+    key = stage_cache.fingerprint('stage', {'data': data, 'window': 4})
+
+    assert stage_cache.fingerprint('stage', {'data': data.copy(), 'window': 4}) == key
+    assert stage_cache.fingerprint('stage', {'data': data, 'window': 8}) != key
+    assert stage_cache.fingerprint('stage', {'data': data.assign(Revenues=[1.0, 2.5]), 'window': 4}) != key
+    assert stage_cache.fingerprint('stage', {'data': data.astype({'Revenues': 'float32'}), 'window': 4}) != key
+    assert stage_cache.fingerprint('stage', {'data': data.set_axis([5, 6]), 'window': 4}) != key
+    assert stage_cache.fingerprint('stage', {'data': data.rename(columns={'Revenues': 'Sales'}), 'window': 4}) != key
+
+    # NaN with the sign bit set (-nan, e.g. 0/0) and the NaN read back from Parquet
+    negative_nan = data.assign(Revenues=[-np.nan, 2.0])
+    assert np.signbit(negative_nan['Revenues'].iloc[0])
+    assert stage_cache.fingerprint('stage', {'data': negative_nan}) == stage_cache.fingerprint('stage', {'data': data.assign(Revenues=[np.nan, 2.0])})
+
+
+def test_run_serves_unchanged_inputs_from_the_cache(tmp_path):
+    cache = stage_cache.StageCache(str(tmp_path))
+    calls = []
+
+    def double(data):
+        calls.append(1)
+        return data.assign(Revenues=data['Revenues']*2)
+
+    first = cache.run('double', double, data=statement())
+    second = cache.run('double', double, data=statement())
+
+    assert len(calls) == 1
+    pd.testing.assert_frame_equal(first, second)
+
+
+def test_stages_with_a_state_follow_the_state(tmp_path):
+    cache = stage_cache.StageCache(str(tmp_path / "stages"))
+    state_dir = tmp_path / "state"
+    calls = []
+
+    def with_state(data, state_dir, rebuild_state=False):
+        calls.append(rebuild_state)
+        os.makedirs(state_dir, exist_ok=True)
+        if rebuild_state or not os.path.exists(os.path.join(state_dir, "state.txt")):
+            with open(os.path.join(state_dir, "state.txt"), mode="w") as fp:
+                fp.write(str(len(calls)))
+        return data
+
+    report = instrument.RunReport("test").start()
+    cache.run('stage', with_state, data=statement(), state_dir=str(state_dir))
+    cache.run('stage', with_state, data=statement(), state_dir=str(state_dir))
+    assert calls == [False]
+
+    # Asked to rebuild the state, or the state is gone
+    cache.run('stage', with_state, data=statement(), state_dir=str(state_dir), rebuild_state=True)
+    shutil.rmtree(state_dir)
+    cache.run('stage', with_state, data=statement(), state_dir=str(state_dir))
+    report.stop()
+
+    assert calls == [False, True, False]
+    assert os.path.exists(state_dir / "state.txt")
+    assert [i['cached'] for i in report.records] == [False, True, False, False]
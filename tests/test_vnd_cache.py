@@ -0,0 +1,51 @@
+import datetime as dt
+
+import pandas as pd
+
+from src import vnd_cache
+
+
+class Statement:
+    """ A statement function with rows for some symbols only, counting its calls """
+
+    __name__ = 'get_balance_sheet'
+
+    def __init__(self, item_code: int, symbols_with_rows: list):
+        self.item_code = item_code
+        self.symbols_with_rows = symbols_with_rows
+        self.calls = []
+
+    def __call__(self, symbol):
+        self.calls.append(symbol)
+        if symbol not in self.symbols_with_rows:
+            return pd.DataFrame(columns=['code', 'fiscalDate', 'itemCode', 'numericValue'])
+
+        return pd.DataFrame({
+            'code': symbol,
+            'fiscalDate': ['2023-03-31', '2023-06-30'],
+            'itemCode': self.item_code,
+            'numericValue': [1.0, 2.0],
+        })
+
+
+def test_symbols_without_rows_are_not_requested_again_within_the_ttl(tmp_path):
+    fetch = Statement(411920, symbols_with_rows=['SSI'])
+    items = [(fetch, 411920, 'CededReserves')]
+
+    first = vnd_cache.cached_fetch_items(['SSI', 'XYZ'], items, cache_dir=str(tmp_path), verbose=False)
+    second = vnd_cache.cached_fetch_items(['SSI', 'XYZ'], items, cache_dir=str(tmp_path), verbose=False)
+
+    assert sorted(fetch.calls) == ['SSI', 'XYZ']
+    pd.testing.assert_frame_equal(first['CededReserves'], second['CededReserves'])
+    assert second['CededReserves']['Symbol'].tolist() == ['SSI', 'SSI']
+
+
+def test_stale_symbols_follows_the_checked_at_marks():
+    now = dt.datetime(2024, 1, 10)
+    cache = vnd_cache.load_cache('missing.parquet')
+    checked = vnd_cache.mark_checked(vnd_cache.load_checked('missing.parquet'), ['SSI'], [411920], pd.Timestamp(now - dt.timedelta(hours=1)))
+    checked = vnd_cache.mark_checked(checked, ['XYZ'], [411920], pd.Timestamp(now - dt.timedelta(hours=48)))
+
+    stale = vnd_cache.stale_symbols(cache, ['SSI', 'XYZ', 'VND'], [411920], ttl_hours=24, now=now, checked=checked)
+
+    assert stale == ['XYZ', 'VND']
@@ -0,0 +1,75 @@
+import threading
+
+import pandas as pd
+import pytest
+
+from src import vnd_fetch
+
+
+class FlakyStatement:
+    """ A statement function failing `failures` times for every symbol before it answers """
+
+    def __init__(self, failures: int, item_code: int):
+        self.failures = failures
+        self.item_code = item_code
+        self.calls = {}
+        self.lock = threading.Lock()
+        self.__name__ = f"statement_{item_code}"
+
+    def __call__(self, symbol):
+        with self.lock:
+            self.calls[symbol] = self.calls.get(symbol, 0) + 1
+            calls = self.calls[symbol]
+        if calls <= self.failures:
+            raise ConnectionError(f"{symbol}: attempt {calls}")
+
+        return pd.DataFrame({
+            'code': symbol,
+            'fiscalDate': ['2023-03-31', '2023-06-30'],
+            'itemCode': self.item_code,
+            'numericValue': [1.0, 2.0],
+        })
+
+
+@pytest.fixture
+def sleeps(monkeypatch) -> list:
+    waits = []
+    monkeypatch.setattr(vnd_fetch.time, 'sleep', waits.append)
+
+    return waits
+
+
+def test_fetch_items_retries_and_keeps_the_symbol_order(sleeps):
+    symbols = ['SSI', 'VND', 'HCM', 'BSI', 'MBS']
+    balance_sheet = FlakyStatement(failures=2, item_code=411920)
+    income_statement = FlakyStatement(failures=0, item_code=21001)
+    items = [
+        (balance_sheet, 411920, 'CededReserves'),
+        (balance_sheet, 411920, 'CededReserves2'),
+        (income_statement, 21001, 'Revenues'),
+    ]
+
+    result = vnd_fetch.fetch_items(symbols, items, max_workers=3, retries=3, backoff=1.0, verbose=False)
+
+    # Two failures then an answer for every symbol; one call per symbol when nothing fails,
+    # although two items come from the balance sheet
+    assert balance_sheet.calls == {i: 3 for i in symbols}
+    assert income_statement.calls == {i: 1 for i in symbols}
+    assert len(sleeps) == 2*len(symbols)
+
+    for column in ('CededReserves', 'CededReserves2', 'Revenues'):
+        data = result[column]
+        assert data['Symbol'].tolist() == [i for i in symbols for _ in range(2)]
+        assert data['Quarter'].tolist() == [1, 2]*len(symbols)
+
+
+def test_fetch_with_retry_jitters_the_backoff_and_raises_at_the_end(sleeps):
+    fetch = FlakyStatement(failures=10, item_code=411920)
+
+    with pytest.raises(ConnectionError):
+        vnd_fetch.fetch_with_retry(fetch, 'SSI', retries=3, backoff=1.0)
+
+    assert fetch.calls == {'SSI': 4}
+    assert len(sleeps) == 3
+    for attempt, wait in enumerate(sleeps):
+        assert 0.5*2**attempt <= wait <= 1.5*2**attempt